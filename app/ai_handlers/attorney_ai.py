@@ -19,9 +19,15 @@ REAL_JUSO_API_KEY = os.environ.get("JUSO_API_KEY", "devU01TX0FVVEgyMDI1MTEyNDAxM
 BUILDING_API_KEY = os.environ.get("BUILDING_API_KEY", "283c37c89ec3aac9cd025a29d0b73c7d075be291b3ebe3b1b26de62794719038")
 BUILDING_API_URL = "https://apis.data.go.kr/1613000/BldRgstHubService/getBrTitleInfo"
 
-from app import schemas
+from app import crud, schemas
+from app.ai_handlers import fast_extract, model_router
+from app.ai_handlers.extraction_cache import extraction_cache
+from app.ai_handlers.extraction_prompt import PromptBook
+from app.knowledge import generate_answer, knowledge_base
+from app.llm_client import client
 
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# 이 핸들러가 담당하는 계약서 종류 (지식 베이스 네임스페이스로도 사용)
+CONTRACT_TYPE = "위임장"
 
 CONTRACT_SCENARIO=[
     {
@@ -134,43 +140,19 @@ TIP_LIST = [
 SIMILARITY_THRESHOLD = 0.6
 
 
-tip_embeddings: List[np.ndarray] = []
-tip_embeddings_lock = asyncio.Lock()
+# 팁은 공용 지식 베이스(app/knowledge)에 이 계약서 종류의 네임스페이스로 등록합니다.
+# 팁 문구를 수정했다면 `python -m app.knowledge build`로 인덱스를 다시 빌드하세요.
+knowledge_base.register(CONTRACT_TYPE, TIP_LIST)
 
-async def get_tip_embeddings():
-    global tip_embeddings
-    async with tip_embeddings_lock:
-        if not tip_embeddings:
-            resp = await client.embeddings.create(
-                model="text-embedding-3-small",
-                input=TIP_LIST
-            )
-            tip_embeddings = [np.array(d.embedding) for d in resp.data]
-    return tip_embeddings
-
-async def get_embedding(text: str):
-    resp = await client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return np.array(resp.data[0].embedding)
-
-async def find_top_relevant_tips(question: str, top_n=3):
-    embeddings = await get_tip_embeddings()
-    q_emb = await get_embedding(question)
-    sims = [np.dot(q_emb, t) for t in embeddings]
-
-    idx = np.argsort(sims)[-top_n:][::-1]
-    top_score = sims[idx[0]]
-    tips_str = "\n".join([TIP_LIST[i] for i in idx])
-    return tips_str, top_score
-
-async def get_rag_response(question: str, relevant_tips: str) -> str:
-    today = datetime.date.today()
-    current_date_str = today.strftime('%Y년 %m월 %d일')
+async def get_rag_response(question: str, relevant_tips: str, include_date: bool = True) -> str:
+    # FAQ 대표 답변(faq-build)은 include_date=False로 만들어 빌드한 날짜에 묶이지 않게 합니다.
+    date_line = ""
+    if include_date:
+        today = datetime.date.today()
+        current_date_str = today.strftime('%Y년 %m월 %d일')
+        date_line = f"오늘은 {current_date_str}입니다.\n"
     system_prompt = f"""
-오늘은 {current_date_str}입니다.
-당신은 근로기준 전문가입니다.
+{date_line}당신은 근로기준 전문가입니다.
 주어진 팁만을 기반으로 답변하세요.
 만약 질문에 대한 답변이 [참고 자료]에 명확히 나와있지 않다면,
        "죄송합니다. 현재 제공된 참고 자료에는 해당 정보가 포함되어 있지 않습니다."라고 솔직하게 답변하세요.
@@ -179,13 +161,7 @@ async def get_rag_response(question: str, relevant_tips: str) -> str:
         {relevant_tips}
         -----------------
     """
-    resp = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": system_prompt},
-                      {"role": "user", "content": question}],
-            temperature=0
-        )
-    return resp.choices[0].message.content.strip()
+    return await generate_answer(system_prompt, question, client)
 
 async def get_building_info(sigungu_cd, bjdong_cd, bun, ji):
     # 키 처리 (한 번 디코딩 시도)
@@ -308,16 +284,30 @@ async def get_property_text_by_address(address_query: str) -> str:
         print(f"❌ API 오류: {e}")
         return f"오류 발생: {address_query}"
     
-    # --- [AI] 스마트 추출기 ---
-async def get_smart_extraction(client: AsyncOpenAI, field_id: str, user_message: str, question: str) -> Dict:
-        today = datetime.date.today()
-        current_year = today.year
+# 형식이 정해진 필드는 LLM 호출 전에 규칙으로 먼저 추출합니다. (app/ai_handlers/fast_extract.py)
+FAST_RULES = {
+    "reg_cause_date": fast_extract.date_full,
+    "delegation_date": fast_extract.date_full,
+}
+
+# 처음부터 큰 모델로 추출할 필드 (나머지는 작은 모델 → 필요할 때만 큰 모델, model_router.py)
+MODEL_POLICY = {
+    # 주소 검색 API에 그대로 넣을 주소 문자열
+    "property_description_text": "large",
+    "*_address": "large",
+}
+
+def _build_extraction_prompt(field_id: str, question: str) -> str:
+        """
+        위임장 get_smart_extraction의 시스템 프롬프트 (규칙 + 예시, 주소 필드는 주소 규칙 추가).
+        날짜와 사용자 입력은 넣지 않습니다.
+        """
         json_format_example = '{"status": "success", "filled_fields": {"key": "value"}, "skip_next_n_questions": 0, "follow_up_question": null}'
         
         # 부동산 위임장 전용 프롬프트
         system_prompt = f"""
         당신은 사용자의 답변에서 부동산 등기 위임장 작성에 필요한 핵심 정보를 추출하는 AI입니다.
-        오늘은 {today.strftime('%Y년 %m월 %d일')}입니다.(현재 연도는 {current_year}년)
+        오늘 날짜는 사용자 메시지 첫 줄의 '오늘:'을 기준으로 합니다.
 
         [규칙]
         1. 사용자의 답변이 충분하면 'success', 부족하면 'clarify'와 되묻는 질문을 생성하세요.
@@ -328,9 +318,9 @@ async def get_smart_extraction(client: AsyncOpenAI, field_id: str, user_message:
 
         
         [예시]
-        Q: 등기 원인일은 언제인가요?
+        Q: 등기 원인일은 언제인가요? (오늘이 2025년 03월 07일일 때)
         A: 작년 12월 25일이요.
-        -> filled_fields: {{"{field_id}": "{current_year - 1}년 12월 25일"}}
+        -> filled_fields: {{"{field_id}": "2024년 12월 25일"}}
         
         Q: 지분은 어떻게 되나요?
         A: 반반입니다.
@@ -360,18 +350,36 @@ async def get_smart_extraction(client: AsyncOpenAI, field_id: str, user_message:
         A: 서울시 강남구 도곡동 타워팰리스 101동 200호요.
         -> filled_fields: {{"{field_id}": "서울시 강남구 도곡동 타워팰리스 101동 200호"}}
         """
+        return system_prompt
+
+
+# field_id별 시스템 프롬프트를 미리 만들어 둡니다. (프롬프트 캐시 적중용, extraction_prompt.py)
+EXTRACTION_PROMPTS = PromptBook(CONTRACT_TYPE, _build_extraction_prompt, CONTRACT_SCENARIO)
+
+
+    # --- [AI] 스마트 추출기 ---
+async def get_smart_extraction(client: AsyncOpenAI, field_id: str, user_message: str, question: str) -> Dict:
+        # 날짜는 규칙으로 확실히 추출되면 LLM을 호출하지 않습니다.
+        fast = fast_extract.extract(FAST_RULES, field_id, user_message)
+        if fast is not None:
+            return fast
+
+        # 같은 필드에 같은 답변을 이전에 LLM으로 추출한 적 있으면 그 결과를 재사용합니다. (extraction_cache.py)
+        cached = await extraction_cache.get(CONTRACT_TYPE, field_id, user_message)
+        if cached is not None:
+            return cached
         
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Question: \"{question}\"\nUser Answer: \"{user_message}\""}
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
+            # 작은 모델로 먼저 추출하고, 확신이 없으면 큰 모델로 다시 추출합니다. (model_router.py)
+            result = await model_router.extract_json(
+                client,
+                EXTRACTION_PROMPTS,
+                field_id,
+                f"Question: \"{question}\"\nUser Answer: \"{user_message}\"",
+                MODEL_POLICY,
             )
-            return json.loads(response.choices[0].message.content)
+            await extraction_cache.put(CONTRACT_TYPE, field_id, user_message, result)
+            return result
         except Exception as e:
             print(f"AI Extraction Error: {e}")
             return {"status": "success", "filled_fields": {field_id: user_message}, "skip_next_n_questions": 0}
@@ -410,7 +418,8 @@ async def process_message(
 ) -> schemas.ChatResponse:
 
     content = contract.content or {}
-    new_chat_history = contract.chat_history.copy() if isinstance(contract.chat_history, list) else []
+    # 이번 턴에 추가될 메시지만 담습니다. (services가 chat_messages에 INSERT)
+    new_chat_history: List[Dict[str, Any]] = []
     
     # 1. 다음 질문 찾기
     current_item, current_index = find_next_question(content)
@@ -419,7 +428,7 @@ async def process_message(
     
     # 2. 빈 입력 / 초기 진입 처리
     if not message.strip() or message.strip() == "string":
-        user_has_spoken = any(msg.get("sender") == "user" for msg in new_chat_history)
+        user_has_spoken = await crud.has_user_message(db, contract.id)
         if not user_has_spoken:
             if current_item:
                 return schemas.ChatResponse(
@@ -465,16 +474,18 @@ async def process_message(
     # ⭐️ [2순위] 강력한 질문(RAG) 감지 (이게 없어서 자꾸 무시했던 것!)
     # AI 추출보다 먼저 키워드를 검사해서 '세금, 비용' 질문이면 무조건 낚아챕니다.
     # --------------------------------------------------------------------------
+    # 이번 턴의 검색 결과 (유사도 검사와 RAG 답변이 임베딩을 한 번만 계산해 공유)
+    retrieval = knowledge_base.context(CONTRACT_TYPE, message, client)
+
     is_rag = False
-    rag_keywords = ["세금", "취득세", "비용", "수수료", "얼마", "어떻게", "무엇", "기준", "가요", "나요", "프로", "퍼센트", "?"]
-    
-    # (A) 키워드 포함 여부 확인
-    if any(k in message for k in rag_keywords):
+    # (A) 어휘 게이트 (BM25, 네트워크 호출 없음): 질문 표현 + 팁과 어휘가 겹치면 바로 RAG
+    verdict = knowledge_base.classify(CONTRACT_TYPE, message)
+    if verdict.label == "question":
         is_rag = True
-    
-    # (B) 키워드가 없어도 팁 리스트와 유사도가 높으면 질문으로 간주
-    if not is_rag:
-        tips, score = await find_top_relevant_tips(message)
+
+    # (B) 애매한 경우에만 팁 리스트와의 임베딩 유사도로 판단
+    elif verdict.label == "ambiguous":
+        tips, score = await retrieval.top_tips()
         if score >= 0.65: # 유사도 기준
             is_rag = True
 
@@ -497,8 +508,8 @@ async def process_message(
     # ✅ RAG 답변 처리 (질문인 경우)
     # -----------------------------------------------------------
     if is_rag:
-        tips, _ = await find_top_relevant_tips(message)
-        rag_answer = await get_rag_response(message, tips)
+        # 비슷한 질문의 답변이 캐시에 있으면 LLM을 호출하지 않습니다. (knowledge/answer_cache.py)
+        rag_answer = await retrieval.answer(get_rag_response)
         
         # 🚨 중요: 팁에 정보가 없어도 "모른다"고 답하고, 폼 입력을 다시 유도해야 함
         new_chat_history.append({"sender": "bot", "message": rag_answer})
@@ -0,0 +1,194 @@
+# app/ai_handlers/extraction_cache.py
+# get_smart_extraction 결과 캐시: 같은 질문(필드)에 같은 짧은 답변("예", "없음", "계좌이체")이면 LLM을 다시 부르지 않습니다.
+#
+# 키: (계약서 종류, field_id, 정규화한 답변, 날짜 구간)
+#   - 날짜 구간: "오늘", "작년"처럼 상대적인 표현이 있으면 오늘 날짜,
+#     "12월 25일", "12/25"처럼 연도 없는 월/일이면 올해 연도(LLM이 올해로 채움), 없으면 "" (구간이 바뀌면 다른 키)
+# 저장하지 않는 결과: clarify / rag_required, LLM 호출 실패 시의 대체 결과(저장 경로를 타지 않음), 긴 답변
+# 계층: 프로세스 메모리(TTLCache) → (선택) sqlite 파일 (EXTRACTION_CACHE_SQLITE_PATH, 워커/재시작 간 공유)
+import os
+import copy
+import json
+import time
+import sqlite3
+import asyncio
+import datetime
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Optional
+
+from app import metrics
+from app.cache import TTLCache
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+EXTRACTION_CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 86400)))
+# 설정하면 sqlite 파일을 두 번째 계층으로 사용합니다. (예: /var/cache/lawbot/extraction.sqlite3)
+EXTRACTION_CACHE_SQLITE_PATH = os.getenv("EXTRACTION_CACHE_SQLITE_PATH")
+# 이보다 긴 답변은 사람마다 달라 재사용될 일이 거의 없으므로 저장하지 않습니다.
+EXTRACTION_CACHE_MAX_MESSAGE_LENGTH = 40
+# 추출 프롬프트를 바꿔 같은 답변의 결과가 달라져야 하면 올립니다. (sqlite에 남은 이전 결과 무시)
+EXTRACTION_CACHE_VERSION = "1"
+
+SKIP_STATUSES = {"clarify", "rag_required"}
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s.!~…]+$")
+_RELATIVE_DATE = re.compile(r"오늘|내일|모레|어제|그제|그저께|금일|명일|작년|올해|금년|내년|재작년|이번|다음|지난|저번|today|tomorrow|yesterday")
+_MONTH_DAY = re.compile(r"\d{1,2}\s*월|\d{1,2}\s*/\s*\d{1,2}")
+_YEAR = re.compile(r"\d{2,4}\s*년|\d{4}\s*[-./]")
+
+
+def normalize_message(message: str) -> str:
+    text = unicodedata.normalize("NFC", message).lower()
+    return _TRAILING_PUNCT.sub("", _WHITESPACE.sub(" ", text).strip())
+
+
+def date_bucket(message: str, today: Optional[datetime.date] = None) -> str:
+    today = today or datetime.date.today()
+    if _RELATIVE_DATE.search(message):
+        return today.isoformat()
+    if _MONTH_DAY.search(message) and not _YEAR.search(message):
+        return str(today.year)
+    return ""
+
+
+def cache_key(contract_type: str, field_id: str, message: str, today: Optional[datetime.date] = None) -> str:
+    normalized = normalize_message(message)
+    raw = "\x00".join([EXTRACTION_CACHE_VERSION, contract_type, field_id, normalized, date_bucket(normalized, today)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SqliteTier:
+    """키-값 sqlite 테이블. 호출은 asyncio.to_thread로 이벤트 루프 밖에서 실행합니다."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " key TEXT PRIMARY KEY, contract_type TEXT, field_id TEXT, result TEXT, expires_at REAL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT result, expires_at FROM extraction_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: str, contract_type: str, field_id: str, result: Dict, expires_at: float):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO extraction_cache (key, contract_type, field_id, result, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, contract_type, field_id, json.dumps(result, ensure_ascii=False), expires_at),
+        )
+
+
+class ExtractionCache:
+    def __init__(
+        self,
+        max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = EXTRACTION_CACHE_TTL_SECONDS,
+        sqlite_path: Optional[str] = EXTRACTION_CACHE_SQLITE_PATH,
+        enabled: bool = EXTRACTION_CACHE_ENABLED,
+    ):
+        self.enabled = enabled and max_entries > 0
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds, name="extraction")
+        self.sqlite = SqliteTier(sqlite_path) if sqlite_path else None
+        self.stores = 0
+        self.skipped: Dict[str, int] = {}
+        self.sqlite_errors = 0
+        # "계약서 종류:field_id" -> [memory hit, sqlite hit, miss]
+        self._by_field: Dict[str, list] = {}
+
+    def _count(self, contract_type: str, field_id: str, slot: int):
+        counts = self._by_field.setdefault(f"{contract_type}:{field_id}", [0, 0, 0])
+        counts[slot] += 1
+
+    async def get(self, contract_type: str, field_id: str, message: str) -> Optional[Dict]:
+        """저장된 추출 결과의 복사본 (호출한 쪽이 결과를 수정해도 캐시는 그대로)"""
+        if not self.enabled:
+            return None
+        key = cache_key(contract_type, field_id, message)
+        result = self.memory.get(key)
+        if result is not None:
+            self._count(contract_type, field_id, 0)
+            return copy.deepcopy(result)
+
+        if self.sqlite is not None:
+            try:
+                result = await asyncio.to_thread(self.sqlite.get, key)
+            except sqlite3.Error as e:
+                self.sqlite_errors += 1
+                print(f"⚠️ 추출 캐시(sqlite) 조회 실패: {e}")
+                result = None
+            if result is not None:
+                self.memory.set(key, result)
+                self._count(contract_type, field_id, 1)
+                return copy.deepcopy(result)
+
+        self._count(contract_type, field_id, 2)
+        return None
+
+    async def put(self, contract_type: str, field_id: str, message: str, result: Dict):
+        """LLM이 정상적으로 파싱한 결과만 호출하세요. clarify / rag_required는 여기서 걸러냅니다."""
+        if not self.enabled:
+            return
+        status = result.get("status")
+        reason = None
+        if status in SKIP_STATUSES:
+            reason = status
+        elif status != "success" or not isinstance(result.get("filled_fields"), dict):
+            reason = "invalid"
+        elif len(message.strip()) > EXTRACTION_CACHE_MAX_MESSAGE_LENGTH:
+            reason = "long_message"
+        if reason:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            return
+
+        key = cache_key(contract_type, field_id, message)
+        stored = copy.deepcopy(result)
+        self.memory.set(key, stored)
+        self.stores += 1
+        if self.sqlite is not None:
+            try:
+                await asyncio.to_thread(
+                    self.sqlite.put, key, contract_type, field_id, stored, time.time() + self.ttl_seconds
+                )
+            except sqlite3.Error as e:
+                self.sqlite_errors += 1
+                print(f"⚠️ 추출 캐시(sqlite) 저장 실패: {e}")
+
+    def stats(self) -> dict:
+        by_field = {}
+        for field, (memory_hits, sqlite_hits, misses) in sorted(self._by_field.items()):
+            total = memory_hits + sqlite_hits + misses
+            by_field[field] = {
+                "memory_hits": memory_hits,
+                "sqlite_hits": sqlite_hits,
+                "misses": misses,
+                "hit_rate": round((memory_hits + sqlite_hits) / total, 4) if total else 0.0,
+            }
+        return {
+            "enabled": self.enabled,
+            "sqlite": self.sqlite.path if self.sqlite else None,
+            "memory": self.memory.stats(),
+            "stores": self.stores,
+            "skipped": dict(self.skipped),
+            "sqlite_errors": self.sqlite_errors,
+            "by_field": by_field,
+        }
+
+
+extraction_cache = ExtractionCache()
+metrics.register("extraction_cache", extraction_cache.stats)
@@ -0,0 +1,91 @@
+# app/ai_handlers/extraction_prompt.py
+# get_smart_extraction 시스템 프롬프트를 (핸들러, field_id)별로 import 시점에 한 번만 만들어 둡니다.
+#
+# OpenAI는 앞부분(1024 토큰 이상)이 이전 요청과 글자 그대로 같으면 입력 토큰을 캐시에서 처리합니다. (지연·비용 감소)
+# 그래서 메시지는 항상 [고정: 규칙 + 필드별 퓨샷 예시] → [변동: 오늘 날짜, 질문, 사용자 답변] 순서로 보냅니다.
+#   - 시스템 프롬프트에는 날짜나 사용자 입력을 절대 넣지 않습니다. (날짜는 마지막 사용자 메시지의 "오늘:" 줄)
+#   - prompt_cache_key로 같은 필드의 요청이 같은 캐시 서버로 가도록 묶습니다.
+# 응답의 usage.prompt_tokens_details.cached_tokens로 필드별 캐시 적중 비율을 기록합니다. (metrics "prompt_cache")
+import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app import metrics
+
+# 시나리오에 없는 field_id의 퓨샷 예시에 들어갈 질문 자리 표시
+UNKNOWN_QUESTION = "(현재 질문)"
+
+
+class PromptCacheStats:
+    def __init__(self):
+        # "계약서 종류:field_id" -> [요청 수, 입력 토큰, 캐시된 입력 토큰]
+        self._by_field: Dict[str, List[int]] = {}
+
+    def record(self, contract_type: str, field_id: str, usage) -> None:
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        counts = self._by_field.setdefault(f"{contract_type}:{field_id}", [0, 0, 0])
+        counts[0] += 1
+        counts[1] += getattr(usage, "prompt_tokens", 0) or 0
+        counts[2] += cached
+
+    def stats(self) -> dict:
+        by_field = {}
+        requests = prompt_tokens = cached_tokens = 0
+        for field, (count, prompt, cached) in sorted(self._by_field.items()):
+            by_field[field] = {
+                "requests": count,
+                "prompt_tokens": prompt,
+                "cached_tokens": cached,
+                "cached_ratio": round(cached / prompt, 4) if prompt else 0.0,
+            }
+            requests, prompt_tokens, cached_tokens = requests + count, prompt_tokens + prompt, cached_tokens + cached
+        return {
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "cached_ratio": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "by_field": by_field,
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
+metrics.register("prompt_cache", prompt_cache_stats.stats)
+
+
+def today_line(today: Optional[datetime.date] = None) -> str:
+    today = today or datetime.date.today()
+    return f"오늘: {today.strftime('%Y년 %m월 %d일')} (현재 연도는 {today.year}년)"
+
+
+class PromptBook:
+    """
+    build(field_id, question): 날짜·사용자 입력이 들어가지 않는 시스템 프롬프트
+    scenario: 핸들러의 CONTRACT_SCENARIO — 여기 있는 field_id는 import 시점에 미리 만들어 둡니다.
+    """
+
+    def __init__(self, contract_type: str, build: Callable[[str, str], str], scenario: Iterable[Dict]):
+        self.contract_type = contract_type
+        self._build = build
+        self._questions = {item["field_id"]: item["question"] for item in scenario}
+        self._prompts = {field_id: build(field_id, question) for field_id, question in self._questions.items()}
+
+    def system_prompt(self, field_id: str) -> str:
+        prompt = self._prompts.get(field_id)
+        if prompt is None:
+            prompt = self._prompts[field_id] = self._build(field_id, self._questions.get(field_id, UNKNOWN_QUESTION))
+        return prompt
+
+    def messages(self, field_id: str, user_content: str, today: Optional[datetime.date] = None) -> List[Dict[str, str]]:
+        """고정 시스템 프롬프트 뒤에, 오늘 날짜 + 핸들러가 만든 질문/답변 메시지를 붙입니다."""
+        return [
+            {"role": "system", "content": self.system_prompt(field_id)},
+            {"role": "user", "content": f"{today_line(today)}\n{user_content}"},
+        ]
+
+    def cache_key(self, field_id: str) -> str:
+        return f"extract:{self.contract_type}:{field_id}"
+
+    def record_usage(self, field_id: str, response) -> None:
+        prompt_cache_stats.record(self.contract_type, field_id, getattr(response, "usage", None))
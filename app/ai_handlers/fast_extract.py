@@ -0,0 +1,360 @@
+# app/ai_handlers/fast_extract.py
+# get_smart_extraction 앞단의 규칙 기반 추출기 (LLM 호출 없음)
+#
+# 전화번호, 시간, 날짜, 숫자, 금액, 이메일, 등록번호, 예/아니오처럼 형식이 정해진 답변은
+# 정규식으로 바로 filled_fields를 만듭니다. 조금이라도 애매하면 None을 돌려주고 기존처럼 LLM이 판단합니다.
+# - 질문 표현(?, 의문사, 의문형 어미)이 있으면 RAG 질문일 수 있으므로 항상 LLM으로 넘깁니다.
+# - 각 핸들러는 FAST_RULES = {field_id: 규칙}을 정의하고 extract(FAST_RULES, field_id, message)를 호출합니다.
+# - 규칙: rule(field_id, message, today) -> filled_fields(dict) 또는 None
+import re
+import datetime
+from typing import Callable, Dict, Optional
+
+from app import metrics
+from app.knowledge.lexical import has_question_marker, normalize_text
+
+Rule = Callable[[str, str, datetime.date], Optional[Dict]]
+
+# 이보다 긴 답변은 설명이 섞여 있을 가능성이 높아 LLM에 맡깁니다.
+FAST_EXTRACT_MAX_LENGTH = 60
+
+# 값 뒤에 붙는 말꼬리 ("010-1234-5678 입니다", "9시요", "25일이에요")
+_TRAILING = re.compile(
+    r"(\s*(입니다|이에요|예요|에요|이요|요|이고요|이구요|입니당|이야|야|임|쯤|정도|부터|까지|에|으로|로|해요|합니다|시작해요|시작합니다|끝나요|마쳐요|[.!~,]))+$"
+)
+_LEADING = re.compile(r"^(\s*(네|예|음|저는|제|번호는|연락처는|전화번호는|이메일은|주소는)[,\s]+)+")
+
+
+def _strip(message: str) -> str:
+    text = message.strip()
+    text = _LEADING.sub("", text)
+    return _TRAILING.sub("", text).strip()
+
+
+# =================================================================
+#   값 파서
+# =================================================================
+_PHONE_CHARS = re.compile(r"^[\d\-.\s()]+$")
+
+
+def parse_phone(message: str) -> Optional[str]:
+    """국내 전화번호를 하이픈 형식으로 (010-1234-5678, 02-123-4567, 031-123-4567, 1588-1234)"""
+    text = _strip(message)
+    if not _PHONE_CHARS.match(text):
+        return None
+    digits = re.sub(r"\D", "", text)
+    if re.fullmatch(r"1[5-9]\d{6}", digits):  # 대표번호
+        return f"{digits[:4]}-{digits[4:]}"
+    if not digits.startswith("0"):
+        return None
+    if digits.startswith("02"):
+        if len(digits) == 9:
+            return f"02-{digits[2:5]}-{digits[5:]}"
+        if len(digits) == 10:
+            return f"02-{digits[2:6]}-{digits[6:]}"
+        return None
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    if len(digits) == 11:
+        return f"{digits[:3]}-{digits[3:7]}-{digits[7:]}"
+    return None
+
+
+_CLOCK = re.compile(r"^([01]?\d|2[0-3])\s*:\s*([0-5]\d)$")
+_KOREAN_TIME = re.compile(
+    r"^(?:(오전|아침|새벽|오후|낮|저녁|밤)\s*)?(\d{1,2})\s*시(?:\s*(반|(\d{1,2})\s*분))?(?:\s*정각)?$"
+)
+_AM = {"오전", "아침", "새벽"}  # 나머지(오후/낮/저녁/밤)는 오후로 봅니다.
+_NIGHT = {"저녁", "밤"}  # "저녁 12시", "밤 12시"는 자정(00:00), "낮/오후 12시"는 정오
+
+
+def parse_time(message: str) -> Optional[str]:
+    """
+    24시간제 "HH:MM". "09:00", "18시", "오후 6시", "밤 10시 30분", "오전 9시 반"
+    오전/오후 표시 없는 1~12시("2시", "10시")는 모호하므로 None (LLM이 되묻습니다).
+    """
+    text = _strip(message)
+    if text == "정오":
+        return "12:00"
+    m = _CLOCK.match(text)
+    if m:
+        return f"{int(m.group(1)):02d}:{m.group(2)}"
+
+    m = _KOREAN_TIME.match(text)
+    if not m:
+        return None
+    period, hour = m.group(1), int(m.group(2))
+    minute = 30 if m.group(3) == "반" else int(m.group(4) or 0)
+    if hour > 24 or minute > 59:
+        return None
+    if period is None:
+        if 1 <= hour <= 12:
+            return None
+        if hour == 24:
+            hour = 0
+    elif hour > 12:
+        # "오후 18시"처럼 이미 24시간제면 그대로, "오전 18시"는 모순
+        if period in _AM:
+            return None
+    elif period in _AM:
+        hour = 0 if hour == 12 else hour
+    elif period in _NIGHT and hour == 12:
+        hour = 0
+    elif hour != 12:
+        hour += 12
+    return f"{hour:02d}:{minute:02d}"
+
+
+_DATE_PATTERNS = (
+    re.compile(r"^(\d{4}|\d{2})\s*년\s*(\d{1,2})\s*월\s*(\d{1,2})\s*일$"),
+    re.compile(r"^(\d{4})\s*[-./]\s*(\d{1,2})\s*[-./]\s*(\d{1,2})\.?$"),
+    re.compile(r"^(\d{4})(\d{2})(\d{2})$"),
+)
+_RELATIVE_DAYS = {"오늘": 0, "금일": 0, "내일": 1, "명일": 1, "모레": 2, "어제": -1, "그제": -2, "그저께": -2}
+
+
+def parse_date(message: str, today: datetime.date) -> Optional[datetime.date]:
+    """연도가 있는 날짜와 오늘/내일/어제만 처리합니다. ("5월 8일"처럼 연도가 없으면 None → LLM이 되묻기)"""
+    text = _strip(message)
+    if text in _RELATIVE_DAYS:
+        return today + datetime.timedelta(days=_RELATIVE_DAYS[text])
+    for pattern in _DATE_PATTERNS:
+        m = pattern.match(text)
+        if m:
+            year, month, day = (int(g) for g in m.groups())
+            if year < 100:
+                year += 2000
+            try:
+                return datetime.date(year, month, day)
+            except ValueError:
+                return None
+    return None
+
+
+_INTEGER = re.compile(r"^(?:주\s*|매월\s*|매달\s*|한\s*달에\s*|월\s*)?(\d{1,3})\s*(?:일|회|번|개)?$")
+
+
+def parse_integer(message: str) -> Optional[int]:
+    """"5", "5일", "주 5일", "매월 25일" → 정수"""
+    m = _INTEGER.match(_strip(message))
+    return int(m.group(1)) if m else None
+
+
+_LARGE_UNITS = (("조", 10 ** 12), ("억", 10 ** 8), ("만", 10 ** 4))
+_SMALL_GROUP = re.compile(r"^(?:(\d+)천)?(?:(\d+)백)?(\d*)$")
+
+
+def _parse_small(text: str) -> Optional[int]:
+    """만 미만 구간: "3천", "2천5백", "1200" → 정수"""
+    if text.isdigit():
+        return int(text)
+    m = _SMALL_GROUP.match(text)
+    if not m or not any(m.groups()):
+        return None
+    thousands, hundreds, rest = m.groups()
+    return int(thousands or 0) * 1000 + int(hundreds or 0) * 100 + int(rest or 0)
+
+
+def parse_amount(message: str) -> Optional[int]:
+    """
+    금액(원): "2500000", "2,500,000", "250만원", "1억 2000만 원", "3천만원" → 정수
+    "1억 2천"처럼 큰 단위 뒤에 단위 없는 나머지가 붙으면(구어로 '1억 2천만'일 수 있음) None.
+    """
+    text = re.sub(r"원$", "", _strip(message).replace(" ", "").replace(",", ""))
+    if not text or not re.search(r"\d", text) or not re.fullmatch(r"[\d조억만천백]+", text):
+        return None
+    total, rest, used_large = 0, text, False
+    for unit, value in _LARGE_UNITS:
+        if unit in rest:
+            head, rest = rest.split(unit, 1)
+            group = _parse_small(head)
+            if group is None:
+                return None
+            total += group * value
+            used_large = True
+    if rest:
+        if used_large:
+            return None
+        group = _parse_small(rest)
+        if group is None:
+            return None
+        total += group
+    return total or None
+
+
+def _amount_text(amount: int) -> str:
+    return f"{amount:,}"
+
+
+_EMAIL = re.compile(r"^[\w.+-]+@[\w-]+(\.[\w-]+)+$")
+
+
+def parse_email(message: str) -> Optional[str]:
+    text = _strip(message)
+    return text if _EMAIL.match(text) else None
+
+
+def parse_registration_number(message: str) -> Optional[str]:
+    """주민/외국인 등록번호 13자리 → "YYMMDD-NNNNNNN" (앞 6자리가 날짜로 유효할 때만)"""
+    text = _strip(message)
+    if not re.fullmatch(r"\d{6}\s*-?\s*\d{7}", text):
+        return None
+    digits = re.sub(r"\D", "", text)
+    month, day = int(digits[2:4]), int(digits[4:6])
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{digits[:6]}-{digits[6:]}"
+
+
+_YES_WORDS = {
+    "네", "넵", "넹", "예", "응", "어", "ㅇㅇ", "ㅇ", "yes", "y", "o", "맞아요", "맞습니다", "맞아", "그렇습니다",
+    "있음", "있어요", "있습니다", "있어", "있고요", "받아요", "받습니다", "지급돼요", "지급됩니다",
+}
+_NO_WORDS = {
+    "아니요", "아니오", "아뇨", "아니", "아니에요", "아닙니다", "ㄴㄴ", "no", "n", "x",
+    "없음", "없어요", "없습니다", "없어", "없고요", "안", "안해요", "안합니다", "안함", "미가입", "안받아요", "않아요", "않습니다",
+}
+# 예/아니오와 함께 쓰여도 의미를 바꾸지 않는 말
+_NEUTRAL_WORDS = {
+    "가입", "가입해요", "가입합니다", "가입할게요", "해요", "합니다", "할게요", "할", "거예요", "예정이에요", "예정입니다",
+    "지급", "지급해요", "지급합니다", "따로", "별도로", "별도", "그런", "건", "것", "거", "은", "는", "요", "입니다",
+}
+
+
+def parse_yes_no(message: str) -> Optional[bool]:
+    """모든 단어가 예/아니오/중립 단어일 때만 판단합니다. 예와 아니오가 섞이면 None."""
+    words = normalize_text(message).split()
+    if not words or any(w not in _YES_WORDS and w not in _NO_WORDS and w not in _NEUTRAL_WORDS for w in words):
+        return None
+    yes = any(w in _YES_WORDS for w in words)
+    no = any(w in _NO_WORDS for w in words)
+    if yes == no:
+        return None
+    return yes
+
+
+# =================================================================
+#   규칙 (FAST_RULES 값으로 사용)
+# =================================================================
+def phone(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    value = parse_phone(message)
+    return {field_id: value} if value else None
+
+
+def time_hhmm(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    value = parse_time(message)
+    return {field_id: value} if value else None
+
+
+def date_full(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    """"YYYY년 MM월 DD일" (근로계약서, 위임장)"""
+    date = parse_date(message, today)
+    return {field_id: date.strftime("%Y년 %m월 %d일")} if date else None
+
+
+def date_split(prefix: str) -> Rule:
+    """{prefix}_yyyy / _mm / _dd로 나눠 저장 (통합신청서 생년월일)"""
+    def rule(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+        date = parse_date(message, today)
+        if not date:
+            return None
+        return {f"{prefix}_yyyy": f"{date.year:04d}", f"{prefix}_mm": f"{date.month:02d}", f"{prefix}_dd": f"{date.day:02d}"}
+    return rule
+
+
+def integer_between(low: int, high: int) -> Rule:
+    def rule(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+        value = parse_integer(message)
+        return {field_id: str(value)} if value is not None and low <= value <= high else None
+    return rule
+
+
+def amount(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    """쉼표 금액 ("2,500,000") — 단위(원, 만원)는 지우고 숫자만"""
+    value = parse_amount(message)
+    return {field_id: _amount_text(value)} if value else None
+
+
+def amount_digits(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    """숫자만 ("2500000") — "숫자만 입력" 질문용"""
+    value = parse_amount(message)
+    return {field_id: str(value)} if value else None
+
+
+def email(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    value = parse_email(message)
+    return {field_id: value} if value else None
+
+
+def registration_number(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    value = parse_registration_number(message)
+    return {field_id: value} if value else None
+
+
+def yes_no(on_answer: Callable[[str, bool], Dict]) -> Rule:
+    """on_answer(field_id, 예/아니오) -> filled_fields"""
+    def rule(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+        answer = parse_yes_no(message)
+        return on_answer(field_id, answer) if answer is not None else None
+    return rule
+
+
+def choice(options: Dict[str, Dict]) -> Rule:
+    """
+    options: {정규식: filled_fields} — 정확히 하나의 선택지만 맞아야 합니다.
+    (예: 지급 방법 "계좌이체" / "현금", 성별 "남" / "여")
+    """
+    compiled = [(re.compile(pattern), fields) for pattern, fields in options.items()]
+
+    def rule(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+        text = normalize_text(message)
+        matched = [fields for pattern, fields in compiled if pattern.search(text)]
+        return dict(matched[0]) if len(matched) == 1 else None
+    return rule
+
+
+# =================================================================
+#   진입점
+# =================================================================
+class FastExtractStats:
+    def __init__(self):
+        self.hits: Dict[str, int] = {}
+        self.fallbacks: Dict[str, int] = {}
+
+    def record(self, field_id: str, hit: bool):
+        counter = self.hits if hit else self.fallbacks
+        counter[field_id] = counter.get(field_id, 0) + 1
+
+    def snapshot(self) -> dict:
+        hits, fallbacks = sum(self.hits.values()), sum(self.fallbacks.values())
+        return {
+            "hits": hits,
+            "fallbacks": fallbacks,
+            "hit_rate": round(hits / (hits + fallbacks), 4) if hits + fallbacks else 0.0,
+            "by_field": {
+                field: {"hits": self.hits.get(field, 0), "fallbacks": self.fallbacks.get(field, 0)}
+                for field in sorted(set(self.hits) | set(self.fallbacks))
+            },
+        }
+
+
+fast_extract_stats = FastExtractStats()
+metrics.register("fast_extract", fast_extract_stats.snapshot)
+
+
+def extract(rules: Dict[str, Rule], field_id: str, message: str, today: Optional[datetime.date] = None) -> Optional[Dict]:
+    """
+    규칙으로 확실히 추출되면 get_smart_extraction과 같은 형식의 결과를, 아니면 None을 반환합니다.
+    규칙이 없는 필드는 통계에 넣지 않습니다.
+    """
+    rule = rules.get(field_id)
+    if rule is None:
+        return None
+    filled = None
+    text = message.strip()
+    if text and len(text) <= FAST_EXTRACT_MAX_LENGTH and not has_question_marker(text):
+        filled = rule(field_id, text, today or datetime.date.today())
+    fast_extract_stats.record(field_id, filled is not None)
+    if filled is None:
+        return None
+    return {"status": "success", "filled_fields": filled, "skip_next_n_questions": 0, "follow_up_question": None}
@@ -11,9 +11,15 @@ from openai import AsyncOpenAI
 from docxtpl import DocxTemplate
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import schemas
+from app import crud, schemas
+from app.ai_handlers import fast_extract, model_router
+from app.ai_handlers.extraction_cache import extraction_cache
+from app.ai_handlers.extraction_prompt import PromptBook
+from app.knowledge import generate_answer, knowledge_base
+from app.llm_client import client
 
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# 이 핸들러가 담당하는 계약서 종류 (지식 베이스 네임스페이스로도 사용)
+CONTRACT_TYPE = "통합신청서"
 
 # --- 1. 통합신청서 전용 시나리오 ---
 # (미리 작성해두신 '통합신청서' 질문 리스트를 여기에 붙여넣으세요.)
@@ -126,41 +132,12 @@ TIP_LIST = [
 # 0.4로 설정하니깐 폼 답변인데 rag질문으로 인식되는 문제가 자주 발생해서 0.7로 높였음
 SIMILARITY_THRESHOLD = 0.6
 
-tip_embeddings: List[np.ndarray] = []
-tip_embeddings_lock = asyncio.Lock()
+# 팁은 공용 지식 베이스(app/knowledge)에 이 계약서 종류의 네임스페이스로 등록합니다.
+# 팁 문구를 수정했다면 `python -m app.knowledge build`로 인덱스를 다시 빌드하세요.
+knowledge_base.register(CONTRACT_TYPE, TIP_LIST)
 
-async def get_tip_embeddings():
-    global tip_embeddings
-    async with tip_embeddings_lock:
-        if not tip_embeddings:
-            resp = await client.embeddings.create(
-                model="text-embedding-3-small",
-                input=TIP_LIST
-            )
-            tip_embeddings = [np.array(d.embedding) for d in resp.data]
-    return tip_embeddings
-
-
-async def get_embedding(text: str):
-    resp = await client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return np.array(resp.data[0].embedding)
-
-
-async def find_top_relevant_tips(question: str, top_n=3):
-    embeddings = await get_tip_embeddings()
-    q_emb = await get_embedding(question)
-    sims = [np.dot(q_emb, t) for t in embeddings]
-
-    idx = np.argsort(sims)[-top_n:][::-1]
-    top_score = sims[idx[0]]
-    tips_str = "\n".join([TIP_LIST[i] for i in idx])
-    return tips_str, top_score
-
-
-async def get_rag_response(question: str, relevant_tips: str) -> str:
+async def get_rag_response(question: str, relevant_tips: str, include_date: bool = True) -> str:
+    # 날짜를 넣지 않는 프롬프트라 include_date는 다른 핸들러와 호출 형식을 맞추기 위한 것입니다.
     system_prompt = f"""
 당신은 대한민국 출입국관리법 및 체류허가 업무에 전문 지식을 가진 
 '출입국·외국인정책 전문가 AI 상담관'입니다.
@@ -190,39 +167,46 @@ async def get_rag_response(question: str, relevant_tips: str) -> str:
 5. 불필요한 사족, 인사말, 문장 외의 요소는 넣지 말고 답변만 하세요.
 
     """
-    resp = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": question},
-        ],
-        temperature=0
-    )
-    return resp.choices[0].message.content.strip()
+    return await generate_answer(system_prompt, question, client)
 
 
 # --- 2. 통합신청서 전용 AI 추출기 ---
-async def get_smart_extraction(
-    client: AsyncOpenAI,
-    field_id: str, 
-    user_message: str, 
-    question: str
-) -> Dict:
+# 형식이 정해진 필드는 LLM 호출 전에 규칙으로 먼저 추출합니다. (app/ai_handlers/fast_extract.py)
+FAST_RULES = {
+    "birth": fast_extract.date_split("birth"),
+    "sex": fast_extract.choice({
+        r"^(남|남자|남성|male|m)(입니다|이에요|예요|요|임)?$": {"sex_m_check": True, "sex_f_check": False},
+        r"^(여|여자|여성|female|f)(입니다|이에요|예요|요|임)?$": {"sex_m_check": False, "sex_f_check": True},
+    }),
+    "email": fast_extract.email,
+    "foreign_num": fast_extract.registration_number,
+    **{
+        field_id: fast_extract.phone
+        for field_id in ["tele_num", "phone_num", "school_phone", "cur_phone", "new_phone"]
+    },
+}
+
+
+# 처음부터 큰 모델로 추출할 필드 (나머지는 작은 모델 → 필요할 때만 큰 모델, model_router.py)
+MODEL_POLICY = {
+    "korea_address": "large",
+    "address_in_home_country": "large",
+    # 9개 항목 중 복수 선택 → 10개 체크 변수
+    "application_type": "large",
+}
+
+def _build_extraction_prompt(field_id: str, question: str) -> str:
     """
-    [통합신청서 AI 스마트 추출기]
-    '통합신청서'의 복잡한 폼(체크박스, 날짜 등)을 채우기 위해 
-    working_ai.py의 프롬프트 구조를 재사용합니다.
+    통합신청서 get_smart_extraction의 시스템 프롬프트 (규칙 + 필드별 퓨샷 예시).
+    날짜와 사용자 입력은 넣지 않습니다. question은 CONTRACT_SCENARIO의 해당 필드 질문입니다.
     """
-    
-    today = datetime.date.today()
-    current_year = today.year
     json_format_example = '{"status": "...", "filled_fields": {"key": "value", ...}, "skip_next_n_questions": 0, "follow_up_question": null}'
     
     # ❗️ [수정] 기본 프롬프트의 역할 수정
     base_system_prompt = f"""
     당신은 대한민국 '출입국관리사무소'의 민원 서류 작성을 돕는 전문 AI 어시스턴트입니다.
     사용자의 답변에서 '통합신청서' 서식에 필요한 핵심 정보를 추출해야 합니다.
-    오늘은 {today.strftime('%Y년 %m월 %d일')}입니다. (현재 연도는 {current_year}년)
+    오늘 날짜는 사용자 메시지 첫 줄의 '오늘:'을 기준으로 합니다.
 
     [규칙]
     1.  `filled_fields`에는 템플릿(`.docx`)의 변수명(field_id)을 key로 사용하여 추출한 값을 채워야 합니다.
@@ -547,22 +531,46 @@ async def get_smart_extraction(
         AI: {{"status": "success", "filled_fields": {{"{field_id}": "PARK"}}, "skip_next_n_questions": 0, "follow_up_question": null}}
         """
 
-    # --- (이하 API 호출 로직은 working_ai.py와 동일) ---
-    system_prompt_with_examples = f"{base_system_prompt}\n--- [필드별 퓨샷(Few-Shot) 예시] ---\n{specific_examples}"
+    return f"{base_system_prompt}\n--- [필드별 퓨샷(Few-Shot) 예시] ---\n{specific_examples}"
+
+
+# field_id별 시스템 프롬프트를 미리 만들어 둡니다. (프롬프트 캐시 적중용, extraction_prompt.py)
+EXTRACTION_PROMPTS = PromptBook(CONTRACT_TYPE, _build_extraction_prompt, CONTRACT_SCENARIO)
+
+
+async def get_smart_extraction(
+    client: AsyncOpenAI,
+    field_id: str, 
+    user_message: str, 
+    question: str
+) -> Dict:
+    """
+    [통합신청서 AI 스마트 추출기]
+    '통합신청서'의 복잡한 폼(체크박스, 날짜 등)을 채우기 위해 
+    working_ai.py의 프롬프트 구조를 재사용합니다.
+    """
     
+    # 생년월일/성별/전화번호/이메일/외국인 등록번호는 규칙으로 확실히 추출되면 LLM을 호출하지 않습니다.
+    fast = fast_extract.extract(FAST_RULES, field_id, user_message)
+    if fast is not None:
+        return fast
+
+    # 같은 필드에 같은 답변을 이전에 LLM으로 추출한 적 있으면 그 결과를 재사용합니다. (extraction_cache.py)
+    cached = await extraction_cache.get(CONTRACT_TYPE, field_id, user_message)
+    if cached is not None:
+        return cached
+
+    # --- (이하 API 호출 로직은 working_ai.py와 동일) ---
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt_with_examples},
-                {"role": "user", "content": f"question: \"{question}\"\nuser_message: \"{user_message}\""},
-            ],
-            temperature=0.0,
-            response_format={"type": "json_object"}, 
+        # 작은 모델로 먼저 추출하고, 확신이 없으면 큰 모델로 다시 추출합니다. (model_router.py)
+        ai_response_json = await model_router.extract_json(
+            client,
+            EXTRACTION_PROMPTS,
+            field_id,
+            f"question: \"{question}\"\nuser_message: \"{user_message}\"",
+            MODEL_POLICY,
         )
-        
-        ai_response_str = response.choices[0].message.content
-        ai_response_json = json.loads(ai_response_str)
+        await extraction_cache.put(CONTRACT_TYPE, field_id, user_message, ai_response_json)
         return ai_response_json
     except Exception as e:
         print(f"OpenAI (get_smart_extraction - foreign_app) API call failed: {e}")
@@ -713,7 +721,8 @@ async def process_message(
         today = datetime.date.today()
         content["apply_date"] = today.strftime("%Y-%m-%d")
     
-    new_chat_history = contract.chat_history.copy() if isinstance(contract.chat_history, list) else []
+    # 이번 턴에 추가될 메시지만 담습니다. (services가 chat_messages에 INSERT)
+    new_chat_history: List[Dict[str, Any]] = []
 
     # ✅ 1) 다음 질문 찾기
     current_item, _ = find_next_question(content)
@@ -721,7 +730,7 @@ async def process_message(
     current_field_id = current_item["field_id"] if current_item else None # (나중에 사용)
     
     if not message.strip() or message.strip() == "string": 
-        user_has_spoken = any(msg.get("sender") == "user" for msg in new_chat_history)
+        user_has_spoken = await crud.has_user_message(db, contract.id)
 
         # [케이스 A] 사용자가 아직 말을 안 함 (완전 처음) -> 질문만 던짐 (스킵 X)
         if not user_has_spoken:
@@ -809,8 +818,8 @@ async def process_message(
     # ✅ [수정 2] RAG(법률 질문) 처리
     # -----------------------------------------------------------
     if ai_result.get("status") == "rag_required":
-        tips, score = await find_top_relevant_tips(message)
-        rag_answer = await get_rag_response(message, tips)
+        # 비슷한 질문의 답변이 캐시에 있으면 LLM을 호출하지 않습니다. (knowledge/answer_cache.py)
+        rag_answer = await knowledge_base.context(CONTRACT_TYPE, message, client).answer(get_rag_response)
         
         # RAG 답변을 기록에 추가
         new_chat_history.append({"sender": "bot", "message": rag_answer})
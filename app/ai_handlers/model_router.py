@@ -0,0 +1,176 @@
+# app/ai_handlers/model_router.py
+# get_smart_extraction 모델 라우팅: 작은 모델로 먼저 추출하고, 확신이 없을 때만 큰 모델로 올립니다.
+#
+# 필드별 정책 (핸들러의 MODEL_POLICY, field_id 또는 "other_allowance_*" 같은 패턴)
+#   - "tiered" (기본값): 작은 모델 → JSON이 깨졌거나 / status가 clarify이거나 / 호출이 실패하면 큰 모델
+#   - "large": 처음부터 큰 모델 (주소, 항목+금액 쌍, 복수 선택처럼 어려운 필드)
+#   - "small": 작은 모델만 (JSON이 깨졌거나 호출이 실패할 때만 큰 모델)
+# 환경 변수 EXTRACTION_MODEL_POLICY(JSON)로 핸들러 정책을 덮어쓸 수 있습니다.
+#   예: {"근로계약서:other_allowance_*": "tiered", "*:employer_name": "small"}
+# 라우팅 없이 전부 큰 모델로 돌리려면 EXTRACTION_MODEL_POLICY='{"*:*": "large"}'
+import os
+import json
+import time
+import fnmatch
+from typing import Dict, Optional
+
+from app import metrics
+
+EXTRACTION_SMALL_MODEL = os.getenv("EXTRACTION_SMALL_MODEL", "gpt-4o-mini")
+EXTRACTION_LARGE_MODEL = os.getenv("EXTRACTION_LARGE_MODEL", "gpt-4o")
+POLICIES = ("tiered", "large", "small")
+EXTRACTION_DEFAULT_POLICY = os.getenv("EXTRACTION_DEFAULT_POLICY", "tiered")
+if EXTRACTION_DEFAULT_POLICY not in POLICIES:
+    print(f"⚠️ EXTRACTION_DEFAULT_POLICY={EXTRACTION_DEFAULT_POLICY}는 알 수 없는 정책이라 tiered를 사용합니다.")
+    EXTRACTION_DEFAULT_POLICY = "tiered"
+
+
+def _load_overrides() -> Dict[str, str]:
+    raw = os.getenv("EXTRACTION_MODEL_POLICY")
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        print(f"⚠️ EXTRACTION_MODEL_POLICY를 읽지 못했습니다 (무시합니다): {e}")
+        return {}
+    invalid = {k: v for k, v in overrides.items() if v not in POLICIES}
+    if invalid:
+        print(f"⚠️ EXTRACTION_MODEL_POLICY의 알 수 없는 정책은 무시합니다: {invalid}")
+    return {k: v for k, v in overrides.items() if v in POLICIES}
+
+
+# "계약서 종류:field_id 패턴" -> 정책
+POLICY_OVERRIDES = _load_overrides()
+
+
+def _match(patterns: Dict[str, str], name: str) -> Optional[str]:
+    """정확히 같은 키를 먼저, 없으면 맞는 패턴(fnmatch) 중 가장 구체적인 것 (와일드카드를 뺀 글자가 많은 순)"""
+    if name in patterns:
+        return patterns[name]
+    for pattern, policy in sorted(patterns.items(), key=lambda item: -len(item[0].replace("*", ""))):
+        if fnmatch.fnmatchcase(name, pattern):
+            return policy
+    return None
+
+
+def policy_for(contract_type: str, field_id: str, field_policies: Dict[str, str]) -> str:
+    return (
+        _match(POLICY_OVERRIDES, f"{contract_type}:{field_id}")
+        or _match(field_policies, field_id)
+        or EXTRACTION_DEFAULT_POLICY
+    )
+
+
+class RoutingStats:
+    def __init__(self):
+        # "계약서 종류:field_id" -> 필드별 집계
+        self._by_field: Dict[str, dict] = {}
+        self.model_latency = {"small": metrics.Histogram(), "large": metrics.Histogram()}
+
+    def _field(self, contract_type: str, field_id: str) -> dict:
+        key = f"{contract_type}:{field_id}"
+        entry = self._by_field.get(key)
+        if entry is None:
+            entry = self._by_field[key] = {
+                "requests": 0,
+                "small_answered": 0,
+                "escalated": 0,
+                "large_direct": 0,
+                "reasons": {},
+                "latency_seconds": metrics.Histogram(),
+            }
+        return entry
+
+    def record(self, contract_type: str, field_id: str, route: str, seconds: float, reason: Optional[str] = None):
+        entry = self._field(contract_type, field_id)
+        entry["requests"] += 1
+        entry[route] += 1
+        if reason:
+            entry["reasons"][reason] = entry["reasons"].get(reason, 0) + 1
+        entry["latency_seconds"].observe(seconds)
+
+    def stats(self) -> dict:
+        by_field = {}
+        for key, entry in sorted(self._by_field.items()):
+            tried_small = entry["small_answered"] + entry["escalated"]
+            by_field[key] = {
+                "requests": entry["requests"],
+                "small_answered": entry["small_answered"],
+                "escalated": entry["escalated"],
+                "large_direct": entry["large_direct"],
+                "escalation_rate": round(entry["escalated"] / tried_small, 4) if tried_small else 0.0,
+                "reasons": dict(entry["reasons"]),
+                "latency_seconds": entry["latency_seconds"].snapshot(),
+            }
+        return {
+            "small_model": EXTRACTION_SMALL_MODEL,
+            "large_model": EXTRACTION_LARGE_MODEL,
+            "default_policy": EXTRACTION_DEFAULT_POLICY,
+            "model_latency_seconds": {name: h.snapshot() for name, h in self.model_latency.items()},
+            "by_field": by_field,
+        }
+
+
+routing_stats = RoutingStats()
+metrics.register("model_routing", routing_stats.stats)
+
+
+async def _complete(client, tier: str, prompts, field_id: str, user_content: str, temperature: float) -> Dict:
+    model = EXTRACTION_SMALL_MODEL if tier == "small" else EXTRACTION_LARGE_MODEL
+    started = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=prompts.messages(field_id, user_content),
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            prompt_cache_key=prompts.cache_key(field_id),
+        )
+    finally:
+        routing_stats.model_latency[tier].observe(time.perf_counter() - started)
+    prompts.record_usage(field_id, response)
+    return json.loads(response.choices[0].message.content)
+
+
+async def extract_json(
+    client,
+    prompts,
+    field_id: str,
+    user_content: str,
+    field_policies: Dict[str, str],
+    temperature: float = 0.0,
+) -> Dict:
+    """
+    prompts: 핸들러의 EXTRACTION_PROMPTS (extraction_prompt.PromptBook)
+    반환: 파싱된 추출 결과. 큰 모델 호출이 실패하면 예외를 그대로 올립니다. (핸들러의 기존 except 처리)
+    """
+    contract_type = prompts.contract_type
+    policy = policy_for(contract_type, field_id, field_policies)
+    started = time.perf_counter()
+
+    if policy != "large":
+        reason = None
+        try:
+            result = await _complete(client, "small", prompts, field_id, user_content, temperature)
+        except json.JSONDecodeError:
+            reason = "invalid_json"
+        except Exception as e:
+            print(f"⚠️ 작은 모델 추출 실패, 큰 모델로 다시 시도합니다 ({contract_type}:{field_id}): {e}")
+            reason = "error"
+        else:
+            if not isinstance(result, dict) or "status" not in result:
+                reason = "invalid_json"
+            elif policy == "tiered" and result.get("status") == "clarify":
+                reason = "clarify"
+            else:
+                routing_stats.record(contract_type, field_id, "small_answered", time.perf_counter() - started)
+                return result
+
+        result = await _complete(client, "large", prompts, field_id, user_content, temperature)
+        routing_stats.record(contract_type, field_id, "escalated", time.perf_counter() - started, reason)
+        return result
+
+    result = await _complete(client, "large", prompts, field_id, user_content, temperature)
+    routing_stats.record(contract_type, field_id, "large_direct", time.perf_counter() - started)
+    return result
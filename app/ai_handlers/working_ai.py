@@ -9,9 +9,15 @@ from openai import AsyncOpenAI
 from docxtpl import DocxTemplate
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import schemas
+from app import crud, schemas
+from app.ai_handlers import fast_extract, model_router
+from app.ai_handlers.extraction_cache import extraction_cache
+from app.ai_handlers.extraction_prompt import PromptBook
+from app.knowledge import generate_answer, knowledge_base
+from app.llm_client import client
 
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# 이 핸들러가 담당하는 계약서 종류 (지식 베이스 네임스페이스로도 사용)
+CONTRACT_TYPE = "근로계약서"
 
 # --- 1. 근로계약서 전용 시나리오 ---
 CONTRACT_SCENARIO= [
@@ -145,43 +151,19 @@ You are an expert assistant specializing in extracting only the essential, core
 
 SIMILARITY_THRESHOLD = 0.6
 
-tip_embeddings: List[np.ndarray] = []
-tip_embeddings_lock = asyncio.Lock()
-
-async def get_tip_embeddings():
-    global tip_embeddings
-    async with tip_embeddings_lock:
-        if not tip_embeddings:
-            resp = await client.embeddings.create(
-                model="text-embedding-3-small",
-                input=TIP_LIST
-            )
-            tip_embeddings = [np.array(d.embedding) for d in resp.data]
-    return tip_embeddings
-
-async def get_embedding(text: str):
-    resp = await client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return np.array(resp.data[0].embedding)
-
-async def find_top_relevant_tips(question: str, top_n=3):
-    embeddings = await get_tip_embeddings()
-    q_emb = await get_embedding(question)
-    sims = [np.dot(q_emb, t) for t in embeddings]
-
-    idx = np.argsort(sims)[-top_n:][::-1]
-    top_score = sims[idx[0]]
-    tips_str = "\n".join([TIP_LIST[i] for i in idx])
-    return tips_str, top_score
-
-async def get_rag_response(question: str, relevant_tips: str) -> str:
-    today = datetime.date.today()
-    current_date_str = today.strftime('%Y년 %m월 %d일')
+# 팁은 공용 지식 베이스(app/knowledge)에 이 계약서 종류의 네임스페이스로 등록합니다.
+# 팁 문구를 수정했다면 `python -m app.knowledge build`로 인덱스를 다시 빌드하세요.
+knowledge_base.register(CONTRACT_TYPE, TIP_LIST)
+
+async def get_rag_response(question: str, relevant_tips: str, include_date: bool = True) -> str:
+    # FAQ 대표 답변(faq-build)은 include_date=False로 만들어 빌드한 날짜에 묶이지 않게 합니다.
+    date_line = ""
+    if include_date:
+        today = datetime.date.today()
+        current_date_str = today.strftime('%Y년 %m월 %d일')
+        date_line = f"오늘은 {current_date_str}입니다.\n"
     system_prompt = f"""
-오늘은 {current_date_str}입니다.
-당신은 근로기준 전문가입니다.
+{date_line}당신은 근로기준 전문가입니다.
 주어진 팁만을 기반으로 답변하세요.
 만약 질문에 대한 답변이 [참고 자료]에 명확히 나와있지 않다면,
        "죄송합니다. 현재 제공된 참고 자료에는 해당 정보가 포함되어 있지 않습니다."라고 솔직하게 답변하세요.
@@ -190,33 +172,95 @@ async def get_rag_response(question: str, relevant_tips: str) -> str:
 {relevant_tips}
 -----------------
 """
-    resp = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": system_prompt},
-                  {"role": "user", "content": question}],
-        temperature=0
-    )
-    return resp.choices[0].message.content.strip()
+    return await generate_answer(system_prompt, question, client)
 
 # --- 2. 근로계약서 전용 AI 추출기 ---
-# (services.py의 get_smart_extraction_for_field 함수를 그대로 가져옴)
-async def get_smart_extraction(
-    client: AsyncOpenAI,
-    field_id: str, 
-    user_message: str, 
-    question: str
-) -> Dict:
+# 형식이 정해진 필드는 LLM 호출 전에 규칙으로 먼저 추출합니다. (app/ai_handlers/fast_extract.py)
+# 반환하는 filled_fields는 아래 퓨샷 예시의 형식과 같아야 합니다.
+def _bonus_fields(field_id: str, paid: bool) -> Dict:
+    fields = {
+        "bonus_yes": paid,
+        "bonus_none": not paid,
+        "is_bonus_paid_yes_o": "O" if paid else " ",
+        "is_bonus_paid_no_o": " " if paid else "O",
+    }
+    if not paid:
+        fields["bonus_amount"] = ""
+    return fields
+
+
+def _bonus_amount_fields(field_id: str, message: str, today: datetime.date) -> Optional[Dict]:
+    # 금액이 입력되면 '상여금 있음'도 함께 체크합니다.
+    filled = fast_extract.amount("bonus_amount", message, today)
+    return {**filled, **_bonus_fields(field_id, True)} if filled else None
+
+
+def _allowance_fields(field_id: str, paid: bool) -> Dict:
+    fields = {
+        "allowance_yes": paid,
+        "other_allowance_none": not paid,
+        "is_allowance_paid_yes_o": "O" if paid else " ",
+        "is_allowance_paid_no_o": " " if paid else "O",
+    }
+    if not paid:
+        fields.update({f"other_allowance_{i}": "" for i in range(1, 5)})
+    return fields
+
+
+def _other_allowance_none(field_id: str, paid: bool) -> Optional[Dict]:
+    # '없음'이면 현재 + 나머지 항목을 비웁니다. (항목/금액 입력은 LLM이 처리)
+    if paid:
+        return None
+    current_num = int(field_id.split('_')[-1])
+    return {f"other_allowance_{i}": "" for i in range(current_num, 5)}
+
+
+def _insurance_fields(field_id: str, joined: bool) -> Dict:
+    return {field_id: joined, f"apply_{field_id}_check": "☑" if joined else "☐"}
+
+
+FAST_RULES = {
+    "business_phone": fast_extract.phone,
+    "employee_phone": fast_extract.phone,
+    "start_time": fast_extract.time_hhmm,
+    "end_time": fast_extract.time_hhmm,
+    "work_day": fast_extract.integer_between(1, 7),
+    "salary_amount": fast_extract.amount_digits,
+    "salary_payment_date": fast_extract.integer_between(1, 31),
+    "bonus": fast_extract.yes_no(_bonus_fields),
+    "bonus_amount": _bonus_amount_fields,
+    "allowance": fast_extract.yes_no(_allowance_fields),
+    "payment_method": fast_extract.choice({
+        r"계좌|통장|이체|은행|입금": {"direct_pay": False, "bank_pay": True, "payment_method_direct_o": " ", "payment_method_bank_o": "O"},
+        r"현금|직접": {"direct_pay": True, "bank_pay": False, "payment_method_direct_o": "O", "payment_method_bank_o": " "},
+    }),
+    **{item["field_id"]: fast_extract.date_full for item in CONTRACT_SCENARIO if item["field_id"].endswith("_date_full")},
+    **{f"other_allowance_{i}": fast_extract.yes_no(_other_allowance_none) for i in range(1, 5)},
+    **{
+        field_id: fast_extract.yes_no(_insurance_fields)
+        for field_id in ["employment_insurance", "industrial_accident_insurance", "national_pension", "health_insurance"]
+    },
+}
+
+
+# 처음부터 큰 모델로 추출할 필드 (나머지는 작은 모델 → 필요할 때만 큰 모델, model_router.py)
+MODEL_POLICY = {
+    "business_address": "large",
+    "employee_address": "large",
+    "work_location": "large",
+    # 항목 + 금액 쌍, 일부만 입력하면 *_item_temp / *_amount_temp로 나눠 저장
+    "other_allowance_*": "large",
+}
+
+def _build_extraction_prompt(field_id: str, question: str) -> str:
     """
-    [근로계약서 AI 스마트 추출기]
-    (services.py에 있던 'get_smart_extraction_for_field'의 내용과 동일)
+    get_smart_extraction의 시스템 프롬프트 (규칙 + 필드별 퓨샷 예시).
+    날짜와 사용자 입력은 넣지 않습니다. question은 CONTRACT_SCENARIO의 해당 필드 질문입니다.
     """
-    
-    today = datetime.date.today()
-    current_year = today.year
     json_format_example = '{"status": "...", "filled_fields": {"key": "value", ...}, "skip_next_n_questions": 0, "follow_up_question": null}'
     base_system_prompt = f"""
     당신은 사용자의 답변에서 핵심 정보를 추출하는 '스마트 폼 어시스턴트'입니다.
-    오늘은 {today.strftime('%Y년 %m월 %d일')}입니다. (현재 연도는 {current_year}년)
+    오늘 날짜는 사용자 메시지 첫 줄의 '오늘:'을 기준으로 합니다.
 
     [규칙]
     1.  사용자의 답변(`user_message`)이 현재 질문(`question`)에 대해 충분하면, `status: "success"`를 반환합니다.
@@ -251,10 +295,10 @@ async def get_smart_extraction(
         user_message: "5월 8일이요."
         AI: {{"status": "clarify", "filled_fields": {{}}, "skip_next_n_questions": 0, "follow_up_question": "네, 좋습니다. 몇 년도 5월 8일 말씀이신가요?"}}
         
-        [예시 2: 날짜 (상대적 표현)]
+        [예시 2: 날짜 (상대적 표현, 오늘이 2025년 03월 07일일 때)]
         question: "{question}"
         user_message: "오늘이요."
-        AI: {{"status": "success", "filled_fields": {{"{field_id}": "{today.strftime('%Y년 %m월 %d일')}"}}, "skip_next_n_questions": 0, "follow_up_question": null}}
+        AI: {{"status": "success", "filled_fields": {{"{field_id}": "2025년 03월 07일"}}, "skip_next_n_questions": 0, "follow_up_question": null}}
 
         [예시 3: 날짜 (형식화)]
         question: "{question}"
@@ -546,24 +590,48 @@ async def get_smart_extraction(
         """
     
 
-    system_prompt_with_examples = f"{base_system_prompt}\n--- [필드별 퓨샷(Few-Shot) 예시] ---\n{specific_examples}"
+    return f"{base_system_prompt}\n--- [필드별 퓨샷(Few-Shot) 예시] ---\n{specific_examples}"
+
+
+# field_id별 시스템 프롬프트를 미리 만들어 둡니다. (프롬프트 캐시 적중용, extraction_prompt.py)
+EXTRACTION_PROMPTS = PromptBook(CONTRACT_TYPE, _build_extraction_prompt, CONTRACT_SCENARIO)
+
+
+# (services.py의 get_smart_extraction_for_field 함수를 그대로 가져옴)
+async def get_smart_extraction(
+    client: AsyncOpenAI,
+    field_id: str, 
+    user_message: str, 
+    question: str
+) -> Dict:
+    """
+    [근로계약서 AI 스마트 추출기]
+    (services.py에 있던 'get_smart_extraction_for_field'의 내용과 동일)
+    """
+    
+    # 전화번호/시간/날짜/숫자/예·아니오처럼 규칙으로 확실히 추출되면 LLM을 호출하지 않습니다.
+    fast = fast_extract.extract(FAST_RULES, field_id, user_message)
+    if fast is not None:
+        return fast
+
+    # 같은 필드에 같은 답변을 이전에 LLM으로 추출한 적 있으면 그 결과를 재사용합니다. (extraction_cache.py)
+    cached = await extraction_cache.get(CONTRACT_TYPE, field_id, user_message)
+    if cached is not None:
+        return cached
     
     try:
         # (⭐️ 핵심 수정 3) 
         # 이 함수는 이제 인자로 받은 'client'를 사용하므로
         # API 키 인증이 완료된 상태로 AI와 통신합니다.
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt_with_examples},
-                {"role": "user", "content": f"question: \"{question}\"\nuser_message: \"{user_message}\""},
-            ],
-            temperature=0.0,
-            response_format={"type": "json_object"}, 
+        # 작은 모델로 먼저 추출하고, 확신이 없으면 큰 모델로 다시 추출합니다. (model_router.py)
+        ai_response_json = await model_router.extract_json(
+            client,
+            EXTRACTION_PROMPTS,
+            field_id,
+            f"question: \"{question}\"\nuser_message: \"{user_message}\"",
+            MODEL_POLICY,
         )
-        
-        ai_response_str = response.choices[0].message.content
-        ai_response_json = json.loads(ai_response_str)
+        await extraction_cache.put(CONTRACT_TYPE, field_id, user_message, ai_response_json)
         return ai_response_json
     except Exception as e:
         # (이제 이 예외 처리는 '인증 오류'가 아닌, 실제 AI의 타임아웃 등에서만 발생합니다)
@@ -642,7 +710,8 @@ async def process_message(
 
     content = contract.content or {}
 
-    new_chat_history = contract.chat_history.copy() if isinstance(contract.chat_history, list) else []
+    # 이번 턴에 추가될 메시지만 담습니다. (services가 chat_messages에 INSERT)
+    new_chat_history: List[Dict[str, Any]] = []
     
     # ✅ 1) 다음 질문 찾기
     current_item, current_index = find_next_question(content)
@@ -654,7 +723,7 @@ async def process_message(
     # ✅ 2) 아무 입력 없으면 "시작/재개"
     if not message.strip() or message.strip() == "string":
         
-        user_has_spoken = any(msg.get("sender") == "user" for msg in new_chat_history)
+        user_has_spoken = await crud.has_user_message(db, contract.id)
 
         # [케이스 A] 사용자가 아직 말을 안 함 (완전 처음) -> 질문만 던짐 (스킵 X)
         if not user_has_spoken:
@@ -730,18 +799,26 @@ async def process_message(
     # 1. AI가 "이건 질문이다"라고 했거나 (rag_required)
     # 2. 기존 유사도 검사에서 점수가 높을 경우
     
+    # 이번 턴의 검색 결과 (유사도 검사와 RAG 답변이 임베딩을 한 번만 계산해 공유)
+    retrieval = knowledge_base.context(CONTRACT_TYPE, message, client)
+
     is_rag = False
     if ai.get("status") == "rag_required":
         is_rag = True
     else:
         # AI가 판단하지 않았더라도, 유사도가 높으면 RAG로 처리 (보조 수단)
-        tips, score = await find_top_relevant_tips(message)
-        if score >= SIMILARITY_THRESHOLD:
+        # 이름/날짜/숫자 같은 폼 답변은 어휘 게이트에서 걸러 임베딩 API를 부르지 않습니다.
+        verdict = knowledge_base.classify(CONTRACT_TYPE, message)
+        if verdict.label == "question":
             is_rag = True
+        elif verdict.label == "ambiguous":
+            tips, score = await retrieval.top_tips()
+            if score >= SIMILARITY_THRESHOLD:
+                is_rag = True
 
     if is_rag:
-        tips, _ = await find_top_relevant_tips(message)
-        rag_answer = await get_rag_response(message, tips)
+        # 비슷한 질문의 답변이 캐시에 있으면 LLM을 호출하지 않습니다. (knowledge/answer_cache.py)
+        rag_answer = await retrieval.answer(get_rag_response)
 
         # RAG 턴 기록
         new_chat_history.append({"sender": "bot", "message": rag_answer})
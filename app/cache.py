@@ -0,0 +1,83 @@
+# app/cache.py
+# 프로세스 내 LRU + TTL 캐시 (토큰 검증 결과 등 재사용 가능한 값을 저장)
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    최대 개수(max_entries)와 만료 시간(TTL)을 함께 갖는 LRU 캐시입니다.
+    - 가득 차면 가장 오래 사용하지 않은 항목부터 제거합니다.
+    - 항목별로 만료 시각(expires_at, epoch 초)을 따로 지정할 수 있습니다.
+    - hit/miss/eviction 횟수를 기록합니다.
+    이벤트 루프 안에서만 사용하므로 별도의 락은 두지 않습니다.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, name: str = "cache"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None):
+        """expires_at이 주어지면 TTL과 비교해 더 이른 시각에 만료시킵니다."""
+        deadline = time.time() + (self.ttl_seconds if ttl is None else ttl)
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        if deadline <= time.time():
+            return
+
+        self._data[key] = (deadline, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def remove_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """조건에 맞는 항목을 모두 제거하고 제거한 개수를 반환합니다."""
+        keys = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
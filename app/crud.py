@@ -1,6 +1,10 @@
+import json
+import base64
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
-from typing import List, Any, Dict
+from sqlalchemy import select, update, delete, insert, exists, func, cast, tuple_, Text
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY, insert as pg_insert
+from typing import List, Any, Dict, Iterable, Optional, Tuple
 from uuid import UUID
 
 from . import models, schemas
@@ -26,26 +30,73 @@ async def get_profile_by_id(db: AsyncSession, user_id: UUID) -> models.Profile |
 #                         계약서 (Contract) with SQLAlchemy
 # =================================================================
 
-async def create_contract(db: AsyncSession, contract: schemas.ContractCreate, user_id: UUID) -> models.Contract:
-    """새로운 계약서를 생성합니다."""
+async def create_contract(
+    db: AsyncSession,
+    contract: schemas.ContractCreate,
+    user_id: UUID,
+    chat_history: List[Dict[str, Any]] | None = None
+) -> models.Contract:
+    """
+    새로운 계약서를 생성합니다.
+    INSERT ... RETURNING 으로 id/created_at/updated_at까지 받아오므로 refresh가 필요 없습니다.
+    (초기 인사말 등 chat_history는 같은 트랜잭션에서 chat_messages에 INSERT합니다.)
+    """
     db_contract = models.Contract(
         contract_type=contract.contract_type,
         owner_id=user_id,
         content={}
     )
     db.add(db_contract)
+    for msg in chat_history or []:
+        db.add(models.ChatMessage(contract=db_contract, sender=msg["sender"], message=msg["message"]))
     await db.commit()
-    await db.refresh(db_contract)
     return db_contract
 
-async def get_contracts_by_owner(db: AsyncSession, user_id: UUID) -> List[models.Contract]:
-    """특정 사용자가 생성한 모든 계약서 목록을 조회합니다."""
-    result = await db.execute(
-        select(models.Contract)
-        .filter(models.Contract.owner_id == user_id)
-        .order_by(models.Contract.updated_at.desc())
+def encode_contract_cursor(updated_at: datetime, contract_id: UUID) -> str:
+    """목록 페이지의 마지막 항목 (updated_at, id)를 URL에 넣을 수 있는 커서 문자열로 만듭니다."""
+    raw = json.dumps([updated_at.isoformat(), str(contract_id)])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_contract_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """커서 문자열을 (updated_at, id)로 되돌립니다. 형식이 잘못되면 ValueError를 발생시킵니다."""
+    try:
+        updated_at_str, contract_id_str = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(updated_at_str), UUID(contract_id_str)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+async def get_contracts_by_owner(
+    db: AsyncSession,
+    user_id: UUID,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    특정 사용자가 생성한 계약서 목록을 최신순으로 조회합니다.
+    - 목록에 필요한 컬럼(id, contract_type, updated_at)만 SELECT 합니다. (content 등 JSON은 읽지 않음)
+    - (updated_at, id) 키셋 커서로 페이지네이션합니다. (ix_contracts_owner_updated 인덱스 사용)
+    - 반환값: (행 목록, 다음 페이지 커서 또는 None)
+    """
+    stmt = (
+        select(models.Contract.id, models.Contract.contract_type, models.Contract.updated_at)
+        .where(models.Contract.owner_id == user_id)
+        .order_by(models.Contract.updated_at.desc(), models.Contract.id.desc())
+        .limit(limit + 1)
     )
-    return result.scalars().all()
+    if cursor:
+        cursor_updated_at, cursor_id = decode_contract_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(models.Contract.updated_at, models.Contract.id) < tuple_(cursor_updated_at, cursor_id)
+        )
+
+    result = await db.execute(stmt)
+    rows = list(result.all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_contract_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows, next_cursor
 
 async def get_contract_by_id(db: AsyncSession, contract_id: UUID, user_id: UUID) -> models.Contract | None:
     """특정 계약서의 상세 정보를 조회합니다."""
@@ -55,45 +106,76 @@ async def get_contract_by_id(db: AsyncSession, contract_id: UUID, user_id: UUID)
     )
     return result.scalar_one_or_none()
 
-async def update_contract_content(db: AsyncSession, contract: models.Contract, field_id: str, value: Any) -> models.Contract:
-    """특정 계약서의 content 필드를 업데이트합니다."""
-    #current_content = contract.content or {}
-    current_content = dict(contract.content) if contract.content else {}
-    current_content[field_id] = value
-    
-    """stmt = (
+async def _update_contract_returning(db: AsyncSession, contract_id: UUID, **values: Any) -> models.Contract:
+    """
+    UPDATE ... RETURNING 한 문장으로 계약서를 수정하고, 수정된 행을 그대로 돌려받습니다.
+    (UPDATE → COMMIT → SELECT → REFRESH 로 4번 왕복하던 것을 1번으로 줄임)
+    populate_existing 옵션으로 세션에 이미 올라와 있는 객체도 최신 값으로 덮어씁니다.
+    """
+    stmt = (
         update(models.Contract)
-        .where(models.Contract.id == contract.id)
-        .values(content=current_content)
+        .where(models.Contract.id == contract_id)
+        .values(**values)
+        .returning(models.Contract)
+        .execution_options(populate_existing=True)
     )
-    await db.execute(stmt)
+    result = await db.execute(stmt)
+    updated_contract = result.scalar_one()
     await db.commit()
-    await db.refresh(contract)"""
-    
-    contract.content = current_content
-    db.add(contract)
+    return updated_contract
+
+def _patched_content(set_fields: Dict[str, Any], remove_keys: Iterable[str] = ()):
+    """
+    content를 서버에서 부분 수정하는 SQL 식을 만듭니다.
+        (COALESCE(content, '{}') - remove_keys::text[]) || set_fields::jsonb
+    바뀐 키만 전송하므로 페이로드/WAL 크기가 수정량에 비례하고,
+    서로 다른 필드를 동시에 수정해도 덮어쓰지 않습니다.
+    """
+    expr = func.coalesce(models.Contract.content, cast({}, JSONB))
+    remove_keys = list(remove_keys)
+    if remove_keys:
+        expr = expr.op("-", return_type=JSONB)(cast(remove_keys, ARRAY(Text)))
+    if set_fields:
+        expr = expr.op("||", return_type=JSONB)(cast(set_fields, JSONB))
+    return expr
+
+async def patch_contract_content(
+    db: AsyncSession,
+    contract_id: UUID,
+    set_fields: Dict[str, Any],
+    remove_keys: Iterable[str] = (),
+    owner_id: Optional[UUID] = None
+) -> models.Contract | None:
+    """
+    content의 일부 키만 서버 측(jsonb ||, -)에서 병합/삭제합니다.
+    owner_id를 주면 소유권 검사도 같은 UPDATE에서 처리하며, 대상이 없으면 None을 반환합니다.
+    """
+    stmt = (
+        update(models.Contract)
+        .where(models.Contract.id == contract_id)
+        .values(content=_patched_content(set_fields, remove_keys))
+        .returning(models.Contract)
+        .execution_options(populate_existing=True)
+    )
+    if owner_id is not None:
+        stmt = stmt.where(models.Contract.owner_id == owner_id)
+
+    result = await db.execute(stmt)
+    updated_contract = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(contract)
-    
-    return contract
+    return updated_contract
+
+async def update_contract_content(db: AsyncSession, contract: models.Contract, field_id: str, value: Any) -> models.Contract:
+    """특정 계약서의 content 필드를 업데이트합니다."""
+    return await patch_contract_content(db, contract.id, {field_id: value})
 
 async def update_contract_content_multiple(db: AsyncSession, contract: models.Contract, fields_to_update: Dict[str, Any]) -> models.Contract:
     """
     AI가 반환한 여러 필드를 계약서 content에 한 번에 병합(merge)하여 업데이트합니다.
+    (예: 'is_bonus_paid_no_o'와 'bonus_amount' 동시 저장)
+    병합은 DB에서 jsonb || 로 수행하므로 전체 content를 읽어서 다시 쓰지 않습니다.
     """
-    # 1. DB에서 현재 content를 가져옵니다 (불변성 유지를 위해 복사)
-    current_content = dict(contract.content) if contract.content else {}
-    
-    # 2. AI가 새로 채운 필드들을 덮어씁니다. (예: 'is_bonus_paid_no_o'와 'bonus_amount' 동시 저장)
-    current_content.update(fields_to_update)
-    
-    # 3. DB에 반영합니다.
-    contract.content = current_content
-    db.add(contract)
-    await db.commit()
-    await db.refresh(contract)
-    
-    return contract
+    return await patch_contract_content(db, contract.id, fields_to_update)
 
 async def delete_contract(db: AsyncSession, contract: models.Contract):
     """
@@ -110,30 +192,31 @@ async def delete_contract(db: AsyncSession, contract: models.Contract):
     await db.commit()
     return None
 
-async def update_contract(db: AsyncSession, contract_id: UUID, new_content: Dict[str, Any], new_chat_history: List[Dict[str, Any]]) -> models.Contract:
+async def update_contract(
+    db: AsyncSession,
+    contract_id: UUID,
+    content_patch: Dict[str, Any],
+    removed_keys: Iterable[str],
+    new_messages: List[Dict[str, Any]]
+) -> models.Contract:
     """
-    계약서 content 전체를 덮어써서 업데이트하는 함수
+    채팅 한 턴의 결과를 저장하는 함수
     services.py의 process_chat_message()가 호출함
+    - content: 이번 턴에 바뀐 키(content_patch)와 삭제된 키(removed_keys)만 서버에서 병합
+    - 채팅: 이번 턴에 추가된 메시지만 chat_messages에 INSERT (기존 기록은 다시 쓰지 않음)
     """
     stmt = (
         update(models.Contract)
         .where(models.Contract.id == contract_id)
-        .values(content=new_content, chat_history=new_chat_history)
-        .execution_options(synchronize_session="fetch")
+        .values(content=_patched_content(content_patch, removed_keys))
+        .returning(models.Contract)
+        .execution_options(populate_existing=True)
     )
-
-    await db.execute(stmt)
-    await db.commit()
-
-    '''updated = await db.get(models.Contract, contract_id)
-    return updated'''
-    query = select(models.Contract).where(models.Contract.id == contract_id)
-    result = await db.execute(query)
+    result = await db.execute(stmt)
     updated_contract = result.scalar_one()
-    
-    # 3. 데이터 새로고침 (이 과정이 없으면 직렬화 시 에러가 날 수 있음)
-    await db.refresh(updated_contract)
 
+    await append_chat_messages(db, contract_id, new_messages)
+    await db.commit()
     return updated_contract
 
 async def update_contract_status(
@@ -144,14 +227,109 @@ async def update_contract_status(
     """
     특정 계약서의 'status' 필드만 업데이트합니다.
     """
-    # 1. SQLAlchemy 모델 객체의 상태를 직접 변경
-    db_contract.status = status
-    
-    # 2. 변경 사항을 DB에 커밋(저장)
+    return await _update_contract_returning(db, db_contract.id, status=status)
+
+# =================================================================
+#                         채팅 메시지 (ChatMessage)
+# =================================================================
+
+async def append_chat_messages(db: AsyncSession, contract_id: UUID, messages: List[Dict[str, Any]]):
+    """
+    메시지를 chat_messages에 추가합니다. (커밋은 호출한 쪽에서 합니다)
+    """
+    if not messages:
+        return
+    await db.execute(
+        insert(models.ChatMessage),
+        [
+            {"contract_id": contract_id, "sender": msg["sender"], "message": msg["message"]}
+            for msg in messages
+        ]
+    )
+
+async def get_chat_messages(
+    db: AsyncSession,
+    contract_id: UUID,
+    before_seq: Optional[int] = None,
+    limit: int = 50
+) -> Tuple[List[models.ChatMessage], Optional[int]]:
+    """
+    채팅 기록을 최신순으로 limit개 가져와 시간순으로 돌려줍니다. (키셋 페이지네이션)
+    - 소유자 확인은 하지 않습니다. 호출 전에 contract_belongs_to 등으로 확인하세요.
+    - before_seq: 이 seq보다 이전 메시지만 조회 (이전 페이지의 next_cursor)
+    - 반환값: (메시지 목록, 다음 페이지 커서 또는 None)
+    """
+    stmt = (
+        select(models.ChatMessage)
+        .where(models.ChatMessage.contract_id == contract_id)
+        .order_by(models.ChatMessage.seq.desc())
+        .limit(limit + 1)
+    )
+    if before_seq is not None:
+        stmt = stmt.where(models.ChatMessage.seq < before_seq)
+    result = await db.execute(stmt)
+    rows = list(result.scalars().all())
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    next_cursor = rows[0].seq if (has_more and rows) else None
+    return rows, next_cursor
+
+async def contract_belongs_to(db: AsyncSession, contract_id: UUID, user_id: UUID) -> bool:
+    """계약서가 존재하고 해당 사용자의 것인지 확인합니다. (content를 읽지 않는 가벼운 조회)"""
+    stmt = select(
+        exists().where(
+            models.Contract.id == contract_id,
+            models.Contract.owner_id == user_id
+        )
+    )
+    result = await db.execute(stmt)
+    return bool(result.scalar())
+
+async def has_user_message(db: AsyncSession, contract_id: UUID) -> bool:
+    """사용자가 한 번이라도 메시지를 보냈는지 확인합니다."""
+    stmt = select(
+        exists().where(
+            models.ChatMessage.contract_id == contract_id,
+            models.ChatMessage.sender == "user"
+        )
+    )
+    result = await db.execute(stmt)
+    return bool(result.scalar())
+
+
+# =================================================================
+#   Idempotency-Key 응답 저장소
+# =================================================================
+async def get_idempotency_record(db: AsyncSession, key: str) -> Optional[models.IdempotencyKey]:
+    """만료되지 않은 저장 응답을 조회합니다."""
+    stmt = select(models.IdempotencyKey).where(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.expires_at > func.now()
+    )
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def save_idempotency_record(
+    db: AsyncSession, key: str, fingerprint: str, response: Any, ttl_seconds: float
+):
+    """
+    응답을 저장합니다. 같은 키의 행이 이미 있으면 만료된 경우에만 덮어씁니다.
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    stmt = pg_insert(models.IdempotencyKey).values(
+        key=key, fingerprint=fingerprint, response=response, expires_at=expires_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.IdempotencyKey.key],
+        set_={
+            "fingerprint": stmt.excluded.fingerprint,
+            "response": stmt.excluded.response,
+            "created_at": func.now(),
+            "expires_at": stmt.excluded.expires_at,
+        },
+        where=models.IdempotencyKey.expires_at <= func.now(),
+    )
+    await db.execute(stmt)
     await db.commit()
-    
-    # 3. DB로부터 최신 상태를 다시 읽어옴 (선택 사항이지만 권장됨)
-    await db.refresh(db_contract)
-    
-    # 4. 업데이트된 계약서 객체 반환
-    return db_contract
\ No newline at end of file
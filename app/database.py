@@ -1,10 +1,18 @@
 import os
+import asyncio
+import time
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 from uuid import uuid4
 from sqlalchemy.pool import NullPool # NullPool import 필요
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from . import metrics
 
 # .env 파일에서 환경 변수를 로드합니다.
 load_dotenv()
@@ -56,22 +64,220 @@ def get_unique_statement_name():
     return f"__asyncpg_{uuid4().hex}__"
 
 
-# SQLAlchemy 엔진은 한 번만 생성하며, 두 가지 해결책을 모두 적용해야 합니다.
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={
+# =================================================================
+#   연결 모드 (direct / session pooler / transaction pooler)
+# =================================================================
+# Prepared statement 캐시를 끄는 우회책은 트랜잭션 모드 풀러(PgBouncer, Supavisor :6543) 뒤에서만 필요합니다.
+# 직접 연결이나 세션 모드 풀러에서는 캐시를 켜서 파싱/플랜을 재사용합니다.
+#   DB_CONNECTION_MODE=auto(기본값) | direct | session | transaction
+DB_CONNECTION_MODE = os.getenv("DB_CONNECTION_MODE", "auto").lower()
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+CONNECTION_MODES = ("direct", "session", "transaction")
+
+
+def detect_connection_mode(database_url: str) -> str:
+    """DATABASE_URL의 호스트/포트로 연결 모드를 추정합니다."""
+    url = make_url(database_url)
+    host = url.host or ""
+    port = url.port or 5432
+
+    if str(url.query.get("pgbouncer", "")).lower() == "true":
+        return "transaction"
+    if "pooler.supabase.com" in host:
+        # Supavisor: 6543 = 트랜잭션 모드, 5432 = 세션 모드
+        return "transaction" if port == 6543 else "session"
+    if port == 6543:
+        return "transaction"
+    return "direct"
+
+
+def resolve_connection_mode(database_url: str) -> str:
+    if DB_CONNECTION_MODE == "auto":
+        return detect_connection_mode(database_url)
+    if DB_CONNECTION_MODE not in CONNECTION_MODES:
+        raise ValueError(f"DB_CONNECTION_MODE는 auto/{'/'.join(CONNECTION_MODES)} 중 하나여야 합니다: {DB_CONNECTION_MODE}")
+    return DB_CONNECTION_MODE
+
+
+CONNECTION_MODE = resolve_connection_mode(SQLALCHEMY_DATABASE_URL)
+
+# ?pgbouncer=true는 모드 감지에만 쓰는 표시입니다. URL에 남겨 두면 asyncpg.connect(pgbouncer='true')로
+# 넘어가 TypeError가 나므로 엔진 URL에서는 뺍니다.
+_ENGINE_BASE_URL = make_url(SQLALCHEMY_DATABASE_URL).difference_update_query(["pgbouncer"])
+
+if CONNECTION_MODE == "transaction":
+    # 트랜잭션 모드 풀러: 같은 세션이 다른 서버 커넥션을 받을 수 있으므로 모든 캐시를 끕니다.
+    STATEMENT_CACHE_ENABLED = False
+    CONNECT_ARGS = {
         "statement_cache_size": 0, # 캐시 비활성화
         "prepared_statement_name_func": get_unique_statement_name, # 고유 이름 부여 (Supabase에서 필수)
-    },
-    echo = True,
-    pool_timeout = 30,
-    pool_size=2,
-    max_overflow=0,
+    }
+    # SQLAlchemy asyncpg 드라이버 자체의 prepared statement 캐시도 끕니다.
+    ENGINE_URL = _ENGINE_BASE_URL.update_query_dict({"prepared_statement_cache_size": "0"})
+else:
+    STATEMENT_CACHE_ENABLED = DB_STATEMENT_CACHE_SIZE > 0
+    CONNECT_ARGS = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    ENGINE_URL = _ENGINE_BASE_URL
+
+
+def describe_connection_mode() -> str:
+    """시작 로그에 출력할 연결 설정 요약"""
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    cache = f"on (size={DB_STATEMENT_CACHE_SIZE})" if STATEMENT_CACHE_ENABLED else "off"
+    source = "auto-detected" if DB_CONNECTION_MODE == "auto" else "configured"
+    return (
+        f"DB connection mode={CONNECTION_MODE} ({source}), "
+        f"host={url.host}:{url.port or 5432}, prepared statement cache={cache}"
+    )
+
+
+# =================================================================
+#   커넥션 풀 설정
+# =================================================================
+# DB_MAX_CONNECTIONS는 이 앱 전체(모든 워커)가 쓸 수 있는 커넥션 예산입니다.
+# 워커(WEB_CONCURRENCY)마다 엔진이 따로 생기므로 예산을 워커 수로 나눠 풀 크기를 정합니다.
+# DB_POOL_SIZE / DB_MAX_OVERFLOW를 직접 지정하면 그 값을 우선합니다.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_ECHO = os.getenv("DB_ECHO", "true").lower() == "true"
+
+
+def derive_pool_size(max_connections: int, workers: int) -> tuple[int, int]:
+    """워커당 (pool_size, max_overflow)를 계산합니다. 예산의 약 3/4은 상주, 나머지는 overflow."""
+    per_worker = max(2, max_connections // workers)
+    pool_size = max(1, (per_worker * 3) // 4)
+    return pool_size, per_worker - pool_size
+
+
+_derived_size, _derived_overflow = derive_pool_size(DB_MAX_CONNECTIONS, WEB_CONCURRENCY)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_derived_size)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(_derived_overflow)))
+# 시작 시 미리 열어 둘 커넥션 수 (기본값: pool_size 전체)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+
+class PoolStats:
+    """풀 대기/체크아웃 지표"""
+
+    def __init__(self):
+        self.waiting = 0          # 지금 커넥션을 기다리는 요청 수 (유휴 커넥션도, 새로 열 여유도 없을 때만)
+        self.max_waiting = 0
+        self.checkouts = 0
+        self.waited = 0           # 체크아웃 중 큐에서 기다려야 했던 횟수
+        self.timeouts = 0         # pool_timeout 초과로 실패한 횟수
+        self.wait_seconds = metrics.Histogram()  # 큐에서 막혀 있던 시간만 (커넥션 여는 시간 제외)
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """커넥션이 반납되기를 기다린 시간과 대기 중인 요청 수를 기록하는 풀"""
+
+    def _must_wait(self) -> bool:
+        # 유휴 커넥션이 없고 overflow까지 다 써서 새로 열 수도 없으면 QueuePool은 큐에서 기다립니다.
+        return self._pool.empty() and -1 < self._max_overflow <= self._overflow
+
+    def _do_get(self):
+        if not self._must_wait():
+            # 유휴 커넥션을 바로 꺼내거나 새로 여는 경우: 대기로 세지 않습니다.
+            conn = super()._do_get()
+            pool_stats.checkouts += 1
+            return conn
+
+        pool_stats.waiting += 1
+        pool_stats.waited += 1
+        pool_stats.max_waiting = max(pool_stats.max_waiting, pool_stats.waiting)
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+            pool_stats.checkouts += 1
+            return conn
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiting -= 1
+            pool_stats.wait_seconds.observe(time.perf_counter() - started)
+
+
+# SQLAlchemy 엔진은 한 번만 생성합니다.
+engine = create_async_engine(
+    ENGINE_URL,
+    connect_args=CONNECT_ARGS,
+    echo = DB_ECHO,
+    poolclass=InstrumentedQueuePool,
+    pool_timeout = DB_POOL_TIMEOUT,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
     pool_pre_ping=True,
-    pool_recycle=300
+    pool_recycle=DB_POOL_RECYCLE
     #poolclass=NullPool
 )
 
+
+def pool_metrics() -> dict:
+    pool = engine.pool
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "workers": WEB_CONCURRENCY,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "waiting": pool_stats.waiting,
+        "max_waiting": pool_stats.max_waiting,
+        "checkouts": pool_stats.checkouts,
+        "waited": pool_stats.waited,
+        "timeouts": pool_stats.timeouts,
+        "wait_seconds": pool_stats.wait_seconds.snapshot(),
+    }
+
+
+metrics.register("db_pool", pool_metrics)
+
+
+def describe_pool() -> str:
+    return (
+        f"DB pool size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW}, timeout={DB_POOL_TIMEOUT}s "
+        f"(budget={DB_MAX_CONNECTIONS}, workers={WEB_CONCURRENCY})"
+    )
+
+
+async def warm_up_pool(count: int = DB_POOL_WARMUP) -> int:
+    """
+    커넥션을 count개 동시에 열어 SELECT 1을 실행한 뒤 풀에 반납합니다.
+    첫 요청들이 TCP/TLS/인증 비용을 떠안지 않도록 시작 시 호출합니다.
+    열린 커넥션 수를 반환합니다 (실패는 로그만 남깁니다).
+    """
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0:
+        return 0
+
+    async def _open():
+        conn = await engine.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    # 모두 연 다음에 반납해야 같은 커넥션이 재사용되지 않고 서로 다른 커넥션이 만들어집니다.
+    results = await asyncio.gather(*(_open() for _ in range(count)), return_exceptions=True)
+    opened = 0
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"⚠️ DB 커넥션 예열 실패: {result}")
+            continue
+        await result.close()
+        opened += 1
+    return opened
+
+
 '''
 engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
 # connect_args를 추가하여 prepared statement 캐시를 비활성화합니다.
@@ -1,17 +1,138 @@
+import os
+import time
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
 from fastapi import Depends, HTTPException, status
 # ❗️ 변경점: OAuth2PasswordBearer 대신 HTTPBearer와 HTTPAuthorizationCredentials를 import
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import crud, models
+from . import crud, metrics, models
+from .cache import TTLCache
 from .database import get_db, supabase_client  # supabase_client도 import합니다
 # security.py에서 JWT 관련 설정을 모두 가져옵니다.
 from .security import ALGORITHM, SECRET_KEY
+from .security import (
+    AUTH_VERIFY_MODE,
+    LocalVerificationUnavailable,
+    SupabaseTokenError,
+    user_from_claims,
+    verify_supabase_jwt,
+)
 
 # ❗️ 변경점: oauth2_scheme 대신 bearer_scheme을 사용합니다.
 bearer_scheme = HTTPBearer()
 
+# 만료/위조 토큰은 흔한 일이라 stdout에 찍지 않고 debug 로그로만 남깁니다.
+logger = logging.getLogger(__name__)
+
+# =================================================================
+#   검증된 토큰 캐시 (같은 토큰으로 반복되는 채팅 요청은 재검증하지 않음)
+# =================================================================
+# - key: 토큰의 sha256 해시 (원문 토큰은 메모리에 두지 않습니다)
+# - 만료: min(TTL, 토큰의 exp)
+token_cache = TTLCache(
+    max_entries=int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300")),
+    name="auth_token",
+)
+metrics.register("auth_token_cache", token_cache.stats)
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+# =================================================================
+#   로그아웃(취소)된 토큰 목록
+# =================================================================
+# 로컬 검증은 서명/exp만 보므로, 로그아웃한 토큰도 exp 전까지는 다시 통과합니다.
+# 그래서 캐시 조회와 로컬 검증보다 먼저 이 목록을 확인합니다. (프로세스 내부, 워커마다 따로 보관)
+# - 토큰 해시 -> 그 토큰의 exp까지 거부
+# - 사용자(sub) / 세션(session_id) -> 로그아웃 시각 이전에 발급된(iat) 토큰을 거부
+#   (이미 발급된 토큰이 모두 만료될 때까지, 즉 로그아웃 시각 + 토큰 최대 수명까지 보관)
+AUTH_TOKEN_MAX_LIFETIME_SECONDS = float(os.getenv("AUTH_TOKEN_MAX_LIFETIME_SECONDS", "3600"))
+
+
+class RevocationList:
+    def __init__(self, max_lifetime: float = AUTH_TOKEN_MAX_LIFETIME_SECONDS):
+        self.max_lifetime = max_lifetime
+        self._tokens: Dict[str, float] = {}                  # 토큰 해시 -> 보관 기한(exp)
+        self._subjects: Dict[str, Tuple[float, float]] = {}  # "sub:<id>" / "session:<id>" -> (로그아웃 시각, 보관 기한)
+        self.rejected = 0
+
+    def _purge(self, now: float):
+        self._tokens = {k: until for k, until in self._tokens.items() if until > now}
+        self._subjects = {k: v for k, v in self._subjects.items() if v[1] > now}
+
+    def revoke_token(self, token_key: str, exp: Optional[float]):
+        now = time.time()
+        self._purge(now)
+        self._tokens[token_key] = exp if exp else now + self.max_lifetime
+
+    def revoke_subject(self, key: str, until: Optional[float] = None):
+        now = time.time()
+        self._purge(now)
+        self._subjects[key] = (now, max(until or 0, now + self.max_lifetime))
+
+    def is_revoked(self, token: str, token_key: str) -> bool:
+        now = time.time()
+        until = self._tokens.get(token_key)
+        if until is not None and until > now:
+            self.rejected += 1
+            return True
+        if not self._subjects:
+            return False
+        try:
+            claims = jwt.get_unverified_claims(token)
+        except JWTError:
+            return False  # 형식이 잘못된 토큰은 이어지는 검증에서 거부됩니다.
+        issued_at = claims.get("iat") or 0
+        for key in (f"sub:{claims.get('sub')}", f"session:{claims.get('session_id')}"):
+            entry = self._subjects.get(key)
+            if entry is not None and entry[1] > now and issued_at <= entry[0]:
+                self.rejected += 1
+                return True
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "subjects": len(self._subjects), "rejected": self.rejected}
+
+
+revocations = RevocationList()
+metrics.register("auth_revocations", revocations.stats)
+
+
+def unverified_exp(token: str) -> Optional[float]:
+    try:
+        return jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        return None
+
+
+def revoke_token(token: str):
+    """특정 토큰을 exp까지 거부하고 캐시에서 제거합니다. (로그아웃 등)"""
+    cache_key = _token_key(token)
+    revocations.revoke_token(cache_key, unverified_exp(token))
+    token_cache.pop(cache_key)
+
+
+def revoke_session(session_id: str, until: Optional[float] = None):
+    """해당 세션에서 지금까지 발급된 토큰을 모두 거부합니다."""
+    revocations.revoke_subject(f"session:{session_id}", until)
+
+
+def revoke_user(user_id: str, until: Optional[float] = None) -> int:
+    """
+    해당 사용자에게 지금까지 발급된 토큰을 모두 거부하고 캐시에서 제거합니다. (전역 로그아웃, 계정 정지 등)
+    until: 이 시각까지는 반드시 보관 (보통 로그아웃 요청 토큰의 exp)
+    """
+    revocations.revoke_subject(f"sub:{user_id}", until)
+    return token_cache.remove_where(lambda _, user: user.get("id") == str(user_id))
+
 '''async def verify_supabase_token(
     # ❗️ 변경점: 이 함수도 일관성을 위해 bearer_scheme을 사용하도록 수정
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
@@ -40,36 +161,52 @@ async def verify_supabase_token(
 ):
     """
     Supabase 클라이언트를 위한 JWT 토큰 검증 의존성.
+    - AUTH_VERIFY_MODE="local" (기본값): JWT secret / JWKS로 로컬 검증합니다.
+    - 로컬에서 판단할 수 없을 때만 supabase_client.auth.get_user로 폴백합니다.
     """
-    # --- 디버깅 코드 시작 ---
-    #print("=========================================================")
-    #print(">>> DEBUG: 'verify_supabase_token' 함수가 호출되었습니다.")
-    # --- 디버깅 코드 끝 ---
-
     token = credentials.credentials
+    cache_key = _token_key(token)
+
+    # 로그아웃한 토큰은 캐시나 로컬 검증(서명/exp)으로 다시 통과하지 않도록 가장 먼저 확인합니다.
+    if revocations.is_revoked(token, cache_key):
+        token_cache.pop(cache_key)
+        raise _credentials_exception()
+
+    cached_user = token_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user
+
+    if AUTH_VERIFY_MODE == "local":
+        try:
+            claims = await verify_supabase_jwt(token)
+            user = user_from_claims(claims)
+            token_cache.set(cache_key, user, expires_at=claims.get("exp"))
+            return user
+        except SupabaseTokenError as e:
+            logger.debug("로컬 토큰 검증 실패: %s", e)
+            raise _credentials_exception()
+        except LocalVerificationUnavailable as e:
+            logger.debug("로컬 검증 불가, get_user로 폴백합니다: %s", e)
 
-    # --- 디버깅 코드 시작 ---
-    # 토큰이 너무 길기 때문에 앞 30자만 출력해봅니다.
-    #print(f">>> DEBUG: 서버가 받은 토큰 (앞 30자): {token[:30]}...")
-    # --- 디버깅 코드 끝 ---
     try:
-        user_response = supabase_client.auth.get_user(token)
-        
-        # --- 디버깅 코드 시작 ---
-        #print(f">>> DEBUG: Supabase 응답 성공! User: {user_response.user.email if user_response.user else '없음'}")
-        # --- 디버깅 코드 끝 ---
+        # get_user는 동기 HTTP 호출이므로 이벤트 루프를 막지 않도록 스레드풀에서 실행합니다.
+        user_response = await run_in_threadpool(supabase_client.auth.get_user, token)
 
         if not user_response.user:
             raise Exception("User not found for the provided token.")
-        return user_response.user.dict()
+        user = user_response.user.dict()
     except Exception as e:
-        # --- 디버깅 코드 시작 ---
-        print(f">>> DEBUG: 'verify_supabase_token' 함수에서 예외 발생: {e}")
-        print("=========================================================")
-        # --- 디버깅 코드 끝 ---
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid Supabase authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        logger.debug("get_user 토큰 검증 실패: %s", e)
+        raise _credentials_exception()
+
+    # 원격 검증에 성공한 토큰도 exp까지만 캐시합니다.
+    token_cache.set(cache_key, user, expires_at=unverified_exp(token))
+    return user
+
 
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid Supabase authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
@@ -0,0 +1,121 @@
+# app/idempotency.py
+# Idempotency-Key 헤더 처리: 재시도 요청에 저장된 응답을 그대로 돌려줍니다.
+import os
+import json
+import hashlib
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, metrics
+from .cache import TTLCache
+from .turn_queue import TurnQueue
+
+# memory: 워커 프로세스 메모리 (재시작/다른 워커에는 공유되지 않음)
+# db: idempotency_keys 테이블 (migrations/004_idempotency_keys.sql)
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+if IDEMPOTENCY_BACKEND not in ("memory", "db"):
+    raise ValueError(f"IDEMPOTENCY_BACKEND는 memory 또는 db여야 합니다: {IDEMPOTENCY_BACKEND}")
+
+
+class IdempotencyKeyReused(Exception):
+    """같은 Idempotency-Key가 내용이 다른 요청에 다시 사용되었을 때"""
+
+
+def request_fingerprint(body: Any) -> str:
+    payload = json.dumps(jsonable_encoder(body), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.cache = TTLCache(
+            max_entries=IDEMPOTENCY_MAX_ENTRIES,
+            ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+            name="idempotency",
+        )
+
+    async def get(self, db: AsyncSession, key: str) -> Optional[Tuple[str, Any]]:
+        return self.cache.get(key)
+
+    async def save(self, db: AsyncSession, key: str, fingerprint: str, response: Any):
+        self.cache.set(key, (fingerprint, response))
+
+
+class DatabaseBackend:
+    async def get(self, db: AsyncSession, key: str) -> Optional[Tuple[str, Any]]:
+        record = await crud.get_idempotency_record(db, key)
+        return (record.fingerprint, record.response) if record else None
+
+    async def save(self, db: AsyncSession, key: str, fingerprint: str, response: Any):
+        await crud.save_idempotency_record(db, key, fingerprint, response, IDEMPOTENCY_TTL_SECONDS)
+
+
+class IdempotencyStore:
+    """
+    (사용자, 범위, 키) 단위로 응답을 저장하고 재시도에 재사용합니다.
+    - 같은 키의 요청은 한 번에 하나씩 처리합니다. 원래 요청이 아직 처리 중일 때 온 재시도는
+      그 결과를 함께 받고, 끝난 뒤에 온 재시도는 저장된 응답을 받습니다.
+    - 성공한 응답만 저장하므로 실패한 요청은 같은 키로 다시 시도할 수 있습니다.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._queue = TurnQueue(max_depth=IDEMPOTENCY_MAX_ENTRIES, name="idempotency")
+        self.stored = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    async def run(
+        self,
+        db: AsyncSession,
+        user_id: Any,
+        scope: str,
+        key: str,
+        body: Any,
+        work: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """(JSON으로 변환된 응답, 저장된 응답을 재사용했는지)를 반환합니다."""
+        storage_key = f"{user_id}:{scope}:{key}"
+        fingerprint = request_fingerprint(body)
+
+        async def attempt():
+            stored = await self.backend.get(db, storage_key)
+            if stored is not None:
+                stored_fingerprint, response = stored
+                if stored_fingerprint != fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyKeyReused(key)
+                self.replayed += 1
+                return response, True
+
+            response = jsonable_encoder(await work())
+            await self.backend.save(db, storage_key, fingerprint, response)
+            self.stored += 1
+            return response, False
+
+        return await self._queue.submit(key=storage_key, work=attempt, dedupe_key=fingerprint)
+
+    def stats(self) -> dict:
+        result = {
+            "backend": IDEMPOTENCY_BACKEND,
+            "ttl_seconds": IDEMPOTENCY_TTL_SECONDS,
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "coalesced": self._queue.coalesced,
+        }
+        if isinstance(self.backend, MemoryBackend):
+            result["cache"] = self.backend.cache.stats()
+        return result
+
+
+idempotency_store = IdempotencyStore(
+    DatabaseBackend() if IDEMPOTENCY_BACKEND == "db" else MemoryBackend()
+)
+metrics.register("idempotency", idempotency_store.stats)
@@ -0,0 +1,21 @@
+# app/knowledge
+# 문서 핸들러들이 공유하는 팁 지식 베이스 (인덱스 저장/로드, 검색, 답변 생성)
+from app.knowledge.base import KnowledgeBase, RetrievalContext, SearchHit, knowledge_base
+from app.knowledge.answer import RAG_MODEL, answer_tokens, generate_answer
+from app.knowledge.answer_cache import answer_cache
+from app.knowledge.faq import faq_store
+from app.knowledge.retrieval import embed_query, query_embedding_cache
+
+__all__ = [
+    "KnowledgeBase",
+    "RetrievalContext",
+    "SearchHit",
+    "knowledge_base",
+    "RAG_MODEL",
+    "answer_tokens",
+    "generate_answer",
+    "answer_cache",
+    "faq_store",
+    "embed_query",
+    "query_embedding_cache",
+]
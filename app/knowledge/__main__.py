@@ -0,0 +1,138 @@
+# 지식 베이스 인덱스 빌드 / 상태 확인
+#   python -m app.knowledge status
+#   python -m app.knowledge build [--force] [--prune]
+#   python -m app.knowledge faq-build [--force] [--prune]   (LLM 호출, 팁 문구를 바꾼 뒤에만)
+#   python -m app.knowledge ann-build [--nlist N] [--prune]  (API 호출 없음, build 이후)
+#   python -m app.knowledge ann-bench [--synthetic N] [--queries Q] [--top-n K]
+import sys
+import asyncio
+import importlib
+
+import numpy as np
+
+from app.knowledge import ann, faq
+from app.knowledge import index as index_store
+from app.knowledge.base import knowledge_base
+
+HANDLER_MODULES = (
+    "app.ai_handlers.working_ai",
+    "app.ai_handlers.foreign_ai",
+    "app.ai_handlers.house_ai",
+    "app.ai_handlers.attorney_ai",
+)
+
+
+def _register_all():
+    """핸들러를 import해 팁을 등록하고, 네임스페이스 -> get_rag_response를 돌려줍니다."""
+    generators = {}
+    for module in HANDLER_MODULES:
+        handler = importlib.import_module(module)
+        generators[handler.CONTRACT_TYPE] = handler.get_rag_response
+    return generators
+
+
+def _status():
+    npy_path, _ = index_store.index_paths(knowledge_base.version)
+    state = "최신" if npy_path.exists() else "빌드 필요"
+    print(f"인덱스: {npy_path.name} ({state})")
+    for ns in knowledge_base.namespaces:
+        print(f"  - {ns}: 팁 {len(knowledge_base.tips(ns))}개")
+    faq_path, _ = faq.faq_paths(faq.faq_version(knowledge_base.namespace_hashes()))
+    print(f"FAQ: {faq_path.name} ({'최신' if faq_path.exists() else '빌드 필요'})")
+    ann_path = ann.ann_path(ann.ann_version(knowledge_base.version))
+    rows = sum(len(knowledge_base.tips(ns)) for ns in knowledge_base.namespaces)
+    if rows >= ann.ANN_MIN_ROWS:
+        print(f"ANN: {ann_path.name} ({'최신' if ann_path.exists() else '빌드 필요'})")
+    else:
+        print(f"ANN: 사용 안 함 (팁 {rows}개 < ANN_MIN_ROWS {ann.ANN_MIN_ROWS}, 전체 채점)")
+
+
+async def _build(force: bool, prune: bool):
+    from app.llm_client import client
+
+    if force or not knowledge_base.load():
+        await knowledge_base.build(client, reuse=not force)
+    print(f"✅ {index_store.index_paths(knowledge_base.version)[0].name}")
+    if prune:
+        for old in index_store.stale_files(knowledge_base.version):
+            old.unlink()
+            print(f"🗑️ 이전 버전 삭제 {old.name}")
+
+
+async def _build_faq(generators, force: bool, prune: bool):
+    from app.llm_client import client
+
+    version = faq.faq_version(knowledge_base.namespace_hashes())
+    if force or not faq.faq_paths(version)[0].exists():
+        await faq.build_faq(knowledge_base, generators, client, reuse=not force)
+    print(f"✅ {faq.faq_paths(version)[0].name}")
+    if prune:
+        for old in faq.stale_faq_files(version):
+            old.unlink()
+            print(f"🗑️ 이전 버전 삭제 {old.name}")
+
+
+def _option(args, name: str, default: int) -> int:
+    return int(args[args.index(name) + 1]) if name in args else default
+
+
+def _build_ann(nlist: int, prune: bool):
+    if not knowledge_base.load():
+        print("❌ 지식 베이스 인덱스가 없습니다. 먼저 python -m app.knowledge build를 실행하세요.")
+        sys.exit(1)
+    version = ann.ann_version(knowledge_base.version)
+    ivf = ann.IVFIndex.build(knowledge_base._matrix, nlist=nlist or None)
+    ivf.save(ann.ann_path(version))
+    print(f"✅ {ann.ann_path(version).name} {ivf.stats()}")
+    if prune:
+        for old in ann.stale_ann_files(version):
+            old.unlink()
+            print(f"🗑️ 이전 버전 삭제 {old.name}")
+
+
+def _bench(synthetic: int, queries: int, top_n: int):
+    """
+    현재 지식 베이스 행렬(또는 --synthetic N개의 가짜 코퍼스)로 전체 채점 대비 recall/지연을 잽니다.
+    질의는 코퍼스 벡터에 잡음을 섞어 만듭니다. (실제 질문 임베딩 없이 비교 가능)
+    """
+    if synthetic:
+        matrix = ann.synthetic_corpus(synthetic)
+    elif knowledge_base.load():
+        matrix = knowledge_base._matrix
+    else:
+        print("❌ 지식 베이스 인덱스가 없습니다. build를 실행하거나 --synthetic N을 사용하세요.")
+        sys.exit(1)
+
+    rng = np.random.default_rng(1)
+    picked = np.asarray(matrix[rng.choice(matrix.shape[0], queries)])
+    probes = picked + 0.5 * rng.normal(size=picked.shape).astype(np.float32) / np.sqrt(picked.shape[1])
+    ivf = ann.IVFIndex.build(matrix)
+    print(f"코퍼스 {matrix.shape[0]}행 x {matrix.shape[1]}차원, {ivf.stats()}")
+    print("nprobe   recall@k   ms/query   (nprobe 0 = 전체 채점)")
+    for row in ann.benchmark(matrix, ivf, probes, top_n=top_n):
+        print(f"{row['nprobe']:>6}   {row['recall']:>8.4f}   {row['ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    generators = _register_all()
+    if args[:1] == ["build"]:
+        asyncio.run(_build(force="--force" in args, prune="--prune" in args))
+    elif args[:1] == ["faq-build"]:
+        asyncio.run(_build_faq(generators, force="--force" in args, prune="--prune" in args))
+    elif args[:1] == ["ann-build"]:
+        _build_ann(nlist=_option(args, "--nlist", 0), prune="--prune" in args)
+    elif args[:1] == ["ann-bench"]:
+        _bench(
+            synthetic=_option(args, "--synthetic", 0),
+            queries=_option(args, "--queries", 200),
+            top_n=_option(args, "--top-n", 3),
+        )
+    elif args[:1] == ["status"]:
+        _status()
+    else:
+        print(
+            "사용법: python -m app.knowledge build [--force] [--prune] | faq-build [--force] [--prune]"
+            " | ann-build [--nlist N] [--prune] | ann-bench [--synthetic N] [--queries Q] [--top-n K] | status"
+        )
+        sys.exit(1)
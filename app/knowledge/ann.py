@@ -0,0 +1,232 @@
+# app/knowledge/ann.py
+# 대용량 코퍼스(법령/판례 청크 수만 개)용 근사 최근접 이웃 인덱스 — 순수 numpy IVF + int8 잔차
+#
+# - 빌드: 정규화된 행렬을 구면 k-means로 nlist개 군집에 나누고, 각 벡터의 (벡터 - 군집 중심) 잔차를
+#         벡터별 스케일의 int8로 양자화해 군집 순서대로 이어 저장합니다. (float32 대비 약 1/4 메모리)
+# - 검색: 중심과의 유사도로 nprobe개 군집만 골라 q·c + scale·(q·code)로 근사 채점하고,
+#         상위 rerank개 후보만 원본 float32 행렬(메모리 매핑)로 정확히 다시 채점합니다.
+# - 파일: KNOWLEDGE_INDEX_DIR/ann-<version>.npz (version은 지식 베이스 인덱스 version에서 정해짐)
+import os
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.knowledge import index as index_store
+from app.knowledge.retrieval import normalize, normalize_rows, top_k_batch, top_k_indices
+
+# 네임스페이스의 행 수가 이 이상일 때만 ANN을 사용합니다. (그보다 작으면 전체 채점이 더 빠르고 정확)
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "20000"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# 정확히 다시 채점할 후보 수 (top_n보다 작으면 top_n)
+ANN_RERANK = int(os.getenv("ANN_RERANK", "64"))
+ANN_KMEANS_ITERATIONS = 12
+# k-means 학습에 쓸 군집당 최대 표본 수
+ANN_TRAIN_PER_LIST = 32
+_CHUNK_ROWS = 8192
+
+
+def default_nlist(rows: int) -> int:
+    """군집 수: 약 4·√N (군집당 수백 개 수준)"""
+    return int(min(max(1, rows // 8), max(1, round(4 * np.sqrt(rows)))))
+
+
+def ann_version(kb_version: str) -> str:
+    return hashlib.sha256(f"{kb_version}:ivf-int8".encode("utf-8")).hexdigest()[:16]
+
+
+def ann_path(version: str, index_dir: Path = None) -> Path:
+    index_dir = index_dir or index_store.KNOWLEDGE_INDEX_DIR
+    return index_dir / f"ann-{version}.npz"
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """각 행에 가장 가까운(내적 최대) 중심 번호. 큰 행렬은 나눠서 계산합니다."""
+    labels = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], _CHUNK_ROWS):
+        labels[start:start + _CHUNK_ROWS] = np.argmax(matrix[start:start + _CHUNK_ROWS] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(matrix: np.ndarray, nlist: int, iterations: int = ANN_KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = matrix.shape[0]
+    sample_size = min(rows, nlist * ANN_TRAIN_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        # 군집 번호순으로 정렬해 구간 합(reduceat)으로 중심을 다시 계산합니다. (np.add.at보다 훨씬 빠름)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        present = counts > 0
+        sums[present] = np.add.reduceat(sample[order], starts[present], axis=0)
+        empty = ~present
+        if empty.any():
+            # 빈 군집은 임의의 표본으로 다시 시작합니다.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    centroids: (nlist, D) float32, offsets: (nlist + 1,) — 군집 l의 항목은 [offsets[l], offsets[l+1])
+    ids: 군집 순서로 정렬된 원본 행 번호, codes: (N, D) int8 잔차, scales: (N,) float32
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray, codes: np.ndarray, scales: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def rows(self) -> int:
+        return self.ids.shape[0]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: Optional[int] = None, seed: int = 0) -> "IVFIndex":
+        matrix = normalize_rows(matrix)
+        nlist = nlist or default_nlist(matrix.shape[0])
+        centroids = spherical_kmeans(matrix, nlist, seed=seed)
+        labels = _assign(matrix, centroids)
+
+        ids = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], _CHUNK_ROWS):
+            chunk = ids[start:start + _CHUNK_ROWS]
+            residual = np.asarray(matrix[chunk]) - centroids[labels[chunk]]
+            scale = np.abs(residual).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            codes[start:start + len(chunk)] = np.clip(np.rint(residual / scale[:, None]), -127, 127)
+            scales[start:start + len(chunk)] = scale
+        return cls(centroids, offsets, ids, codes, scales)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, ids=self.ids, codes=self.codes, scales=self.scales)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["IVFIndex"]:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data["centroids"], data["offsets"], data["ids"], data["codes"], data["scales"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ ANN 인덱스를 읽지 못했습니다 ({path.name}): {e}")
+            return None
+
+    def search(
+        self,
+        exact: np.ndarray,
+        query: np.ndarray,
+        top_n: int,
+        row_range: Optional[Tuple[int, int]] = None,
+        nprobe: int = ANN_NPROBE,
+        rerank: int = ANN_RERANK,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        exact: 재채점용 원본 (N, D) 정규화 행렬, row_range: 이 행 범위(네임스페이스)의 결과만 반환
+        반환: (원본 행 번호, 정확한 코사인 유사도) — 유사도 내림차순
+        """
+        query = normalize(query)
+        coarse = self.centroids @ query
+        probes = top_k_indices(coarse, nprobe)
+
+        spans = [(int(self.offsets[l]), int(self.offsets[l + 1])) for l in probes]
+        positions = np.concatenate([np.arange(s, e) for s, e in spans] or [np.empty(0, dtype=np.int64)])
+        list_scores = np.concatenate([np.full(e - s, coarse[l], dtype=np.float32) for l, (s, e) in zip(probes, spans)] or [np.empty(0, dtype=np.float32)])
+        ids = self.ids[positions]
+        if row_range is not None:
+            keep = (ids >= row_range[0]) & (ids < row_range[1])
+            positions, list_scores, ids = positions[keep], list_scores[keep], ids[keep]
+        if ids.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        approx = list_scores + self.scales[positions] * (self.codes[positions].astype(np.float32) @ query)
+        shortlist = ids[top_k_indices(approx, max(rerank, top_n))]
+        # 메모리 매핑 행렬은 정렬된 순서로 읽는 편이 빠릅니다.
+        shortlist = np.sort(shortlist)
+        exact_scores = np.asarray(exact[shortlist]) @ query
+        best = top_k_indices(exact_scores, top_n)
+        return shortlist[best], exact_scores[best]
+
+    def stats(self) -> dict:
+        sizes = np.diff(self.offsets)
+        return {
+            "rows": self.rows,
+            "nlist": self.nlist,
+            "list_size_max": int(sizes.max()) if sizes.size else 0,
+            "list_size_avg": round(float(sizes.mean()), 1) if sizes.size else 0.0,
+            "bytes": int(self.codes.nbytes + self.scales.nbytes + self.centroids.nbytes + self.ids.nbytes),
+        }
+
+
+def stale_ann_files(version: str, index_dir: Path = None) -> List[Path]:
+    index_dir = index_dir or index_store.KNOWLEDGE_INDEX_DIR
+    current = ann_path(version, index_dir)
+    return [p for p in index_dir.glob("ann-*.npz") if p != current]
+
+
+# =================================================================
+#   재현율/지연 시간 벤치마크 (python -m app.knowledge ann-bench)
+# =================================================================
+def synthetic_corpus(rows: int, dim: int = 1536, topics: int = 200, seed: int = 0) -> np.ndarray:
+    """주제 중심 주변에 흩어진 벡터 (실제 임베딩처럼 군집 구조가 있는 가짜 코퍼스)"""
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.normal(size=(topics, dim)).astype(np.float32))
+    data = centers[rng.integers(0, topics, rows)] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32) / np.sqrt(dim) * 4
+    return normalize_rows(data)
+
+
+def benchmark(
+    matrix: np.ndarray,
+    ivf: IVFIndex,
+    queries: np.ndarray,
+    top_n: int = 3,
+    nprobes: Sequence[int] = (1, 4, 8, 16, 32, 64),
+    rerank: int = ANN_RERANK,
+) -> List[Dict[str, float]]:
+    """전체 채점(정답) 대비 nprobe별 recall@top_n과 질의당 평균 지연(ms)"""
+    queries = normalize_rows(queries)
+
+    # 정답은 모든 질의를 한 번의 행렬 곱으로 채점해 구합니다.
+    truth = [set(row.tolist()) for row in top_k_batch(matrix, queries, top_n)[0]]
+
+    # 비교 기준 지연은 런타임처럼 질의 하나씩 전체 채점한 시간입니다.
+    started = time.perf_counter()
+    for q in queries:
+        top_k_indices(matrix @ q, top_n)
+    brute_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    results = [{"nprobe": 0, "recall": 1.0, "ms": round(brute_ms, 3)}]
+    for nprobe in nprobes:
+        if nprobe > ivf.nlist:
+            continue
+        found = 0
+        started = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            ids, _ = ivf.search(matrix, q, top_n, nprobe=nprobe, rerank=rerank)
+            found += len(expected.intersection(ids.tolist()))
+        elapsed = (time.perf_counter() - started) * 1000 / len(queries)
+        results.append({"nprobe": nprobe, "recall": round(found / (top_n * len(queries)), 4), "ms": round(elapsed, 3)})
+    return results
@@ -0,0 +1,56 @@
+# app/knowledge/answer.py
+# 검색한 팁을 근거로 답변을 생성하는 공통 호출 (프롬프트는 각 핸들러가 만듭니다)
+import os
+import asyncio
+from contextvars import ContextVar
+from typing import Optional
+
+from app.llm_client import client as default_client
+
+# 법률 질문 답변 모델 (추출 모델 라우팅과 별개, 답변 품질이 중요하므로 기본은 큰 모델)
+RAG_MODEL = os.getenv("RAG_MODEL", "gpt-4o")
+
+# 스트리밍 채팅(/chat/stream)이 턴을 실행하기 전에 설정하는 토큰 큐.
+# 설정되어 있으면 답변을 stream=True로 받아 조각이 도착할 때마다 넣습니다. (없으면 기존처럼 한 번에)
+answer_tokens: ContextVar[Optional[asyncio.Queue]] = ContextVar("answer_tokens", default=None)
+
+
+def emit_answer(text: str):
+    """LLM을 거치지 않은 답변(FAQ, 답변 캐시)도 스트리밍 중이면 한 조각으로 흘려보냅니다."""
+    sink = answer_tokens.get()
+    if sink is not None and text:
+        sink.put_nowait(text)
+
+
+async def generate_answer(system_prompt: str, question: str, client=None, model: str = RAG_MODEL) -> str:
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question},
+    ]
+    sink = answer_tokens.get()
+    if sink is None:
+        resp = await (client or default_client).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0
+        )
+        return resp.choices[0].message.content.strip()
+
+    stream = await (client or default_client).chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0,
+        stream=True,
+    )
+    parts = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            # 답변 앞의 공백/줄바꿈은 한 번에 받을 때처럼 잘라냅니다.
+            if not parts:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+            parts.append(delta)
+            sink.put_nowait(delta)
+    return "".join(parts).strip()
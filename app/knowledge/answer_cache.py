@@ -0,0 +1,131 @@
+# app/knowledge/answer_cache.py
+# RAG 답변 의미 캐시: 비슷한 질문(코사인 유사도) + 같은 참고 팁 집합이면 저장된 답변을 재사용합니다.
+import os
+import time
+import datetime
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+import numpy as np
+
+from app import metrics
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# 코사인 거리(1 - 유사도)가 이 값 이하인 질문만 같은 질문으로 봅니다.
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.05"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "21600"))
+# 네임스페이스(계약서 종류)별 최대 항목 수
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+
+class _Entry(NamedTuple):
+    question: str
+    tip_ids: FrozenSet[int]
+    answer: str
+    expires_at: float
+    day: datetime.date  # 프롬프트에 오늘 날짜가 들어가므로 날짜가 바뀌면 재사용하지 않습니다.
+
+
+class _Bucket:
+    """네임스페이스 하나의 캐시: 질문 벡터 행렬 + 항목 (가득 차면 가장 오래된 칸부터 덮어씀)"""
+
+    def __init__(self, tips_version: str, capacity: int):
+        self.tips_version = tips_version
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None
+        self.entries: List[Optional[_Entry]] = [None] * capacity
+        self.size = 0
+        self.next_slot = 0
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        max_distance: float = SEMANTIC_CACHE_MAX_DISTANCE,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.min_similarity = 1.0 - max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled and max_entries > 0
+        self._buckets: Dict[str, _Bucket] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _bucket(self, namespace: str, tips_version: str) -> _Bucket:
+        bucket = self._buckets.get(namespace)
+        if bucket is not None and bucket.tips_version != tips_version:
+            # 팁 문구가 바뀌었으면 이전 답변은 모두 버립니다.
+            self.invalidations += 1
+            bucket = None
+        if bucket is None:
+            bucket = self._buckets[namespace] = _Bucket(tips_version, self.max_entries)
+        return bucket
+
+    def lookup(self, namespace: str, tips_version: str, query: np.ndarray, tip_ids: FrozenSet[int]) -> Optional[str]:
+        if not self.enabled:
+            return None
+        bucket = self._bucket(namespace, tips_version)
+        if bucket.size == 0:
+            self.misses += 1
+            return None
+
+        sims = bucket.vectors[:bucket.size] @ query
+        now, today = time.time(), datetime.date.today()
+        # 유사도가 높은 순서로 조건(같은 팁 집합, 만료 전, 같은 날짜)에 맞는 첫 항목을 찾습니다.
+        candidates = np.flatnonzero(sims >= self.min_similarity)
+        for slot in candidates[np.argsort(-sims[candidates])]:
+            entry = bucket.entries[slot]
+            if entry and entry.tip_ids == tip_ids and entry.expires_at > now and entry.day == today:
+                self.hits += 1
+                return entry.answer
+        self.misses += 1
+        return None
+
+    def store(self, namespace: str, tips_version: str, query: np.ndarray, tip_ids: FrozenSet[int], question: str, answer: str):
+        if not self.enabled:
+            return
+        bucket = self._bucket(namespace, tips_version)
+        if bucket.vectors is None:
+            bucket.vectors = np.zeros((bucket.capacity, query.shape[0]), dtype=np.float32)
+
+        slot = bucket.next_slot
+        if bucket.entries[slot] is not None:
+            self.evictions += 1
+        bucket.vectors[slot] = query
+        bucket.entries[slot] = _Entry(
+            question, tip_ids, answer, time.time() + self.ttl_seconds, datetime.date.today()
+        )
+        bucket.next_slot = (slot + 1) % bucket.capacity
+        bucket.size = min(bucket.size + 1, bucket.capacity)
+        self.stores += 1
+
+    def clear(self, namespace: Optional[str] = None):
+        if namespace is None:
+            self._buckets.clear()
+        else:
+            self._buckets.pop(namespace, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_distance": round(1.0 - self.min_similarity, 4),
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries_per_namespace": self.max_entries,
+            "sizes": {ns: bucket.size for ns, bucket in self._buckets.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = SemanticAnswerCache()
+metrics.register("semantic_answer_cache", answer_cache.stats)
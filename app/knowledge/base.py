@@ -0,0 +1,366 @@
+# app/knowledge/base.py
+# 모든 문서 핸들러가 함께 쓰는 지식 베이스 (TIP_LIST를 계약서 종류별 네임스페이스로 보관)
+import asyncio
+import bisect
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from app import metrics
+from app.knowledge import ann
+from app.knowledge import index as index_store
+from app.knowledge import lexical
+from app.knowledge.answer import emit_answer
+from app.knowledge.answer_cache import answer_cache
+from app.knowledge.faq import faq_store
+from app.knowledge.retrieval import embed_query, normalize_rows, top_k_indices
+
+
+class SearchHit(NamedTuple):
+    namespace: str
+    index: int  # 네임스페이스 안에서의 팁 번호 (TIP_LIST 인덱스)
+    text: str
+    score: float
+
+
+class KnowledgeBase:
+    """
+    네임스페이스(계약서 종류)별 팁 목록을 하나의 정규화된 임베딩 행렬로 보관합니다.
+    - 각 핸들러는 import 시 register(CONTRACT_TYPE, TIP_LIST)로 팁을 등록합니다.
+    - warm_up()이 저장된 인덱스 파일을 불러오고, 없으면 바뀐 네임스페이스만 API로 계산해 저장합니다.
+    - 행렬은 네임스페이스 이름순으로 이어 붙이며, 네임스페이스 검색은 행 범위(view)로 처리합니다.
+    - ANN 인덱스(ann.py)가 빌드돼 있으면 행이 ANN_MIN_ROWS 이상인 범위는 근사 검색 + 정확 재채점으로 찾습니다.
+    """
+
+    def __init__(self, model: str = index_store.EMBEDDING_MODEL):
+        self.model = model
+        self._tips: Dict[str, List[str]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._slices: Dict[str, Tuple[int, int]] = {}
+        self._starts: List[int] = []
+        self._order: List[str] = []
+        self.source = "none"  # "file" | "api" | "none"
+        self.ann: Optional[ann.IVFIndex] = None
+        self._lock = asyncio.Lock()
+        self._lexical: Dict[str, lexical.BM25Index] = {}
+        self.lexical_verdicts: Dict[str, int] = {"form": 0, "question": 0, "ambiguous": 0}
+
+    # -----------------------------------------------------------
+    # 등록 / 레이아웃
+    # -----------------------------------------------------------
+    def register(self, namespace: str, tips: List[str]):
+        self._tips[namespace] = list(tips)
+        self._hashes[namespace] = index_store.tips_hash(self._tips[namespace], self.model)
+        self._lexical.pop(namespace, None)
+        # 레이아웃이 바뀌므로 다음 사용 시 다시 불러옵니다.
+        self._matrix = None
+        self.ann = None
+        self.source = "none"
+
+    @property
+    def namespaces(self) -> List[str]:
+        return sorted(self._tips)
+
+    def tips(self, namespace: str) -> List[str]:
+        return self._tips[namespace]
+
+    def namespace_hashes(self) -> Dict[str, str]:
+        return dict(self._hashes)
+
+    def tips_version(self, namespace: str) -> str:
+        """네임스페이스 팁 문구의 해시 (팁이 바뀌면 의미 캐시 무효화에 사용)"""
+        return self._hashes[namespace]
+
+    @property
+    def version(self) -> str:
+        return index_store.index_version(self.namespace_hashes(), self.model)
+
+    def _layout(self):
+        self._slices, self._starts, self._order = {}, [], []
+        start = 0
+        for ns in self.namespaces:
+            count = len(self._tips[ns])
+            self._slices[ns] = (start, start + count)
+            self._starts.append(start)
+            self._order.append(ns)
+            start += count
+        return start
+
+    # -----------------------------------------------------------
+    # 로드 / 빌드 / 예열
+    # -----------------------------------------------------------
+    def load(self) -> bool:
+        """저장된 인덱스 파일을 불러옵니다. (API 호출 없음)"""
+        rows = self._layout()
+        matrix = index_store.load_matrix(self.version, rows)
+        if matrix is None:
+            return False
+        self._matrix = matrix
+        self.source = "file"
+        self.load_ann()
+        return True
+
+    def load_ann(self) -> bool:
+        """코퍼스가 ANN_MIN_ROWS 이상이면 저장된 ANN 인덱스를 불러옵니다. 없으면 전체 채점을 사용합니다."""
+        self.ann = None
+        if self._matrix is None or self._matrix.shape[0] < ann.ANN_MIN_ROWS:
+            return False
+        ivf = ann.IVFIndex.load(ann.ann_path(ann.ann_version(self.version)))
+        if ivf is None or ivf.rows != self._matrix.shape[0]:
+            print("⚠️ ANN 인덱스가 없어 전체 채점으로 검색합니다. (python -m app.knowledge ann-build)")
+            return False
+        self.ann = ivf
+        return True
+
+    async def build(self, client, reuse: bool = True) -> np.ndarray:
+        """
+        바뀐 네임스페이스만 임베딩 API로 계산해 전체 행렬을 저장합니다.
+        reuse=False면 모든 네임스페이스를 다시 계산합니다.
+        """
+        rows = self._layout()
+        hashes = self.namespace_hashes()
+        reused = index_store.reusable_rows(hashes) if reuse else {}
+
+        missing = [ns for ns in self.namespaces if ns not in reused and self._tips[ns]]
+        texts = [tip for ns in missing for tip in self._tips[ns]]
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), index_store.EMBEDDING_BATCH_SIZE):
+            resp = await client.embeddings.create(model=self.model, input=texts[i:i + index_store.EMBEDDING_BATCH_SIZE])
+            vectors.extend(d.embedding for d in resp.data)
+        fresh = normalize_rows(np.array(vectors, dtype=np.float32)) if vectors else None
+
+        parts, offset, dim = [], 0, None
+        for ns in self.namespaces:
+            count = len(self._tips[ns])
+            if ns in reused:
+                part = reused[ns]
+            elif count:
+                part = fresh[offset:offset + count]
+                offset += count
+            else:
+                continue
+            dim = part.shape[1]
+            parts.append(part)
+        matrix = normalize_rows(np.concatenate(parts)) if parts else np.zeros((0, dim or 1), dtype=np.float32)
+        assert matrix.shape[0] == rows
+
+        manifest = {
+            "model": self.model,
+            "version": self.version,
+            "dim": int(matrix.shape[1]),
+            "namespaces": {
+                ns: {"hash": hashes[ns], "start": start, "count": end - start}
+                for ns, (start, end) in self._slices.items()
+            },
+        }
+        try:
+            index_store.save_matrix(self.version, matrix, manifest)
+        except OSError as e:
+            # 읽기 전용 파일시스템 등: 이번 프로세스에서만 메모리로 사용합니다.
+            print(f"⚠️ 지식 베이스 인덱스를 저장하지 못했습니다: {e}")
+
+        self._matrix = matrix
+        self.source = "api"
+        self.ann = None
+        print(f"🔨 지식 베이스 인덱스 빌드: 재사용 {sorted(reused)}, 새로 계산 {missing} ({len(texts)}개 팁)")
+        return matrix
+
+    async def get_matrix(self, client=None) -> np.ndarray:
+        if self._matrix is not None:
+            return self._matrix
+        async with self._lock:
+            if self._matrix is None and not self.load():
+                print(f"⚠️ 지식 베이스 인덱스(tips-{self.version}.npy)가 없어 API로 계산합니다.")
+                await self.build(client or _default_client())
+        return self._matrix
+
+    async def warm_up(self, client=None) -> bool:
+        """시작 시 호출: 인덱스를 메모리에 올립니다. 실패해도 첫 검색 때 다시 시도합니다."""
+        try:
+            await self.get_matrix(client)
+            if not faq_store.load(self.namespace_hashes()):
+                print("ℹ️ FAQ 산출물이 없어 모든 RAG 질문을 LLM으로 답합니다. (python -m app.knowledge faq-build)")
+            return True
+        except Exception as e:
+            print(f"⚠️ 지식 베이스 예열 실패 (첫 검색 시 다시 시도합니다): {e}")
+            return False
+
+    # -----------------------------------------------------------
+    # 검색
+    # -----------------------------------------------------------
+    def _locate(self, row: int) -> Tuple[str, int]:
+        """전체 행 번호 → (네임스페이스, 네임스페이스 안의 번호)"""
+        pos = bisect.bisect_right(self._starts, row) - 1
+        ns = self._order[pos]
+        return ns, row - self._slices[ns][0]
+
+    async def namespace_matrix(self, namespace: str, client=None) -> np.ndarray:
+        matrix = await self.get_matrix(client)
+        start, end = self._slices[namespace]
+        return matrix[start:end]
+
+    def _ann_range(self, row_range: Tuple[int, int]) -> Optional[ann.IVFIndex]:
+        return self.ann if self.ann is not None and row_range[1] - row_range[0] >= ann.ANN_MIN_ROWS else None
+
+    async def ann_hits(self, namespace: Optional[str], query: np.ndarray, top_n: int, client=None) -> Optional[List[SearchHit]]:
+        """
+        네임스페이스(None=전체)가 ANN을 쓸 만큼 크면 근사 검색 결과를, 아니면 None을 반환합니다.
+        """
+        matrix = await self.get_matrix(client)
+        row_range = self._slices[namespace] if namespace is not None else (0, matrix.shape[0])
+        ivf = self._ann_range(row_range)
+        if ivf is None:
+            return None
+        rows, scores = ivf.search(matrix, query, top_n, row_range=row_range if namespace is not None else None)
+        hits = []
+        for row, score in zip(rows, scores):
+            ns, local = self._locate(int(row))
+            hits.append(SearchHit(ns, local, self._tips[ns][local], float(score)))
+        return hits
+
+    async def search(
+        self,
+        question: str,
+        namespaces: Union[str, Iterable[str], None] = None,
+        top_n: int = 3,
+        client=None,
+    ) -> List[SearchHit]:
+        """
+        질문과 가장 비슷한 팁 top_n개를 반환합니다.
+        namespaces: 검색할 계약서 종류 (문자열 하나, 여러 개, 또는 None=전체)
+        """
+        client = client or _default_client()
+        matrix = await self.get_matrix(client)
+        query = await embed_query(client, question, self.model)
+
+        if namespaces is None or isinstance(namespaces, str):
+            hits = await self.ann_hits(namespaces, query, top_n, client)
+            if hits is not None:
+                return hits
+
+        if namespaces is None:
+            rows = None
+            scores = matrix @ query
+        else:
+            if isinstance(namespaces, str):
+                namespaces = [namespaces]
+            rows = np.concatenate(
+                [np.arange(*self._slices[ns]) for ns in namespaces] or [np.empty(0, dtype=np.intp)]
+            )
+            scores = matrix[rows] @ query
+
+        hits = []
+        for i in top_k_indices(scores, top_n):
+            row = int(rows[i]) if rows is not None else int(i)
+            ns, local = self._locate(row)
+            hits.append(SearchHit(ns, local, self._tips[ns][local], float(scores[i])))
+        return hits
+
+    def classify(self, namespace: str, message: str) -> lexical.LexicalVerdict:
+        """
+        네트워크 호출 없이 메시지를 form / question / ambiguous로 분류합니다. (lexical.py 참고)
+        임베딩 유사도 검사는 ambiguous일 때만 하면 됩니다.
+        """
+        index = self._lexical.get(namespace)
+        if index is None:
+            index = self._lexical[namespace] = lexical.BM25Index(self._tips[namespace])
+        verdict = lexical.classify(index, message)
+        self.lexical_verdicts[verdict.label] += 1
+        return verdict
+
+    def context(self, namespace: str, question: str, client=None) -> "RetrievalContext":
+        return RetrievalContext(self, namespace, question, client)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "version": self.version,
+            "source": self.source,
+            "loaded": self._matrix is not None,
+            "rows": int(self._matrix.shape[0]) if self._matrix is not None else 0,
+            "ann": self.ann.stats() if self.ann is not None else None,
+            "namespaces": {ns: len(tips) for ns, tips in self._tips.items()},
+            "lexical_verdicts": dict(self.lexical_verdicts),
+        }
+
+
+class RetrievalContext:
+    """
+    한 턴(사용자 메시지 하나) 동안 한 네임스페이스의 검색 결과를 보관합니다.
+    유사도 게이트와 RAG 답변이 같은 메시지로 여러 번 검색해도 임베딩/채점은 한 번만 합니다.
+    """
+
+    def __init__(self, kb: KnowledgeBase, namespace: str, question: str, client=None):
+        self.kb = kb
+        self.namespace = namespace
+        self.question = question
+        self.client = client or _default_client()
+        self._query: Optional[np.ndarray] = None
+        self._scores: Optional[np.ndarray] = None
+
+    async def query_vector(self) -> np.ndarray:
+        if self._query is None:
+            self._query = await embed_query(self.client, self.question, self.kb.model)
+        return self._query
+
+    async def scores(self) -> np.ndarray:
+        """네임스페이스의 모든 팁에 대한 코사인 유사도 (TIP_LIST 순서 그대로)"""
+        if self._scores is None:
+            matrix = await self.kb.namespace_matrix(self.namespace, self.client)
+            self._scores = matrix @ await self.query_vector()
+        return self._scores
+
+    async def hits(self, top_n: int = 3) -> List[SearchHit]:
+        ann_hits = await self.kb.ann_hits(self.namespace, await self.query_vector(), top_n, self.client)
+        if ann_hits is not None:
+            return ann_hits
+        scores = await self.scores()
+        tips = self.kb.tips(self.namespace)
+        return [
+            SearchHit(self.namespace, int(i), tips[i], float(scores[i]))
+            for i in top_k_indices(scores, top_n)
+        ]
+
+    async def top_tips(self, top_n: int = 3) -> Tuple[str, float]:
+        """(상위 top_n개 팁을 줄바꿈으로 이은 문자열, 최고 유사도)"""
+        hits = await self.hits(top_n)
+        if not hits:
+            return "", 0.0
+        return "\n".join([hit.text for hit in hits]), hits[0].score
+
+    async def answer(self, generate: Callable[[str, str], Awaitable[str]], top_n: int = 3) -> str:
+        """
+        상위 top_n개 팁으로 RAG 답변을 만듭니다. generate(question, tips_str)는 핸들러의 get_rag_response.
+        1) 미리 만든 FAQ의 예상 질문과 거의 같고 팁 하나로 답할 수 있으면 대표 답변 (faq.py)
+        2) 비슷한 질문이 같은 팁 집합으로 이미 답변된 적 있으면 저장된 답변
+        둘 다 아니면 LLM을 호출합니다. (스트리밍 채팅이면 세 경우 모두 answer_tokens 큐로 흘려보냄)
+        """
+        hits = await self.hits(top_n)
+        query = await self.query_vector()
+
+        faq_answer = faq_store.match(self.namespace, query, hits)
+        if faq_answer is not None:
+            emit_answer(faq_answer)
+            return faq_answer
+
+        tip_ids = frozenset(hit.index for hit in hits)
+        version = self.kb.tips_version(self.namespace)
+
+        cached = answer_cache.lookup(self.namespace, version, query, tip_ids)
+        if cached is not None:
+            emit_answer(cached)
+            return cached
+
+        answer = await generate(self.question, "\n".join([hit.text for hit in hits]))
+        answer_cache.store(self.namespace, version, query, tip_ids, self.question, answer)
+        return answer
+
+
+def _default_client():
+    from app.llm_client import client
+    return client
+
+
+knowledge_base = KnowledgeBase()
+metrics.register("knowledge_base", knowledge_base.stats)
@@ -0,0 +1,138 @@
+# app/knowledge/batcher.py
+# 동시에 들어온 임베딩 요청을 몇 ms 동안 모아 embeddings.create 한 번으로 보내는 마이크로 배처
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import metrics
+
+# 첫 요청 후 이 시간(ms) 동안 들어온 요청을 한 배치로 묶습니다. 0이면 배칭하지 않습니다.
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+# 한 번의 API 호출에 보낼 최대 문장 수 (차면 기다리지 않고 바로 보냅니다)
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+_FILL_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EmbeddingBatcher:
+    """
+    embed(text)를 부른 코루틴들은 같은 배치의 API 응답에서 각자의 벡터를 돌려받습니다.
+    - 같은 배치 안의 동일 문장은 한 번만 보냅니다.
+    - API 호출이 실패하면 그 배치를 기다리던 요청 모두에 같은 예외를 전달합니다.
+    이벤트 루프 안에서만 사용하므로 별도의 스레드 락은 두지 않습니다.
+    """
+
+    def __init__(self, client, model: str, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_BATCH_MAX_SIZE):
+        self.client = client
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 보내는 중인 배치 태스크. 루프가 약한 참조만 들고 있으므로 끝날 때까지 여기서 붙잡아 둡니다.
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.deduplicated = 0
+        self.full_flushes = 0
+        self.errors = 0
+        self.fill = metrics.Histogram(_FILL_BUCKETS)
+        self.call_seconds = metrics.Histogram()
+
+    async def embed(self, text: str) -> List[float]:
+        self.requests += 1
+        if self.window <= 0:
+            self.fill.observe(1)
+            self.batches += 1
+            return (await self._call([text]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._pending.get(text)
+        if waiters is not None:
+            self.deduplicated += 1
+            waiters.append(future)
+        else:
+            self._pending[text] = [future]
+
+        if len(self._pending) >= self.max_batch:
+            self.full_flushes += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self.batches += 1
+        self.fill.observe(len(batch))
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        try:
+            resp = await self.client.embeddings.create(model=self.model, input=texts)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.call_seconds.observe(time.perf_counter() - started)
+        return [d.embedding for d in resp.data]
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        texts = list(batch)
+        try:
+            vectors = await self._call(texts)
+        except Exception as e:
+            for waiters in batch.values():
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for text, vector in zip(texts, vectors):
+            for future in batch[text]:
+                if not future.done():  # 기다리던 요청이 취소된 경우
+                    future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "requests": self.requests,
+            "batches": self.batches,
+            "deduplicated": self.deduplicated,
+            "full_flushes": self.full_flushes,
+            "errors": self.errors,
+            "in_flight": len(self._tasks),
+            "avg_fill": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "fill": self.fill.snapshot(),
+            "call_seconds": self.call_seconds.snapshot(),
+        }
+
+
+# (클라이언트, 모델)별 배처. 보통은 app.llm_client.client 하나뿐입니다.
+_batchers: Dict[Tuple[int, str], Tuple[object, EmbeddingBatcher]] = {}
+
+
+def get_batcher(client, model: str) -> EmbeddingBatcher:
+    key = (id(client), model)
+    entry = _batchers.get(key)
+    if entry is None or entry[0] is not client:
+        entry = _batchers[key] = (client, EmbeddingBatcher(client, model))
+    return entry[1]
+
+
+def batcher_stats() -> dict:
+    return {batcher.model: batcher.stats() for _, batcher in _batchers.values()}
+
+
+metrics.register("embedding_batcher", batcher_stats)
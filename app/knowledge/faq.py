@@ -0,0 +1,256 @@
+# app/knowledge/faq.py
+# 팁별 "대표 답변 + 예상 질문"을 미리 만들어 두고, 확실한 단일 팁 질문은 LLM 없이 바로 답합니다.
+#
+# 산출물 (KNOWLEDGE_INDEX_DIR):
+#   faq-<version>.json : 네임스페이스별 [{tip, tip_hash, answer, questions}] + 예상 질문 행 → (네임스페이스, 팁 번호)
+#   faq-<version>.npy  : 예상 질문 임베딩 (정규화된 float32)
+# version은 지식 베이스 팁 해시로 정해지므로, 팁이 바뀌면 다시 빌드하기 전까지 FAQ 응답은 꺼집니다.
+# 다시 빌드할 때는 문구가 그대로인 팁의 항목을 이전 산출물에서 재사용합니다. (LLM 비용 없음)
+# 대표 답변은 만료 없이 제공되므로 날짜를 넣지 않은 프롬프트(get_rag_response(..., include_date=False))로 만듭니다.
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.knowledge import index as index_store
+from app.knowledge.answer import RAG_MODEL
+from app.knowledge.retrieval import normalize_rows
+
+# 2: 대표 답변을 날짜 없는 프롬프트로 생성 (이전 산출물은 빌드 날짜가 박혀 있어 재사용하지 않습니다)
+FAQ_FORMAT_VERSION = "2"
+# 예상 질문 생성 모델. 대표 답변은 실제 RAG 답변과 같은 RAG_MODEL로 만듭니다. (generate_answer)
+FAQ_MODEL = os.getenv("FAQ_MODEL", RAG_MODEL)
+FAQ_TRIGGER_COUNT = int(os.getenv("FAQ_TRIGGER_COUNT", "5"))
+# 예상 질문과의 코사인 유사도가 이 이상이고,
+FAQ_MIN_SIMILARITY = float(os.getenv("FAQ_MIN_SIMILARITY", "0.9"))
+# 검색 1위 팁이 2위보다 이만큼 앞설 때만 (여러 팁에 걸친 질문은 LLM으로) FAQ로 답합니다.
+FAQ_MIN_MARGIN = float(os.getenv("FAQ_MIN_MARGIN", "0.03"))
+
+TRIGGER_PROMPT = """
+아래 [팁] 하나만으로 답할 수 있는 사용자 질문을 한국어로 {count}개 만들어 주세요.
+- 실제 사용자가 채팅창에 입력할 법한 표현으로, 존댓말/반말/짧은 질문을 섞어 다양하게 작성합니다.
+- 팁에 없는 내용을 묻는 질문은 만들지 않습니다.
+- 반드시 {{"questions": ["...", ...]}} 형식의 JSON으로만 답합니다.
+
+[팁]
+{tip}
+"""
+
+
+def _tip_hash(tip: str) -> str:
+    return hashlib.sha256(tip.encode("utf-8")).hexdigest()[:16]
+
+
+def faq_version(namespace_hashes: Dict[str, str]) -> str:
+    return index_store.index_version(
+        {**namespace_hashes, "__faq__": f"{FAQ_FORMAT_VERSION}:{FAQ_MODEL}:{RAG_MODEL}:{FAQ_TRIGGER_COUNT}"}
+    )
+
+
+def faq_paths(version: str, index_dir: Path = None) -> Tuple[Path, Path]:
+    index_dir = index_dir or index_store.KNOWLEDGE_INDEX_DIR
+    return index_dir / f"faq-{version}.json", index_dir / f"faq-{version}.npy"
+
+
+class FaqStore:
+    """런타임 FAQ 조회 (파일만 읽음, API 호출 없음)"""
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self._answers: Dict[str, List[Optional[str]]] = {}   # namespace -> 팁 번호별 대표 답변
+        self._rows: Dict[str, Tuple[int, int]] = {}          # namespace -> 예상 질문 행 범위
+        self._row_tips: Optional[np.ndarray] = None          # 행 -> 팁 번호
+        self._matrix: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses: Dict[str, int] = {"not_loaded": 0, "low_similarity": 0, "tip_mismatch": 0, "ambiguous": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._matrix is not None
+
+    def load(self, namespace_hashes: Dict[str, str]) -> bool:
+        version = faq_version(namespace_hashes)
+        json_path, npy_path = faq_paths(version)
+        if not (json_path.exists() and npy_path.exists()):
+            self.version, self._matrix = None, None
+            return False
+        try:
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+            matrix = normalize_rows(np.load(npy_path, mmap_mode="r"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ FAQ 산출물을 읽지 못했습니다 ({json_path.name}): {e}")
+            return False
+
+        answers, rows, row_tips = {}, {}, []
+        for ns, entries in data["namespaces"].items():
+            start = len(row_tips)
+            answers[ns] = [entry["answer"] for entry in entries]
+            for tip_index, entry in enumerate(entries):
+                row_tips.extend([tip_index] * len(entry["questions"]))
+            rows[ns] = (start, len(row_tips))
+        if matrix.shape[0] != len(row_tips):
+            print(f"⚠️ FAQ 산출물 형태가 맞지 않습니다 ({npy_path.name}): {matrix.shape}")
+            return False
+
+        self.version, self._answers, self._rows = version, answers, rows
+        self._row_tips = np.array(row_tips, dtype=np.intp)
+        self._matrix = matrix
+        return True
+
+    def match(self, namespace: str, query: np.ndarray, hits) -> Optional[str]:
+        """
+        hits: 이번 질문의 검색 결과 (SearchHit 목록, 유사도 내림차순)
+        예상 질문과 거의 같고, 그 팁이 검색 1위이며, 2위와 충분히 차이 날 때만 대표 답변을 돌려줍니다.
+        """
+        if not self.loaded or namespace not in self._rows or not hits:
+            self.misses["not_loaded"] += 1
+            return None
+
+        start, end = self._rows[namespace]
+        if start == end:
+            self.misses["not_loaded"] += 1
+            return None
+        sims = self._matrix[start:end] @ query
+        best = int(np.argmax(sims))
+        tip_index = int(self._row_tips[start + best])
+
+        if sims[best] < FAQ_MIN_SIMILARITY:
+            self.misses["low_similarity"] += 1
+            return None
+        if hits[0].index != tip_index:
+            self.misses["tip_mismatch"] += 1
+            return None
+        if len(hits) > 1 and hits[0].score - hits[1].score < FAQ_MIN_MARGIN:
+            self.misses["ambiguous"] += 1
+            return None
+
+        answer = self._answers[namespace][tip_index]
+        if not answer:
+            self.misses["not_loaded"] += 1
+            return None
+        self.hits += 1
+        return answer
+
+    def stats(self) -> dict:
+        total = self.hits + sum(self.misses.values())
+        return {
+            "loaded": self.loaded,
+            "version": self.version,
+            "rows": int(self._matrix.shape[0]) if self.loaded else 0,
+            "hits": self.hits,
+            "misses": dict(self.misses),
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+faq_store = FaqStore()
+metrics.register("faq", faq_store.stats)
+
+
+# =================================================================
+#   빌드 (오프라인: python -m app.knowledge faq-build)
+# =================================================================
+def _previous_entries(index_dir: Path = None) -> Dict[Tuple[str, str], dict]:
+    """
+    이전 FAQ 산출물들의 항목을 (네임스페이스, 팁 해시)로 모읍니다. (예상 질문 임베딩 포함)
+    형식 버전이나 모델이 다른 산출물은 답변 프롬프트/모델이 달라 재사용하지 않습니다.
+    """
+    index_dir = index_dir or index_store.KNOWLEDGE_INDEX_DIR
+    found: Dict[Tuple[str, str], dict] = {}
+    if not index_dir.exists():
+        return found
+    for json_path in sorted(index_dir.glob("faq-*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        npy_path = json_path.with_suffix(".npy")
+        try:
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+            matrix = np.load(npy_path, mmap_mode="r")
+        except (OSError, ValueError):
+            continue
+        if (data.get("format"), data.get("model"), data.get("answer_model")) != (FAQ_FORMAT_VERSION, FAQ_MODEL, RAG_MODEL):
+            continue
+        row = 0
+        for ns, entries in data["namespaces"].items():
+            for entry in entries:
+                count = len(entry["questions"])
+                key = (ns, entry["tip_hash"])
+                if key not in found and entry.get("answer"):
+                    found[key] = {**entry, "vectors": np.array(matrix[row:row + count], dtype=np.float32)}
+                row += count
+    return found
+
+
+async def _trigger_questions(client, tip: str) -> List[str]:
+    resp = await client.chat.completions.create(
+        model=FAQ_MODEL,
+        messages=[{"role": "user", "content": TRIGGER_PROMPT.format(count=FAQ_TRIGGER_COUNT, tip=tip)}],
+        response_format={"type": "json_object"},
+        temperature=0.7,
+    )
+    questions = json.loads(resp.choices[0].message.content).get("questions", [])
+    return [q.strip() for q in questions if isinstance(q, str) and q.strip()][:FAQ_TRIGGER_COUNT]
+
+
+async def build_faq(
+    kb,
+    generators: Dict[str, Callable[[str, str], Awaitable[str]]],
+    client,
+    reuse: bool = True,
+) -> Path:
+    """
+    generators: 네임스페이스 -> 핸들러의 get_rag_response(question, tips_str, include_date)
+    대표 답변은 핸들러의 실제 RAG 프롬프트(오늘 날짜 줄 제외)로, 첫 번째 예상 질문 + 해당 팁 하나만 넣어 만듭니다.
+    """
+    previous = _previous_entries() if reuse else {}
+    namespaces, vectors, generated = {}, [], 0
+
+    for ns in kb.namespaces:
+        entries = []
+        for tip in kb.tips(ns):
+            tip_hash = _tip_hash(tip)
+            old = previous.get((ns, tip_hash))
+            if old is not None:
+                entries.append({"tip": tip, "tip_hash": tip_hash, "answer": old["answer"], "questions": old["questions"]})
+                vectors.append(old["vectors"])
+                continue
+
+            questions = await _trigger_questions(client, tip)
+            generate = generators.get(ns)
+            answer = await generate(questions[0], tip, include_date=False) if (generate and questions) else None
+            if questions:
+                resp = await client.embeddings.create(model=kb.model, input=questions)
+                vectors.append(normalize_rows(np.array([d.embedding for d in resp.data], dtype=np.float32)))
+            entries.append({"tip": tip, "tip_hash": tip_hash, "answer": answer, "questions": questions})
+            generated += 1
+        namespaces[ns] = entries
+
+    version = faq_version(kb.namespace_hashes())
+    json_path, npy_path = faq_paths(version)
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 1), dtype=np.float32)
+
+    tmp_path = npy_path.with_name(f".{npy_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, npy_path)
+    # 런타임은 .json이 있어야 로드하므로 .json을 마지막에 씁니다.
+    payload = {
+        "version": version,
+        "format": FAQ_FORMAT_VERSION,
+        "model": FAQ_MODEL,
+        "answer_model": RAG_MODEL,
+        "namespaces": namespaces,
+    }
+    json_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"🔨 FAQ 빌드: 새로 생성 {generated}개 팁, 재사용 {sum(len(e) for e in namespaces.values()) - generated}개 팁")
+    return json_path
+
+
+def stale_faq_files(version: str, index_dir: Path = None) -> List[Path]:
+    index_dir = index_dir or index_store.KNOWLEDGE_INDEX_DIR
+    current = set(faq_paths(version, index_dir))
+    return [p for p in index_dir.glob("faq-*.*") if p not in current]
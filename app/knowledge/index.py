@@ -0,0 +1,110 @@
+# app/knowledge/index.py
+# 지식 베이스 임베딩 행렬의 디스크 저장/로드 (.npy + 매니페스트 .json)
+#
+# - 모든 네임스페이스(계약서 종류)의 팁을 이름순으로 이어 붙인 (N, D) float32 행렬 하나를 저장합니다.
+# - 파일 이름의 version은 모델 + 네임스페이스별 팁 해시로 정해지므로, 팁 문구가 바뀌면 다른 파일을 찾습니다.
+# - 다시 빌드할 때는 이전 매니페스트에서 해시가 같은 네임스페이스의 행을 재사용하고,
+#   바뀐 네임스페이스만 임베딩 API를 호출합니다.
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.knowledge.retrieval import normalize_rows
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+KNOWLEDGE_INDEX_DIR = Path(os.getenv("KNOWLEDGE_INDEX_DIR", Path(__file__).resolve().parent / "indexes"))
+# 임베딩 API 한 번에 보낼 최대 문장 수
+EMBEDDING_BATCH_SIZE = 512
+
+
+def tips_hash(tips: List[str], model: str = EMBEDDING_MODEL) -> str:
+    """모델 이름 + 팁 문구 전체의 해시. 문구가 한 글자라도 바뀌면 값이 달라집니다."""
+    h = hashlib.sha256(model.encode("utf-8"))
+    for tip in tips:
+        h.update(b"\x00")
+        h.update(tip.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def index_version(namespace_hashes: Dict[str, str], model: str = EMBEDDING_MODEL) -> str:
+    h = hashlib.sha256(model.encode("utf-8"))
+    for namespace in sorted(namespace_hashes):
+        h.update(b"\x00")
+        h.update(namespace.encode("utf-8"))
+        h.update(b"=")
+        h.update(namespace_hashes[namespace].encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def index_paths(version: str, index_dir: Path = None) -> Tuple[Path, Path]:
+    index_dir = index_dir or KNOWLEDGE_INDEX_DIR
+    return index_dir / f"tips-{version}.npy", index_dir / f"tips-{version}.json"
+
+
+def load_matrix(version: str, rows: int, index_dir: Path = None) -> Optional[np.ndarray]:
+    """저장된 행렬을 메모리 매핑으로 불러옵니다. 없거나 형태가 맞지 않으면 None."""
+    npy_path, _ = index_paths(version, index_dir)
+    if not npy_path.exists():
+        return None
+    try:
+        arr = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 지식 베이스 인덱스를 읽지 못했습니다 ({npy_path.name}): {e}")
+        return None
+    if arr.ndim != 2 or arr.shape[0] != rows:
+        print(f"⚠️ 지식 베이스 인덱스 형태가 맞지 않습니다 ({npy_path.name}): {arr.shape}")
+        return None
+    # 빌드 시 정규화해서 저장하므로 보통은 복사 없이 메모리 매핑 그대로 사용합니다.
+    return normalize_rows(arr)
+
+
+def save_matrix(version: str, matrix: np.ndarray, manifest: dict, index_dir: Path = None):
+    """매니페스트를 먼저 쓰고, 행렬은 임시 파일에 쓴 뒤 교체합니다. (읽는 쪽은 .npy만 봅니다)"""
+    index_dir = index_dir or KNOWLEDGE_INDEX_DIR
+    index_dir.mkdir(parents=True, exist_ok=True)
+    npy_path, json_path = index_paths(version, index_dir)
+
+    json_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp_path = npy_path.with_name(f".{npy_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, npy_path)
+
+
+def reusable_rows(namespace_hashes: Dict[str, str], index_dir: Path = None) -> Dict[str, np.ndarray]:
+    """
+    이전 버전 인덱스들에서 팁 해시가 같은 네임스페이스의 행을 찾아 돌려줍니다.
+    (바뀌지 않은 네임스페이스는 다시 임베딩하지 않기 위함)
+    """
+    index_dir = index_dir or KNOWLEDGE_INDEX_DIR
+    found: Dict[str, np.ndarray] = {}
+    if not index_dir.exists():
+        return found
+
+    for json_path in sorted(index_dir.glob("tips-*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        npy_path = json_path.with_suffix(".npy")
+        if not npy_path.exists():
+            continue
+        try:
+            manifest = json.loads(json_path.read_text(encoding="utf-8"))
+            arr = np.load(npy_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 이전 인덱스를 건너뜁니다 ({json_path.name}): {e}")
+            continue
+        for namespace, info in manifest.get("namespaces", {}).items():
+            if namespace in found or namespace_hashes.get(namespace) != info.get("hash"):
+                continue
+            start, count = info["start"], info["count"]
+            found[namespace] = np.array(arr[start:start + count], dtype=np.float32)
+    return found
+
+
+def stale_files(version: str, index_dir: Path = None) -> List[Path]:
+    """현재 버전이 아닌 인덱스 파일들"""
+    index_dir = index_dir or KNOWLEDGE_INDEX_DIR
+    current = set(index_paths(version, index_dir))
+    return [p for p in index_dir.glob("tips-*.*") if p not in current]
@@ -0,0 +1,130 @@
+# app/knowledge/lexical.py
+# 네트워크 호출 없이 "폼 답변 / 법률 질문"을 가르는 어휘 게이트 (한국어 문자 2·3-gram BM25)
+#
+# 대부분의 턴은 이름, 날짜, 숫자 같은 폼 답변이므로 임베딩 API를 부를 필요가 없습니다.
+# - form      : 확실한 폼 답변 → 임베딩 유사도 검사를 건너뜁니다.
+# - question  : 질문 표현 + 팁과 어휘가 충분히 겹침 → 바로 RAG로 보냅니다.
+# - ambiguous : 애매한 경우만 기존처럼 임베딩 유사도로 판단합니다.
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+NGRAM_SIZES = (2, 3)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 상대 BM25 점수(0~1) 기준값
+LEXICAL_QUESTION_MIN = float(os.getenv("LEXICAL_QUESTION_MIN", "0.2"))   # 질문 표현이 있을 때 이 이상이면 question
+LEXICAL_TOPIC_MIN = float(os.getenv("LEXICAL_TOPIC_MIN", "0.15"))        # 질문 표현이 없어도 이 이상이면 ambiguous
+
+_NON_WORD = re.compile(r"[^0-9a-z가-힣ㄱ-ㅎㅏ-ㅣ]+")
+# 숫자/날짜/전화번호/금액처럼 값만 있는 답변
+_FORM_VALUE = re.compile(r"^[\d\s\-–~.,:/()+년월일시분초원만천백억개월주세명호동층번지차]+$")
+_EMAIL = re.compile(r"^[\w.+-]+@[\w-]+(\.[\w-]+)+$")
+_SHORT_ANSWERS = {"네", "예", "아니요", "아니오", "아니", "응", "ㅇㅇ", "ㄴㄴ", "yes", "no", "ok", "맞아요", "맞습니다", "없음", "없어요", "없습니다"}
+# 의문사 / 의문형 어미
+_INTERROGATIVES = ("얼마", "어떻게", "어떤", "무엇", "뭐", "뭔", "왜", "언제", "어디", "누가", "누구", "몇")
+_QUESTION_ENDING = re.compile(r"(나요|가요|까요|니까|는지|을까|ㄹ까|냐|죠|지요|되나|인가|인지|하나|있나|없나)$")
+
+
+def normalize_text(text: str) -> str:
+    return _NON_WORD.sub(" ", unicodedata.normalize("NFC", text).lower()).strip()
+
+
+def char_ngrams(text: str, sizes: Sequence[int] = NGRAM_SIZES) -> List[str]:
+    """공백으로 나눈 어절 안에서만 문자 n-gram을 만듭니다. (어절 경계를 넘는 n-gram은 잡음)"""
+    grams = []
+    for token in normalize_text(text).split():
+        for n in sizes:
+            grams.extend(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+
+class BM25Index:
+    """
+    작은 문서 집합용 BM25 (문서 수천 개까지 순수 파이썬/numpy로 충분)
+    문서별 가중치를 미리 계산해 두므로 질의는 겹치는 n-gram의 가중치 합만 구합니다.
+    """
+
+    def __init__(self, docs: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.size = len(docs)
+        doc_terms = [Counter(char_ngrams(doc)) for doc in docs]
+        lengths = np.array([sum(tf.values()) for tf in doc_terms], dtype=np.float32)
+        avg_len = float(lengths.mean()) if self.size else 0.0
+
+        df = Counter(term for tf in doc_terms for term in tf)
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (self.size - n + 0.5) / (n + 0.5)) for term, n in df.items()
+        }
+        # 사전에 없는 n-gram에 줄 idf (가장 드문 단어 수준)
+        self.max_idf = math.log(1 + (self.size + 0.5) / 0.5) if self.size else 0.0
+
+        postings: Dict[str, List[tuple]] = {}
+        for doc_id, tf in enumerate(doc_terms):
+            norm = self.k1 * (1 - b + b * lengths[doc_id] / avg_len) if avg_len else self.k1
+            for term, count in tf.items():
+                weight = self.idf[term] * count * (self.k1 + 1) / (count + norm)
+                postings.setdefault(term, []).append((doc_id, weight))
+        self.postings = {
+            term: (np.array([d for d, _ in items], dtype=np.intp), np.array([w for _, w in items], dtype=np.float32))
+            for term, items in postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(char_ngrams(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def relevance(self, query: str) -> float:
+        """
+        최고 BM25 점수 / 질의의 이론상 최대 점수 (0~1)
+        사전에 없는 n-gram(이름, 주소 등)도 분모에 포함되므로, 팁과 관계없는 답변일수록 0에 가깝습니다.
+        """
+        terms = set(char_ngrams(query))
+        if not terms or not self.size:
+            return 0.0
+        upper = sum(self.idf.get(t, self.max_idf) for t in terms) * (self.k1 + 1)
+        return float(self.scores(query).max() / upper) if upper else 0.0
+
+
+class LexicalVerdict(NamedTuple):
+    label: str  # "form" | "question" | "ambiguous"
+    relevance: float
+    reason: str
+
+
+def has_question_marker(message: str) -> bool:
+    if "?" in message or "？" in message:
+        return True
+    text = normalize_text(message)
+    if any(word in text for word in _INTERROGATIVES):
+        return True
+    return bool(_QUESTION_ENDING.search(text))
+
+
+def classify(index: BM25Index, message: str) -> LexicalVerdict:
+    stripped = message.strip()
+    if not stripped:
+        return LexicalVerdict("form", 0.0, "empty")
+    if _FORM_VALUE.match(stripped) or _EMAIL.match(stripped):
+        return LexicalVerdict("form", 0.0, "value")
+    if normalize_text(stripped) in _SHORT_ANSWERS:
+        return LexicalVerdict("form", 0.0, "short_answer")
+
+    relevance = index.relevance(stripped)
+    if has_question_marker(stripped):
+        if relevance >= LEXICAL_QUESTION_MIN:
+            return LexicalVerdict("question", relevance, "question_on_topic")
+        return LexicalVerdict("ambiguous", relevance, "question_off_topic")
+    if relevance >= LEXICAL_TOPIC_MIN:
+        return LexicalVerdict("ambiguous", relevance, "statement_on_topic")
+    return LexicalVerdict("form", relevance, "statement_off_topic")
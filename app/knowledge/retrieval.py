@@ -0,0 +1,110 @@
+# app/knowledge/retrieval.py
+# 정규화된 float32 임베딩 행렬에 대한 top-k 코사인 유사도 검색
+import os
+import re
+import unicodedata
+from typing import Tuple
+
+import numpy as np
+
+from app import metrics
+from app.cache import TTLCache
+from app.knowledge.batcher import get_batcher
+
+# 행 벡터 길이가 1에서 이 정도 이내면 이미 정규화된 것으로 봅니다. (복사 생략)
+_NORM_TOLERANCE = 1e-3
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    각 행을 L2 정규화한 C-연속 float32 행렬을 반환합니다.
+    이미 정규화된 float32 행렬(예: 메모리 매핑된 인덱스 파일)은 복사 없이 그대로 돌려줍니다.
+    """
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.dtype == np.float32 and matrix.flags.c_contiguous and matrix.shape[0] > 0:
+        norms = np.linalg.norm(matrix, axis=1)
+        if np.all(np.abs(norms - 1.0) <= _NORM_TOLERANCE):
+            return matrix
+
+    out = np.array(matrix, dtype=np.float32, order="C", copy=True)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0  # 0 벡터는 그대로 둡니다.
+    out /= norms
+    return out
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    """질의 벡터 하나를 float32 단위 벡터로 만듭니다."""
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """1차원 점수에서 상위 k개 인덱스를 점수 내림차순으로 반환합니다. (전체 정렬 없이 argpartition)"""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        part = np.argpartition(scores, n - k)[n - k:]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(scores[part])[::-1]]
+
+
+def top_k_batch(matrix: np.ndarray, queries: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    여러 질의를 한 번의 행렬 곱으로 채점합니다. (행마다 argpartition, 전체 정렬 없음)
+    matrix: normalize_rows()를 거친 (N, D) 행렬, queries: (Q, D) 행렬
+    반환: (Q, k) 인덱스, (Q, k) 유사도 — 각 행은 유사도 내림차순
+    """
+    q = normalize_rows(queries)
+    scores = q @ matrix.T  # (Q, N)
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((q.shape[0], 0), dtype=np.intp), np.empty((q.shape[0], 0), dtype=np.float32)
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(np.take_along_axis(scores, part, axis=1), axis=1)[:, ::-1]
+    idx = np.take_along_axis(part, order, axis=1)
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
+
+# =================================================================
+#   질의 임베딩 캐시 + 턴 단위 검색 컨텍스트
+# =================================================================
+# 같은 문장(공백/정규화 차이 무시)의 임베딩은 요청을 넘어 재사용합니다.
+# 항목 하나가 약 6KB(1536 x float32)이므로 기본 2000개 ≈ 12MB 입니다.
+query_embedding_cache = TTLCache(
+    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "2000")),
+    ttl_seconds=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400")),
+    name="query_embedding",
+)
+metrics.register("query_embedding_cache", query_embedding_cache.stats)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query_text(text: str) -> str:
+    """캐시 키용 정규화: 유니코드 NFC, 앞뒤 공백 제거, 연속 공백 하나로."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+async def embed_query(client, text: str, model: str) -> np.ndarray:
+    """질의 문장의 정규화된 float32 임베딩 (캐시 우선)"""
+    key = (model, normalize_query_text(text))
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 동시에 들어온 다른 요청들과 묶어 한 번의 API 호출로 보냅니다. (batcher.py)
+    vector = normalize(await get_batcher(client, model).embed(key[1] or text))
+    vector.setflags(write=False)  # 캐시에 공유되므로 읽기 전용
+    query_embedding_cache.set(key, vector)
+    return vector
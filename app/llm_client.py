@@ -0,0 +1,34 @@
+# app/llm_client.py
+# 모든 핸들러와 지식 베이스가 함께 쓰는 OpenAI 클라이언트 (워커당 하나, 커넥션 풀 공유)
+import os
+import asyncio
+from typing import Sequence
+from openai import AsyncOpenAI
+
+client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+# 시작 시 미리 열어 둘 HTTP 커넥션 수 (동시에 들어올 첫 LLM 호출 수 정도)
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "4"))
+
+
+async def warm_up(models: Sequence[str], count: int = LLM_WARMUP_CONNECTIONS) -> int:
+    """
+    가벼운 요청(models.retrieve)을 count개 동시에 보내 TLS 연결을 커넥션 풀에 만들어 둡니다.
+    models: 실제로 호출할 모델들 (app/warmup.py가 추출/RAG 설정에서 모읍니다). 요청을 돌아가며 나눠 보내므로
+    모델 이름이 잘못 설정되었거나 권한이 없으면 시작 로그에서 바로 드러납니다.
+    with_options는 같은 HTTP 클라이언트(풀)를 공유하므로, 이후 chat/embeddings 호출이 이 연결을 재사용합니다.
+    성공한 요청 수를 반환합니다 (실패는 로그만 남깁니다).
+    """
+    models = list(dict.fromkeys(models))
+    count = max(count, len(models)) if count > 0 else 0
+    if count <= 0 or not models:
+        return 0
+    quick = client.with_options(timeout=10, max_retries=0)
+    results = await asyncio.gather(
+        *(quick.models.retrieve(models[i % len(models)]) for i in range(count)),
+        return_exceptions=True,
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        print(f"⚠️ LLM 커넥션 예열 실패 {len(failures)}/{count}: {failures[0]}")
+    return count - len(failures)
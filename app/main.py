@@ -1,23 +1,77 @@
 # 모든 라우터를 모아 최종 FastAPI 앱을 만듬
 # app/main.py
+import os
+import signal
+import asyncio
+import threading
 from fastapi import FastAPI, Depends, status, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .routers import users, contracts
+from .database import engine, Base, describe_connection_mode, describe_pool
+from .routers import users, contracts, internal
+from .warmup import run_warm_up, warmup_state
 from contextlib import asynccontextmanager
 
+# 종료 신호를 받은 뒤 실제 종료를 시작하기 전까지 /ready 503을 유지하는 시간(초).
+# 로드밸런서가 헬스체크로 이 인스턴스를 빼는 동안 이미 들어오는 요청은 계속 처리합니다. 0이면 바로 종료합니다.
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0"))
+
+
+def _install_drain_handlers(loop: asyncio.AbstractEventLoop):
+    """
+    uvicorn이 설치한 SIGTERM/SIGINT 핸들러 앞에 끼어들어, 종료 신호를 받는 즉시 draining으로 표시합니다.
+    (lifespan 종료 단계는 uvicorn이 이미 새 연결을 받지 않게 된 뒤에야 실행되므로 거기서 표시하면 늦습니다.)
+    """
+    # 신호 핸들러는 메인 스레드에서만 바꿀 수 있습니다.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handle(signum, frame, previous=previous):
+            already_draining = warmup_state.draining
+            warmup_state.draining = True
+            if SHUTDOWN_DRAIN_SECONDS > 0 and not already_draining:
+                print(f"INFO:     Draining for {SHUTDOWN_DRAIN_SECONDS:.0f}s before shutdown (/ready returns 503).")
+                loop.call_soon_threadsafe(loop.call_later, SHUTDOWN_DRAIN_SECONDS, previous, signum, frame)
+            else:
+                # 두 번째 신호는 기다리지 않고 바로 넘깁니다.
+                previous(signum, frame)
+
+        signal.signal(sig, handle)
+
+
+async def _warm_up_in_background():
+    # 첫 요청들이 인덱스 로드/TLS 연결/DB 연결 비용을 떠안지 않도록 동시에 예열합니다. (app/warmup.py)
+    result = await run_warm_up()
+    for name, info in result["components"].items():
+        print(f"INFO:     Warm-up {name}: ok={info['ok']} result={info['result']} ({info['seconds']}s)")
+    print(f"INFO:     Warm-up finished in {result['seconds']}s. Ready to serve.")
+
+
 # ❗️ Lifespan 컨텍스트 매니저 정의
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 앱 시작 시 실행될 코드
     print("INFO:     Application startup. Initializing database connection.")
-    # 이 부분에 특별한 시작 로직이 없다면 비워두어도 됩니다.
-    # 연결은 첫 요청 시 자동으로 생성됩니다.
+    print(f"INFO:     {describe_connection_mode()}")
+    print(f"INFO:     {describe_pool()}")
+    _install_drain_handlers(asyncio.get_running_loop())
+    # 예열은 백그라운드에서 돌리고 바로 요청을 받기 시작합니다. 끝나기 전까지 /ready는 503입니다.
+    # 태스크 참조를 app.state에 들고 있어야 실행 중에 GC되지 않습니다.
+    app.state.warmup_task = asyncio.create_task(_warm_up_in_background())
     
     yield  # 이 지점에서 애플리케이션이 실행됩니다.
     
     # 앱 종료 시 실행될 코드
+    # 신호 없이 종료되는 경우(테스트 등)에도 /ready가 503을 반환하도록 표시합니다.
+    warmup_state.draining = True
+    warmup_task = app.state.warmup_task
+    if not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
     print("INFO:     Application shutdown. Disposing of the engine.")
     await engine.dispose()
 
@@ -47,6 +101,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # 모든 HTTP 메소드 허용
     allow_headers=["*"], # 모든 HTTP 헤더 허용
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"], # 페이지네이션 커서, 재시도 응답 여부를 프론트에서 읽을 수 있도록 노출
 )
 
 
@@ -71,6 +126,7 @@ async def shutdown():
 # 각 기능별 라우터를 앱에 포함
 app.include_router(users.router)
 app.include_router(contracts.router)
+app.include_router(internal.router)
 
 @app.get("/")
 def read_root():
@@ -79,3 +135,12 @@ def read_root():
     """
     return {"message": "Welcome to LawBot API"}
 
+
+@app.get("/ready", include_in_schema=False)
+def read_ready():
+    """
+    준비 상태 확인용 (readiness probe). 시작 시 예열이 끝난 뒤에만 200, 그 전이나 종료 신호를 받은 뒤에는 503을 반환합니다.
+    """
+    snapshot = warmup_state.snapshot()
+    status_code = status.HTTP_200_OK if snapshot["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=status_code, content=snapshot)
@@ -0,0 +1,53 @@
+# app/metrics.py
+# 프로세스 내부 지표 (풀 사용량, 캐시 적중률 등)를 모아 /internal/metrics 로 노출합니다.
+import bisect
+from typing import Callable, Dict, List, Sequence
+
+# 지연 시간(초) 히스토그램의 기본 구간
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """누적(cumulative)이 아닌 구간별 카운트를 갖는 단순 히스토그램입니다."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 마지막 칸 = +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+# 이름 -> 현재 값을 dict로 돌려주는 함수
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    """지표 제공 함수를 등록합니다. 같은 이름으로 다시 등록하면 덮어씁니다."""
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
@@ -1,9 +1,9 @@
 # app/models.py
 
-from sqlalchemy import Column, String, ForeignKey, JSON, TIMESTAMP
+from sqlalchemy import Column, String, Text, BigInteger, Identity, Index, ForeignKey, TIMESTAMP
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID  # ❗️ UUID 타입을 import
+from sqlalchemy.dialects.postgresql import UUID, JSONB  # ❗️ UUID 타입을 import
 import uuid
 
 from .database import Base
@@ -32,12 +32,15 @@ class Contract(Base):
     생성된 계약서 정보를 저장하는 테이블 모델
     """
     __tablename__ = "contracts"
+    # INSERT/UPDATE 시 서버 기본값(created_at, updated_at)을 RETURNING으로 함께 받아옵니다.
+    __mapper_args__ = {"eager_defaults": True}
 
     
     #id = Column(Integer, primary_key=True, index=True)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     contract_type = Column(String, index=True, nullable=False)
-    content = Column(JSON, nullable=True)
+    # jsonb로 저장해서 변경된 키만 서버에서 병합(content || patch)할 수 있게 합니다.
+    content = Column(JSONB, nullable=True)
     status = Column(String, default="in_progress")
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -48,6 +51,50 @@ class Contract(Base):
     
     # ❗️ 관계 설정의 이름과 대상을 'Profile' 모델에 맞게 수정합니다.
     owner_profile = relationship("Profile", back_populates="contracts")
-    # ✅ [추가] 채팅 기록을 저장할 컬럼
-    # 기본값으로 빈 리스트 '[]'를 저장하도록 설정합니다.
-    chat_history = Column(JSON, nullable=False, default=[])
+    # ✅ 채팅 기록은 chat_messages 테이블에 한 줄씩 저장합니다. (기존 chat_history JSON 컬럼 대체)
+    # 계약서 삭제 시 DB의 ON DELETE CASCADE로 함께 지워집니다.
+    messages = relationship(
+        "ChatMessage", back_populates="contract", passive_deletes=True, lazy="raise"
+    )
+
+    __table_args__ = (
+        # 내 계약서 목록: owner_id로 거르고 (updated_at, id) 역순 커서로 페이지네이션
+        Index("ix_contracts_owner_updated", owner_id, updated_at.desc(), id.desc()),
+    )
+
+
+class ChatMessage(Base):
+    """
+    계약서별 채팅 메시지 테이블 (append-only)
+    한 턴은 몇 개의 행 INSERT로 끝나고, 기록은 (contract_id, seq) 인덱스로 키셋 페이지네이션합니다.
+    """
+    __tablename__ = "chat_messages"
+
+    # 전역 증가 시퀀스 → 같은 계약서 안에서 메시지 순서를 그대로 보장합니다.
+    seq = Column(BigInteger, Identity(), primary_key=True)
+    contract_id = Column(UUID(as_uuid=True), ForeignKey("contracts.id", ondelete="CASCADE"), nullable=False)
+    sender = Column(String, nullable=False)  # "bot" | "user"
+    message = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    contract = relationship("Contract", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_chat_messages_contract_seq", "contract_id", "seq"),
+    )
+
+
+class IdempotencyKey(Base):
+    """
+    Idempotency-Key 헤더로 처리한 요청의 응답을 저장하는 테이블 (IDEMPOTENCY_BACKEND="db"일 때 사용)
+    같은 키로 재시도하면 LLM 호출/INSERT 없이 저장된 응답을 그대로 돌려줍니다.
+    """
+    __tablename__ = "idempotency_keys"
+
+    # "{user_id}:{scope}:{Idempotency-Key}"
+    key = Column(String, primary_key=True)
+    # 요청 본문의 해시 (같은 키를 다른 요청에 재사용했는지 확인)
+    fingerprint = Column(String, nullable=False)
+    response = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
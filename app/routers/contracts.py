@@ -1,12 +1,18 @@
 import io
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from .. import crud, schemas, models, services # services.py를 만들어 AI 로직을 넣을 예정
-from ..database import get_db
+from ..database import get_db, async_session
 from ..dependencies import verify_supabase_token 
+from ..turn_queue import chat_turns, TurnAbandoned, TurnQueueFull
+from ..idempotency import idempotency_store, IdempotencyKeyReused, IDEMPOTENCY_KEY_MAX_LENGTH
+from ..knowledge import answer_tokens
 from uuid import UUID
 from urllib.parse import quote
 from app.schemas import ContractUpdate
@@ -27,6 +33,58 @@ WELCOME_MESSAGES = {
     # 여기에 다른 계약서 종류도 추가하면 됩니다.
 }
 
+# 상세 조회 시 함께 내려줄 최근 채팅 메시지 개수
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# 스트리밍 응답이 프록시(nginx 등)에서 버퍼링되지 않도록 합니다.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# 클라이언트 연결이 끊겨도 끝까지 실행해 저장하는 스트리밍 턴 (약한 참조만으로는 실행 중 GC될 수 있음)
+_streaming_turns = set()
+
+
+def _message_to_dict(msg: models.ChatMessage) -> dict:
+    return {"seq": msg.seq, "sender": msg.sender, "message": msg.message}
+
+
+def get_idempotency_key(
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", description="재시도 시 같은 값을 보내면 저장된 응답을 그대로 돌려받습니다."
+    )
+) -> Optional[str]:
+    if idempotency_key is not None and not (0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key 형식이 올바르지 않습니다.")
+    return idempotency_key
+
+
+async def run_idempotent(db, response: Response, idempotency_key, user_id, scope, body, work):
+    """Idempotency-Key가 있으면 저장된 응답을 재사용하고, 없으면 그대로 실행합니다."""
+    if idempotency_key is None:
+        return await work()
+    try:
+        result, replayed = await idempotency_store.run(
+            db, user_id=user_id, scope=scope, key=idempotency_key, body=body, work=work
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="같은 Idempotency-Key가 다른 요청에 이미 사용되었습니다.",
+        )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def _forget_turn(task: asyncio.Task):
+    _streaming_turns.discard(task)
+    if not task.cancelled():
+        task.exception()  # 스트림이 먼저 끊긴 경우에도 경고가 남지 않도록 회수 처리
+
+
 router = APIRouter(
     prefix="/api/contracts",
     tags=["contracts"],
@@ -51,68 +109,95 @@ async def create_new_contract(
 @router.post("", response_model=schemas.ContractDetail, status_code=status.HTTP_201_CREATED)
 async def create_new_contract(
     contract_data: schemas.ContractCreate,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(verify_supabase_token)
+    current_user: dict = Depends(verify_supabase_token),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
 ):
     """
     ### 새 계약서 생성
     - 계약서를 생성함과 동시에 **첫 번째 인사말과 질문을 채팅 내역에 저장**합니다.
     - 프론트엔드에서 채팅창을 열자마자 봇의 메시지가 보이게 됩니다.
+    - `Idempotency-Key` 헤더를 보내면 같은 키로 재시도해도 계약서가 한 번만 생성됩니다.
     """
+    user_id = UUID(current_user['id'])
+
+    async def create():
+        # -----------------------------------------------------------
+        # 🤖 봇의 첫 메시지 생성
+        # -----------------------------------------------------------
     
-    # 1. 계약서 DB 생성 (기존 로직) -> id, owner_id, content={} 상태로 생성됨
-    new_contract = await crud.create_contract(db=db, contract=contract_data, user_id=UUID(current_user['id']))
-    
-    # -----------------------------------------------------------
-    # 🤖 봇의 첫 메시지 생성 및 저장 로직
-    # -----------------------------------------------------------
-    
-    # 2. services를 통해 첫 번째 질문 찾기 (content가 비어있으므로 첫 질문이 나옴)
-    first_question = services.find_next_question(new_contract)
+        # 1. services를 통해 첫 번째 질문 찾기 (content가 비어있으므로 첫 질문이 나옴)
+        #    아직 DB에 넣기 전의 임시 객체로 계산합니다.
+        draft_contract = models.Contract(contract_type=contract_data.contract_type, content={})
+        first_question = services.find_next_question(draft_contract)
     
-    # 3. 계약서 타입에 맞는 인사말 가져오기
-    welcome_msg = WELCOME_MESSAGES.get(contract_data.contract_type, "안녕하세요! LAW BOT입니다.")
+        # 2. 계약서 타입에 맞는 인사말 가져오기
+        welcome_msg = WELCOME_MESSAGES.get(contract_data.contract_type, "안녕하세요! LAW BOT입니다.")
     
-    # 5. 초기 채팅 내역 리스트 생성
-    initial_chat_history = [
-        {
-            "sender": "bot", 
-            "message": welcome_msg 
+        # 3. 초기 채팅 내역 리스트 생성
+        initial_chat_history = [
+            {
+                "sender": "bot", 
+                "message": welcome_msg 
+            }
+        ]
+
+        if first_question:
+            initial_chat_history.append({
+                "sender": "bot",
+                "message": first_question
+            })
+
+        # 4. 계약서 DB 생성 + 초기 채팅 내역 저장을 INSERT ... RETURNING 한 번으로 처리
+        new_contract = await crud.create_contract(
+            db=db,
+            contract=contract_data,
+            user_id=user_id,
+            chat_history=initial_chat_history
+        )
+
+        # 5. 생성된 계약서 반환 (chat_history에 첫 인사가 포함됨)
+        return {
+            "id": new_contract.id,
+            "contract_type": new_contract.contract_type,
+            "content": new_contract.content,
+            "status": new_contract.status,
+            "updated_at": new_contract.updated_at,
+            "owner_id": new_contract.owner_id,
+            "next_question": first_question,
+            "chat_history": initial_chat_history,
         }
-    ]
-
-    if first_question:
-        initial_chat_history.append({
-            "sender": "bot",
-            "message": first_question
-        })
-
-    # 6. DB 업데이트 (crud.update_contract 활용)
-    # crud.update_contract는 content와 chat_history를 모두 받으므로,
-    # 기존 content(빈 딕셔너리)는 그대로 유지하고 chat_history만 채워서 보냅니다.
-    updated_contract = await crud.update_contract(
-        db=db,
-        contract_id=new_contract.id,
-        new_content=new_contract.content,       # 기존 내용 유지 ({})
-        new_chat_history=initial_chat_history   # 인사말 추가
-    )
 
-    # 7. 업데이트된 계약서 반환 (이제 chat_history에 첫 인사가 포함됨)
-    return updated_contract
+    return await run_idempotent(db, response, idempotency_key, user_id, "create", contract_data, create)
 
 
 @router.get("", response_model=List[schemas.ContractInfo])
 async def get_my_contracts(
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="이전 응답의 X-Next-Cursor 헤더 값"),
     db: AsyncSession = Depends(get_db),
     #current_user: models.User = Depends(verify_supabase_token)
     current_user: dict = Depends(verify_supabase_token)
 ):
     """
     ### 내 계약서 목록 조회
-    - 현재 **로그인된 사용자**가 작성한 모든 계약서의 목록을 조회합니다.
+    - 현재 **로그인된 사용자**가 작성한 계약서 목록을 최신순으로 조회합니다.
     - 마이페이지 기능에 사용됩니다.
+    - 한 번에 `limit`개씩 반환하며, 다음 페이지가 있으면 `X-Next-Cursor` 응답 헤더에 커서를 담습니다.
+      다음 요청의 `cursor` 쿼리 파라미터로 그대로 넘겨주세요.
     """
-    return await crud.get_contracts_by_owner(db=db, user_id=UUID(current_user['id']))
+    try:
+        contracts, next_cursor = await crud.get_contracts_by_owner(
+            db=db, user_id=UUID(current_user['id']), limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="잘못된 cursor 값입니다.")
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return contracts
 
 @router.get("/{contract_id}", response_model=schemas.ContractDetail)
 async def get_contract_details(
@@ -167,6 +252,9 @@ async def get_contract_details(
 
     with open(html_path, "r", encoding="utf-8") as f:
         html_content = f.read()
+
+    # ✅ 채팅 기록은 최근 한 페이지만 내려주고, 이전 기록은 /messages 로 이어서 조회합니다.
+    messages, history_cursor = await crud.get_chat_messages(db, contract_id=contract_id, limit=CHAT_HISTORY_PAGE_SIZE)
     
      # ContractDetail 스키마를 확장해 templateHtml 필드를 포함시켰다고 가정
     return {
@@ -178,29 +266,162 @@ async def get_contract_details(
         "next_question": db_contract.next_question,
         "content": db_contract.content,
         "templateHtml": html_content,   # ✅ 프론트에서 미리보기용으로 사용할 HTML
-        "chat_history": db_contract.chat_history if hasattr(db_contract, "chat_history") else [],
+        "chat_history": [_message_to_dict(m) for m in messages],
+        "chat_history_cursor": history_cursor,
     }
 
+@router.get("/{contract_id}/messages", response_model=schemas.ChatHistoryPage)
+async def get_chat_history(
+    contract_id: UUID,
+    before: Optional[int] = Query(None, description="이 seq보다 이전 메시지만 조회 (이전 응답의 next_cursor)"),
+    limit: int = Query(CHAT_HISTORY_PAGE_SIZE, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(verify_supabase_token)
+):
+    """
+    ### 채팅 기록 조회 (키셋 페이지네이션)
+    - 최신 메시지부터 `limit`개씩, 시간순으로 정렬해 반환합니다.
+    - `next_cursor`를 `before`에 넣어 더 이전 기록을 이어서 불러옵니다.
+    - 계약서가 없거나 다른 사용자의 것이면 404를 반환합니다. (빈 목록은 "메시지 없음"만 뜻합니다)
+    """
+    if not await crud.contract_belongs_to(db, contract_id=contract_id, user_id=UUID(current_user['id'])):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="계약서를 찾을 수 없거나 접근 권한이 없습니다.")
+    messages, next_cursor = await crud.get_chat_messages(
+        db,
+        contract_id=contract_id,
+        before_seq=before,
+        limit=limit
+    )
+    return {"messages": [_message_to_dict(m) for m in messages], "next_cursor": next_cursor}
+
 @router.post("/{contract_id}/chat", response_model=schemas.ChatResponse)
 async def chat_with_bot(
     contract_id: UUID,
     chat_data: schemas.ChatRequest,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     #current_user: models.User = Depends(verify_supabase_token)
-    current_user: dict = Depends(verify_supabase_token)
+    current_user: dict = Depends(verify_supabase_token),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
 ):
     """
     ### 챗봇과 대화 (계약서 업데이트)
     - 사용자의 채팅 메시지를 받아 계약서 내용을 업데이트하고, 다음 질문을 반환합니다.
     - **실시간 계약서 업데이트**의 핵심 API입니다.
+    - 같은 계약서의 요청은 순서대로 하나씩 처리되며, 처리 중인 요청과 같은 메시지가 짧은 시간 안에
+      다시 오면(`CHAT_DEDUPE_WINDOW_SECONDS`) 새로 처리하지 않고 같은 응답을 돌려줍니다.
+    - `Idempotency-Key` 헤더를 보내면 같은 키로 재시도할 때 AI 호출 없이 저장된 응답을 돌려줍니다.
     """
-    db_contract = await crud.get_contract_by_id(db=db, contract_id=contract_id, user_id=UUID(current_user['id']))
+    user_id = UUID(current_user['id'])
+
+    async def run_turn():
+        # 직전 턴이 저장한 content를 읽도록 계약서는 반드시 큐 안에서 불러옵니다.
+        db_contract = await crud.get_contract_by_id(db=db, contract_id=contract_id, user_id=user_id)
+        if db_contract is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="계약서를 찾을 수 없거나 접근 권한이 없습니다.")
+
+        # 실제 AI 로직은 services.py에서 처리
+        return await services.process_chat_message(db, db_contract, chat_data.message)
+
+    async def queued_turn():
+        return await chat_turns.submit(
+            key=contract_id,
+            work=run_turn,
+            # 다른 사용자의 요청과 결과가 섞이지 않도록 user_id를 포함합니다.
+            dedupe_key=(user_id, chat_data.message.strip()),
+        )
+
+    try:
+        return await run_idempotent(
+            db, response, idempotency_key, user_id, f"chat:{contract_id}", chat_data, queued_turn
+        )
+    except TurnQueueFull:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="이전 메시지를 처리하는 중입니다. 잠시 후 다시 시도해주세요.")
+    except TurnAbandoned:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="같은 메시지의 처리가 중단되었습니다. 다시 시도해주세요.")
+
+@router.post("/{contract_id}/chat/stream")
+async def chat_with_bot_stream(
+    contract_id: UUID,
+    chat_data: schemas.ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(verify_supabase_token)
+):
+    """
+    ### 챗봇과 대화 (Server-Sent Events 스트리밍)
+    - `/chat`과 같은 턴을 실행하되, 법률 질문(RAG) 답변을 생성되는 대로 `token` 이벤트로 흘려보냅니다.
+      - `event: token` / `data: {"text": "..."}` : 답변 조각 (이어 붙이면 RAG 답변)
+      - `event: final` / `data: ChatResponse + {"next_question": ...}` : 계약서 저장이 끝난 뒤 한 번
+      - `event: error` / `data: {"status": 429, "detail": "..."}` : 턴을 처리하지 못한 경우
+    - 폼 답변처럼 RAG가 아닌 턴은 `token` 없이 `final`만 옵니다. (`final.reply`를 표시)
+    - 스트림 도중 연결이 끊겨도 턴은 끝까지 처리되어 저장됩니다. `Idempotency-Key`는 지원하지 않습니다.
+    """
+    user_id = UUID(current_user['id'])
+
+    # 스트림을 열기 전에 확인해야 404를 일반 응답으로 돌려줄 수 있습니다.
+    db_contract = await crud.get_contract_by_id(db=db, contract_id=contract_id, user_id=user_id)
     if db_contract is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="계약서를 찾을 수 없거나 접근 권한이 없습니다.")
+    contract_type = db_contract.contract_type
+    await db.commit()
+
+    tokens: asyncio.Queue = asyncio.Queue()
+
+    async def run_turn():
+        # 요청의 DB 세션은 응답(스트림)이 시작되기 전에 닫히므로, 턴은 자체 세션으로 실행합니다.
+        async with async_session() as turn_db:
+            contract = await crud.get_contract_by_id(db=turn_db, contract_id=contract_id, user_id=user_id)
+            if contract is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="계약서를 찾을 수 없거나 접근 권한이 없습니다.")
+            return await services.process_chat_message(turn_db, contract, chat_data.message)
+
+    async def streamed_turn():
+        # 이 태스크 안에서 생성되는 RAG 답변 조각이 tokens 큐로 들어옵니다. (knowledge/answer.py)
+        answer_tokens.set(tokens)
+        try:
+            return await chat_turns.submit(
+                key=contract_id,
+                work=run_turn,
+                dedupe_key=(user_id, chat_data.message.strip()),
+            )
+        finally:
+            tokens.put_nowait(None)
 
-    # 실제 AI 로직은 services.py에서 처리
-    response = await services.process_chat_message(db, db_contract, chat_data.message)
-    return response
+    turn = asyncio.create_task(streamed_turn())
+    _streaming_turns.add(turn)
+    turn.add_done_callback(_forget_turn)
+
+    async def events():
+        while True:
+            text = await tokens.get()
+            if text is None:
+                break
+            yield _sse("token", {"text": text})
+
+        try:
+            result = await turn
+        except TurnQueueFull:
+            yield _sse("error", {"status": status.HTTP_429_TOO_MANY_REQUESTS, "detail": "이전 메시지를 처리하는 중입니다. 잠시 후 다시 시도해주세요."})
+            return
+        except TurnAbandoned:
+            yield _sse("error", {"status": status.HTTP_409_CONFLICT, "detail": "같은 메시지의 처리가 중단되었습니다. 다시 시도해주세요."})
+            return
+        except HTTPException as e:
+            yield _sse("error", {"status": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            print(f"❌ 스트리밍 채팅 처리 실패 ({contract_id}): {e}")
+            yield _sse("error", {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "메시지를 처리하지 못했습니다."})
+            return
+
+        # 저장된 content 기준의 다음 질문 (상세 조회와 같은 계산)
+        next_question = None
+        if contract_type in services.CONTRACT_HANDLERS:
+            content = result.full_contract_data if result.full_contract_data is not None else db_contract.content
+            next_question = services.find_next_question(models.Contract(contract_type=contract_type, content=content or {}))
+        yield _sse("final", {**jsonable_encoder(result), "next_question": next_question})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.delete("/{contract_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_contract(
@@ -277,23 +498,16 @@ async def update_contract_content(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
 
-    # 2. 계약서 조회 (crud.py의 함수 이름 사용!)
-    contract = await crud.get_contract_by_id(db, contract_id=contract_uuid, user_id=user_uuid)
+    # 2. 변경된 필드만 DB에서 병합 (content || patch)
+    #    소유권 검사도 같은 UPDATE 문에서 처리하므로 따로 조회하지 않습니다.
+    updated_contract = await crud.patch_contract_content(
+        db,
+        contract_id=contract_uuid,
+        set_fields=update_data.content,
+        owner_id=user_uuid
+    )
     
-    if not contract:
+    if not updated_contract:
         raise HTTPException(status_code=404, detail="Contract not found")
-
-    # 3. 기존 내용에 새로운 내용 병합 (Merge)
-    current_content = dict(contract.content) if contract.content else {}
-    current_content.update(update_data.content)
-    
-    # 4. DB 저장 (crud.py에 있는 업데이트 함수 재사용 가능)
-    #    update_contract_content_multiple 함수가 이미 구현되어 있으니 이걸 쓰면 깔끔합니다!
-    updated_contract = await crud.update_contract_content_multiple(
-        db=db, 
-        contract=contract, 
-        fields_to_update=update_data.content
-    )
     
     return {"status": "success", "content": updated_contract.content}
-
@@ -0,0 +1,39 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+
+from .. import metrics
+
+# 내부 지표 조회용 토큰. 설정하지 않으면 로컬(loopback)에서 온 요청만 허용합니다.
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+def verify_internal_access(
+    request: Request,
+    x_internal_token: Optional[str] = Header(default=None),
+):
+    if INTERNAL_API_TOKEN:
+        if x_internal_token and hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+            return
+    elif request.client and request.client.host in LOOPBACK_HOSTS:
+        return
+    # 존재 자체를 드러내지 않도록 404로 응답합니다.
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    include_in_schema=False,
+    dependencies=[Depends(verify_internal_access)],
+)
+
+
+@router.get("/metrics")
+def read_metrics():
+    """
+    커넥션 풀, 캐시 등 프로세스 내부 지표를 반환합니다. (워커별 값)
+    """
+    return metrics.snapshot()
@@ -6,7 +6,8 @@ from app.supabase_client import supabase
 from postgrest import APIError as PostgrestAPIError
 from gotrue.errors import AuthApiError
 
-from ..dependencies import verify_supabase_token
+from fastapi.security import HTTPAuthorizationCredentials
+from ..dependencies import unverified_exp, bearer_scheme, revoke_token, revoke_user, verify_supabase_token
 
 from app.schemas import UserSignUp
 from app.schemas import UserLogin
@@ -139,10 +140,18 @@ async def login(user_credentials: UserLogin):
         )
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-async def logout(current_user: dict = Depends(verify_supabase_token)):
+async def logout(
+    current_user: dict = Depends(verify_supabase_token),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
     """
     유효한 토큰을 검증하여 현재 사용자의 세션을 종료하고 로그아웃을 처리합니다.
     """
+    # 0. 이 토큰과, 지금까지 이 사용자에게 발급된 토큰을 모두 거부 목록에 올리고 캐시에서 제거
+    #    (전역 로그아웃이므로 사용자 기준, 로컬 검증만으로는 exp 전까지 다시 통과하기 때문)
+    revoke_token(credentials.credentials)
+    revoke_user(current_user["id"], until=unverified_exp(credentials.credentials))
+
     try:
         # 1. 토큰 검증 완료
         # Depends(verify_supabase_token) 덕분에, 이 함수가 실행되는 것은
@@ -83,8 +83,10 @@ class ContractDetail(BaseModel):
     # ✅ [추가] 프론트에서 미리보기용 HTML 템플릿
     templateHtml: Optional[str] = None   # HTML 문서 전체를 문자열로 반환
 
-    # ✅ [추가] 대화 히스토리 (선택적으로 포함 가능)
+    # ✅ [추가] 대화 히스토리 (최근 메시지 한 페이지)
     chat_history: Optional[List[Dict[str, Any]]] = None
+    # 더 이전 메시지가 있으면 GET /{contract_id}/messages?before=<값> 으로 이어서 조회
+    chat_history_cursor: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -109,4 +111,10 @@ class ChatResponse(BaseModel):
     updated_field: Optional[List[UpdatedField]] = None
     is_finished: bool
     full_contract_data: Optional[Dict[str, Any]] = None
+    # 이번 턴에 새로 추가된 메시지만 담습니다. (전체 기록은 /messages 로 조회)
     chat_history: Optional[List[Dict[str, Any]]] = None
+
+# 채팅 기록 페이지 (Response)
+class ChatHistoryPage(BaseModel):
+    messages: List[Dict[str, Any]]   # [{"seq": 1, "sender": "bot", "message": "..."}, ...] (시간순)
+    next_cursor: Optional[int] = None  # 더 이전 메시지가 없으면 null
@@ -1,8 +1,12 @@
 import os
+import time
+import asyncio
+import httpx
+from typing import Dict, Optional
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
-from jose import jwt
+from jose import JWTError, jwt
 
 # .env 파일에서 환경 변수를 로드합니다.
 load_dotenv()
@@ -45,3 +49,148 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+
+
+# =================================================================
+#                  Supabase JWT 로컬 검증
+# =================================================================
+# 매 요청마다 supabase_client.auth.get_user(token)으로 인증 서버에 묻는 대신,
+# 프로젝트 JWT secret(HS256) 또는 캐시된 JWKS(ES256/RS256)로 토큰을 직접 검증합니다.
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWT_ISSUER = os.getenv("SUPABASE_JWT_ISSUER") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1" if SUPABASE_URL else None
+)
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+
+# "local": 로컬 검증 후 불가능할 때만 get_user로 폴백 / "remote": 항상 get_user 사용
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local")
+JWKS_CACHE_TTL_SECONDS = int(os.getenv("JWKS_CACHE_TTL_SECONDS", "600"))
+# 모르는 kid가 들어왔을 때 JWKS를 다시 받아오는 최소 간격 (키 교체 대응 + 요청 폭주 방지)
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", "10"))
+
+ASYMMETRIC_ALGORITHMS = {"ES256", "RS256"}
+
+
+class SupabaseTokenError(Exception):
+    """서명/만료/aud/iss 검증에 실패한 토큰. 원격 폴백 없이 401로 처리합니다."""
+
+
+class LocalVerificationUnavailable(Exception):
+    """로컬에서 판단할 수 없는 경우 (secret 미설정, JWKS 조회 실패 등). get_user로 폴백합니다."""
+
+
+class JWKSCache:
+    """
+    Supabase JWKS를 메모리에 캐시합니다.
+    - TTL이 지나면 다음 조회 시 새로 받아옵니다.
+    - 캐시에 없는 kid가 들어오면 (키 교체) 최소 간격을 지켜 즉시 다시 받아옵니다.
+    """
+
+    def __init__(self, url: Optional[str], ttl_seconds: int, min_refresh_seconds: int):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self):
+        async with httpx.AsyncClient(timeout=5.0) as http:
+            resp = await http.get(self.url)
+            resp.raise_for_status()
+            jwks = resp.json()
+        self._keys = {k["kid"]: k for k in jwks.get("keys", []) if "kid" in k}
+        self._fetched_at = time.monotonic()
+        print(f"INFO:     Supabase JWKS loaded ({len(self._keys)} keys).")
+
+    async def get_key(self, kid: str) -> dict:
+        if not self.url:
+            raise LocalVerificationUnavailable("SUPABASE_JWKS_URL is not configured.")
+
+        age = time.monotonic() - self._fetched_at
+        if kid in self._keys and age < self.ttl_seconds:
+            return self._keys[kid]
+
+        async with self._lock:
+            # 락을 기다리는 동안 다른 요청이 이미 갱신했을 수 있습니다.
+            age = time.monotonic() - self._fetched_at
+            stale = age >= self.ttl_seconds
+            unknown_kid = kid not in self._keys
+            if stale or (unknown_kid and age >= self.min_refresh_seconds):
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    if kid in self._keys:
+                        # 갱신 실패 시 기존 키로 계속 검증합니다.
+                        return self._keys[kid]
+                    raise LocalVerificationUnavailable(f"JWKS fetch failed: {e}")
+
+        if kid not in self._keys:
+            raise LocalVerificationUnavailable(f"Unknown signing key id: {kid}")
+        return self._keys[kid]
+
+
+jwks_cache = JWKSCache(SUPABASE_JWKS_URL, JWKS_CACHE_TTL_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+
+
+async def verify_supabase_jwt(token: str) -> dict:
+    """
+    Supabase access token의 서명, 만료(exp), audience, issuer를 로컬에서 검증하고 claims를 반환합니다.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError as e:
+        raise SupabaseTokenError(f"Malformed token: {e}")
+
+    alg = header.get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET is not configured.")
+        key = SUPABASE_JWT_SECRET
+    elif alg in ASYMMETRIC_ALGORITHMS:
+        kid = header.get("kid")
+        if not kid:
+            raise SupabaseTokenError("Token header has no 'kid'.")
+        key = await jwks_cache.get_key(kid)
+    else:
+        raise LocalVerificationUnavailable(f"Unsupported JWT algorithm: {alg}")
+
+    options = {"leeway": JWT_LEEWAY_SECONDS, "verify_iss": SUPABASE_JWT_ISSUER is not None}
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=SUPABASE_JWT_AUDIENCE,
+            issuer=SUPABASE_JWT_ISSUER,
+            options=options,
+        )
+    except JWTError as e:
+        raise SupabaseTokenError(str(e))
+
+    if not claims.get("sub"):
+        raise SupabaseTokenError("Token has no 'sub' claim.")
+    return claims
+
+
+def user_from_claims(claims: dict) -> dict:
+    """
+    검증된 claims를 get_user(token).user.dict()와 같은 모양의 dict로 변환합니다.
+    (라우터에서는 current_user['id']만 사용합니다.)
+    """
+    return {
+        "id": claims["sub"],
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+        "is_anonymous": claims.get("is_anonymous", False),
+    }
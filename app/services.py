@@ -1,4 +1,5 @@
 import os
+from typing import Any, Dict, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from docxtpl import DocxTemplate
 from . import crud, models, schemas
@@ -31,18 +32,29 @@ def find_next_question(contract):
 
 
 
+# 계약서 종류 -> 핸들러 (각 핸들러 모듈의 CONTRACT_TYPE 기준)
+CONTRACT_HANDLERS = {
+    handler.CONTRACT_TYPE: handler
+    for handler in (working_ai, foreign_ai, attorney_ai, house_ai)
+}
+
+
 def get_contract_handler(contract_type: str):
     """문서 종류에 맞는 핸들러 반환"""
-    if contract_type == "근로계약서":
-        return working_ai
-    elif contract_type == "통합신청서":
-        return foreign_ai
-    elif contract_type == "위임장":
-        return attorney_ai
-    elif contract_type == "임대차계약서":
-        return house_ai
-    else:
+    handler = CONTRACT_HANDLERS.get(contract_type)
+    if handler is None:
         raise ValueError(f"지원하지 않는 계약서 타입입니다: {contract_type}")
+    return handler
+
+
+def diff_content(old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    핸들러 실행 전후의 content를 비교해
+    (새로 생기거나 값이 바뀐 키, 삭제된 키) 를 반환합니다.
+    """
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    removed = [k for k in old if k not in new]
+    return changed, removed
 
 
 # ---------------------------------------------------------
@@ -70,6 +82,14 @@ async def process_chat_message(
             full_contract_data={}
         )
 
+    # 핸들러가 contract.content를 직접 수정하므로, 비교용으로 원본을 복사해 둡니다.
+    original_content = dict(contract.content or {})
+
+    # 계약서를 읽으며 시작된 읽기 트랜잭션을 닫아 커넥션을 풀에 돌려줍니다.
+    # (LLM 호출이 끝날 때까지 커넥션을 붙잡고 있으면 풀이 금방 고갈됩니다.
+    #  expire_on_commit=False 이므로 contract 객체는 그대로 사용할 수 있습니다.)
+    await db.commit()
+
     # ✅ 1) 핸들러가 메시지 전체 로직을 처리한다
     response: schemas.ChatResponse = await handler.process_message(
         db=db,
@@ -77,13 +97,15 @@ async def process_chat_message(
         message=user_message
     )
 
-    # ✅ 2) 핸들러가 반환한 최신 content로 DB 업데이트
+    # ✅ 2) 핸들러가 반환한 최신 content 중 바뀐 키만 DB에 반영
     if response.full_contract_data is not None:
+        content_patch, removed_keys = diff_content(original_content, response.full_contract_data)
         await crud.update_contract(
             db=db,
             contract_id=contract.id,
-            new_content=response.full_contract_data,
-            new_chat_history=response.chat_history
+            content_patch=content_patch,
+            removed_keys=removed_keys,
+            new_messages=response.chat_history or []
         )
 
     return response
@@ -0,0 +1,126 @@
+# app/turn_queue.py
+# 계약서별 채팅 턴 직렬화 + 동일 메시지 합치기 (프로세스 내부)
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from . import metrics
+
+# 계약서 하나에 동시에 대기할 수 있는 최대 턴 수 (실행 중인 턴 포함)
+CHAT_TURN_MAX_DEPTH = int(os.getenv("CHAT_TURN_MAX_DEPTH", "5"))
+# 같은 메시지를 이 시간(초) 안에 다시 보낸 경우만 중복 전송으로 보고 합칩니다.
+# 그보다 늦게 온 같은 메시지("네" → "네")는 다음 질문에 대한 새 답변일 수 있으므로 새 턴으로 처리합니다.
+CHAT_DEDUPE_WINDOW_SECONDS = float(os.getenv("CHAT_DEDUPE_WINDOW_SECONDS", "2"))
+
+
+class TurnQueueFull(Exception):
+    """해당 계약서에 이미 처리 대기 중인 턴이 너무 많을 때"""
+
+
+class TurnAbandoned(Exception):
+    """합쳐서 기다리던 원래 요청이 중간에 취소되었을 때"""
+
+
+class _Slot:
+    __slots__ = ("lock", "depth", "inflight")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+        # dedupe_key -> (결과를 공유할 Future, 제출 시각)
+        self.inflight: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+
+
+class TurnQueue:
+    """
+    key(계약서 id)마다 한 번에 하나의 작업만 실행합니다.
+    - 같은 key의 작업은 도착 순서대로 하나씩 실행되므로, 각 턴은 직전 턴이 저장한 content를 읽습니다.
+    - 같은 key + dedupe_key의 작업이 아직 대기/실행 중이면 새로 실행하지 않고 그 결과를 함께 받습니다.
+      (더블 클릭, 여러 탭에서의 중복 전송 → LLM 호출 1번, DB 쓰기 1번)
+      dedupe_window(초)를 주면 그 시간 안에 제출된 작업과만 합칩니다. (None이면 시간 제한 없음)
+    이벤트 루프 안에서만 사용하므로 별도의 스레드 락은 두지 않습니다.
+    """
+
+    def __init__(self, max_depth: int, name: str = "turn_queue", dedupe_window: Optional[float] = None):
+        self.name = name
+        self.max_depth = max_depth
+        self.dedupe_window = dedupe_window
+        self._slots: Dict[Hashable, _Slot] = {}
+        self.processed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.max_depth_seen = 0
+        self.wait_seconds = metrics.Histogram()
+
+    def depth(self, key: Hashable) -> int:
+        slot = self._slots.get(key)
+        return slot.depth if slot else 0
+
+    async def submit(
+        self,
+        key: Hashable,
+        work: Callable[[], Awaitable[Any]],
+        dedupe_key: Optional[Hashable] = None,
+    ) -> Any:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+
+        queued_at = time.perf_counter()
+        existing = slot.inflight.get(dedupe_key) if dedupe_key is not None else None
+        if existing is not None and (self.dedupe_window is None or queued_at - existing[1] <= self.dedupe_window):
+            self.coalesced += 1
+            # shield: 이 요청이 취소되어도 공유 Future는 취소되지 않도록 합니다.
+            return await asyncio.shield(existing[0])
+
+        if slot.depth >= self.max_depth:
+            self.rejected += 1
+            raise TurnQueueFull(f"{self.name}: {key}에 대기 중인 요청이 너무 많습니다.")
+
+        future = asyncio.get_running_loop().create_future()
+        if dedupe_key is not None:
+            slot.inflight[dedupe_key] = (future, queued_at)
+        slot.depth += 1
+        self.max_depth_seen = max(self.max_depth_seen, slot.depth)
+
+        try:
+            async with slot.lock:
+                self.wait_seconds.observe(time.perf_counter() - queued_at)
+                result = await work()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(TurnAbandoned(f"{self.name}: {key}의 원래 요청이 취소되었습니다."))
+            future.exception()  # 기다리는 요청이 없어도 경고가 남지 않도록 회수 처리
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self.processed += 1
+            slot.depth -= 1
+            if dedupe_key is not None and slot.inflight.get(dedupe_key, (None,))[0] is future:
+                del slot.inflight[dedupe_key]
+            if slot.depth == 0 and self._slots.get(key) is slot:
+                del self._slots[key]
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "active_keys": len(self._slots),
+            "queued": sum(slot.depth for slot in self._slots.values()),
+            "max_depth": self.max_depth,
+            "max_depth_seen": self.max_depth_seen,
+            "dedupe_window_seconds": self.dedupe_window,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+
+
+# 채팅 턴 큐 (key = contract_id)
+chat_turns = TurnQueue(max_depth=CHAT_TURN_MAX_DEPTH, dedupe_window=CHAT_DEDUPE_WINDOW_SECONDS, name="chat_turns")
+metrics.register("chat_turn_queue", chat_turns.stats)
@@ -0,0 +1,81 @@
+# app/warmup.py
+# 서버 시작 시 예열: 지식 베이스 인덱스, LLM HTTP 커넥션, DB 커넥션 풀을 동시에 준비합니다.
+# /ready는 예열이 끝난 뒤에만 200을 반환하므로, 롤링 배포 시 새 인스턴스가 데워진 뒤에 트래픽을 받습니다.
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app import llm_client, metrics
+from app.ai_handlers.model_router import EXTRACTION_LARGE_MODEL, EXTRACTION_SMALL_MODEL
+from app.database import DB_POOL_SIZE, DB_POOL_WARMUP, warm_up_pool
+from app.knowledge import RAG_MODEL, knowledge_base
+
+# 예열 전체 제한 시간. 넘으면 남은 작업을 취소하고 준비 완료로 전환합니다. (각 구성요소는 첫 사용 시 다시 준비)
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "60"))
+# 요청 경로에서 실제로 부르는 모델 (추출: 작은 모델 → 큰 모델, 법률 질문: RAG_MODEL)
+LLM_WARMUP_MODELS = (EXTRACTION_SMALL_MODEL, EXTRACTION_LARGE_MODEL, RAG_MODEL)
+
+
+class WarmUpState:
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.components: Dict[str, dict] = {}
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready and not self.draining,
+            "draining": self.draining,
+            "seconds": self.seconds,
+            "components": {name: dict(info) for name, info in self.components.items()},
+        }
+
+
+warmup_state = WarmUpState()
+metrics.register("warm_up", warmup_state.snapshot)
+
+
+def _opened_any(expected: int) -> Callable[[int], bool]:
+    return lambda opened: opened > 0 or expected <= 0
+
+
+async def _timed(name: str, work: Awaitable, succeeded: Callable[[Any], bool] = bool):
+    started = time.perf_counter()
+    info = warmup_state.components[name] = {"ok": None, "seconds": None, "result": None}
+    try:
+        result = await work
+        info["ok"] = succeeded(result)
+        info["result"] = result
+    except asyncio.CancelledError:
+        info["ok"] = False
+        info["result"] = "timeout"
+        raise
+    except Exception as e:
+        info["ok"] = False
+        info["result"] = str(e)
+    finally:
+        info["seconds"] = round(time.perf_counter() - started, 3)
+
+
+async def run_warm_up(timeout: float = WARMUP_TIMEOUT_SECONDS) -> dict:
+    """세 가지 예열을 asyncio.gather로 동시에 실행하고, 끝나면(또는 제한 시간이 지나면) 준비 완료로 표시합니다."""
+    warmup_state.started_at = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                # 성공 여부(bool)를 반환
+                _timed("knowledge_base", knowledge_base.warm_up()),
+                # 준비된 커넥션 수를 반환
+                _timed("llm_connections", llm_client.warm_up(LLM_WARMUP_MODELS), _opened_any(llm_client.LLM_WARMUP_CONNECTIONS)),
+                _timed("db_pool", warm_up_pool(), _opened_any(min(DB_POOL_WARMUP, DB_POOL_SIZE))),
+            ),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        print(f"⚠️ 예열이 {timeout:.0f}초 안에 끝나지 않아 남은 작업은 첫 요청 때 처리합니다.")
+    warmup_state.seconds = round(time.perf_counter() - warmup_state.started_at, 3)
+    warmup_state.ready = True
+    return warmup_state.snapshot()
@@ -0,0 +1,4 @@
+-- contracts.content 를 json -> jsonb 로 변경
+-- 변경된 키만 서버에서 병합(content || patch)하기 위해 필요합니다.
+ALTER TABLE contracts
+    ALTER COLUMN content TYPE jsonb USING content::jsonb;
@@ -0,0 +1,21 @@
+-- contracts.chat_history(JSON 배열)를 append-only chat_messages 테이블로 이전
+CREATE TABLE IF NOT EXISTS chat_messages (
+    seq         BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    contract_id UUID NOT NULL REFERENCES contracts(id) ON DELETE CASCADE,
+    sender      VARCHAR NOT NULL,
+    message     TEXT NOT NULL,
+    created_at  TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_messages_contract_seq
+    ON chat_messages (contract_id, seq);
+
+-- 기존 기록 이전 (배열 순서를 그대로 seq 순서로 보존)
+INSERT INTO chat_messages (contract_id, sender, message, created_at)
+SELECT c.id, m.elem ->> 'sender', COALESCE(m.elem ->> 'message', ''), c.updated_at
+FROM contracts c
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(c.chat_history::jsonb, '[]'::jsonb))
+    WITH ORDINALITY AS m(elem, ord)
+ORDER BY c.id, m.ord;
+
+ALTER TABLE contracts DROP COLUMN chat_history;
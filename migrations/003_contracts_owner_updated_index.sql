@@ -0,0 +1,4 @@
+-- 내 계약서 목록 (owner_id 필터 + (updated_at, id) 역순 키셋 페이지네이션)용 복합 인덱스
+-- CONCURRENTLY 는 트랜잭션 밖에서 실행해야 합니다.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contracts_owner_updated
+    ON contracts (owner_id, updated_at DESC, id DESC);
@@ -0,0 +1,15 @@
+-- Idempotency-Key 응답 저장소 (IDEMPOTENCY_BACKEND=db)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key         VARCHAR PRIMARY KEY,
+    fingerprint VARCHAR NOT NULL,
+    response    JSONB NOT NULL,
+    created_at  TIMESTAMPTZ DEFAULT now(),
+    expires_at  TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at
+    ON idempotency_keys (expires_at);
+
+-- 만료된 행은 조회 시 무시되고 같은 키로 다시 저장할 때 덮어씁니다.
+-- 주기적인 정리가 필요하면 아래 문장을 스케줄러(pg_cron 등)로 실행하세요.
+-- DELETE FROM idempotency_keys WHERE expires_at <= now();
@@ -0,0 +1,5 @@
+# tests/conftest.py
+import os
+
+# app.llm_client가 import 시점에 OpenAI 클라이언트를 만들므로 키 값만 채워 둡니다. (테스트에서 API는 호출하지 않습니다)
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,37 @@
+# tests/test_extraction_cache.py
+# 추출 캐시 키의 날짜 구간 (app/ai_handlers/extraction_cache.py)
+import datetime
+
+import pytest
+
+from app.ai_handlers.extraction_cache import cache_key, date_bucket, normalize_message
+
+TODAY = datetime.date(2025, 3, 10)
+
+
+@pytest.mark.parametrize("message, expected", [
+    # 상대 날짜는 그날 하루만 재사용
+    ("오늘", "2025-03-10"),
+    ("내일부터요", "2025-03-10"),
+    ("다음 달 1일", "2025-03-10"),
+    # 연도 없는 월/일은 LLM이 올해로 채우므로 연도 단위로 재사용
+    ("12월 25일", "2025"),
+    ("3월", "2025"),
+    ("12/25", "2025"),
+    # 연도가 있거나 날짜가 아닌 답변은 날짜와 무관
+    ("2025년 12월 25일", ""),
+    ("25년 12월 25일", ""),
+    ("2025.12.25", ""),
+    ("매월 25일", ""),
+    ("3개월", ""),
+    ("계좌이체", ""),
+])
+def test_date_bucket(message, expected):
+    assert date_bucket(normalize_message(message), TODAY) == expected
+
+
+def test_year_less_date_key_changes_with_year():
+    new_year = datetime.date(2026, 1, 2)
+    assert cache_key("근로계약서", "start_date", "12월 25일", TODAY) != cache_key("근로계약서", "start_date", "12월 25일", new_year)
+    assert cache_key("근로계약서", "start_date", "12월 25일", TODAY) == cache_key("근로계약서", "start_date", "12월 25일", TODAY.replace(month=11))
+    assert cache_key("근로계약서", "payment_method", "계좌이체", TODAY) == cache_key("근로계약서", "payment_method", "계좌이체", new_year)
@@ -0,0 +1,150 @@
+# tests/test_fast_extract.py
+# 규칙 기반 추출기(app/ai_handlers/fast_extract.py)의 값 파서와 규칙
+import datetime
+
+import pytest
+
+from app.ai_handlers import fast_extract as fx
+
+TODAY = datetime.date(2025, 3, 10)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("010-1234-5678", "010-1234-5678"),
+    ("01012345678", "010-1234-5678"),
+    ("010 1234 5678 입니다", "010-1234-5678"),
+    ("전화번호는 010.1234.5678이에요", "010-1234-5678"),
+    ("02-123-4567", "02-123-4567"),
+    ("0212345678", "02-1234-5678"),
+    ("031-123-4567", "031-123-4567"),
+    ("15881234", "1588-1234"),
+    ("1234-5678", None),
+    ("010-1234", None),
+    ("연락처 없어요", None),
+])
+def test_parse_phone(message, expected):
+    assert fx.parse_phone(message) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("09:00", "09:00"),
+    ("9:30", "09:30"),
+    ("18시", "18:00"),
+    ("24시", "00:00"),
+    ("오후 6시", "18:00"),
+    ("오전 9시 반", "09:30"),
+    ("밤 10시 30분", "22:30"),
+    ("저녁 7시요", "19:00"),
+    ("오후 18시", "18:00"),
+    ("정오", "12:00"),
+    ("낮 12시", "12:00"),
+    ("오후 12시", "12:00"),
+    ("오전 12시", "00:00"),
+    ("밤 12시", "00:00"),
+    ("저녁 12시", "00:00"),
+    # 오전/오후가 없는 1~12시는 모호하므로 LLM에 맡깁니다.
+    ("2시", None),
+    ("10시", None),
+    ("오전 18시", None),
+    ("25시", None),
+    ("9시 61분", None),
+])
+def test_parse_time(message, expected):
+    assert fx.parse_time(message) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("2025년 5월 8일", datetime.date(2025, 5, 8)),
+    ("25년 5월 8일", datetime.date(2025, 5, 8)),
+    ("2025-05-08", datetime.date(2025, 5, 8)),
+    ("2025.5.8.", datetime.date(2025, 5, 8)),
+    ("20250508", datetime.date(2025, 5, 8)),
+    ("오늘", TODAY),
+    ("내일이요", datetime.date(2025, 3, 11)),
+    ("어제", datetime.date(2025, 3, 9)),
+    # 연도가 없는 날짜는 LLM이 되묻습니다.
+    ("5월 8일", None),
+    ("2025년 2월 30일", None),
+])
+def test_parse_date(message, expected):
+    assert fx.parse_date(message, TODAY) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("2500000", 2500000),
+    ("2,500,000원", 2500000),
+    ("250만원", 2500000),
+    ("250만 원이요", 2500000),
+    ("1억 2000만 원", 120000000),
+    ("3천만원", 30000000),
+    ("2천5백", 2500),
+    # "1억 2천"은 구어로 "1억 2천만"일 수 있어 모호합니다.
+    ("1억 2천", None),
+    ("0원", None),
+    ("월급", None),
+])
+def test_parse_amount(message, expected):
+    assert fx.parse_amount(message) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("네", True),
+    ("네 가입해요", True),
+    ("있어요", True),
+    ("아니요", False),
+    ("없습니다", False),
+    ("안 해요", False),
+    ("네 아니요", None),
+    ("글쎄요", None),
+    ("", None),
+])
+def test_parse_yes_no(message, expected):
+    assert fx.parse_yes_no(message) == expected
+
+
+def test_choice_requires_exactly_one_match():
+    rule = fx.choice({
+        "계좌|이체|통장": {"payment_method": "계좌이체"},
+        "현금": {"payment_method": "현금"},
+    })
+    assert rule("payment_method", "계좌이체로 주세요", TODAY) == {"payment_method": "계좌이체"}
+    assert rule("payment_method", "현금", TODAY) == {"payment_method": "현금"}
+    assert rule("payment_method", "현금이나 계좌이체", TODAY) is None
+    assert rule("payment_method", "카드", TODAY) is None
+
+
+def test_choice_returns_a_copy():
+    fields = {"gender": "남"}
+    rule = fx.choice({"남": fields})
+    rule("gender", "남", TODAY)["gender"] = "여"
+    assert fields == {"gender": "남"}
+
+
+def test_extract_success_format():
+    rules = {"work_start_time": fx.time_hhmm}
+    assert fx.extract(rules, "work_start_time", "오전 9시요", TODAY) == {
+        "status": "success",
+        "filled_fields": {"work_start_time": "09:00"},
+        "skip_next_n_questions": 0,
+        "follow_up_question": None,
+    }
+
+
+def test_extract_falls_back_to_llm():
+    rules = {"wage": fx.amount}
+    # 규칙이 없는 필드, 파싱 실패, 질문 표현은 모두 None (LLM이 처리)
+    assert fx.extract(rules, "other_field", "250만원", TODAY) is None
+    assert fx.extract(rules, "wage", "잘 모르겠어요", TODAY) is None
+    assert fx.extract(rules, "wage", "250만원이면 최저임금 넘나요?", TODAY) is None
+    assert fx.extract(rules, "wage", "250만원", TODAY) == {
+        "status": "success",
+        "filled_fields": {"wage": "2,500,000"},
+        "skip_next_n_questions": 0,
+        "follow_up_question": None,
+    }
+
+
+def test_date_split_rule():
+    rule = fx.date_split("birth")
+    assert rule("birth_date", "1999년 1월 2일", TODAY) == {"birth_yyyy": "1999", "birth_mm": "01", "birth_dd": "02"}
+    assert rule("birth_date", "1월 2일", TODAY) is None
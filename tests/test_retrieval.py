@@ -0,0 +1,45 @@
+# tests/test_retrieval.py
+# top-k 검색 (app/knowledge/retrieval.py)
+import numpy as np
+import pytest
+
+from app.knowledge.retrieval import normalize, normalize_rows, top_k_batch, top_k_indices
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    return normalize_rows(rng.normal(size=(200, 16)))
+
+
+def test_top_k_indices_sorted_descending():
+    scores = np.array([0.1, 0.9, 0.3, 0.7, 0.5], dtype=np.float32)
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 4]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 4, 2, 0]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_top_k_batch_matches_single_queries(matrix):
+    rng = np.random.default_rng(1)
+    queries = rng.normal(size=(7, 16))
+    idx, scores = top_k_batch(matrix, queries, k=5)
+    assert idx.shape == scores.shape == (7, 5)
+    for row, query in enumerate(queries):
+        expected = top_k_indices(matrix @ normalize(query), 5)
+        assert idx[row].tolist() == expected.tolist()
+        np.testing.assert_allclose(scores[row], matrix[expected] @ normalize(query), rtol=1e-5)
+        assert np.all(np.diff(scores[row]) <= 0)
+
+
+def test_top_k_batch_k_larger_than_rows(matrix):
+    small = matrix[:4]
+    idx, scores = top_k_batch(small, matrix[:2], k=10)
+    assert idx.shape == (2, 4)
+    assert sorted(idx[0].tolist()) == [0, 1, 2, 3]
+    assert idx[1, 0] == 1  # 자기 자신이 가장 가깝습니다.
+    np.testing.assert_allclose(scores[1, 0], 1.0, rtol=1e-5)
+
+
+def test_top_k_batch_zero_k(matrix):
+    idx, scores = top_k_batch(matrix, matrix[:3], k=0)
+    assert idx.shape == scores.shape == (3, 0)